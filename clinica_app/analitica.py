@@ -0,0 +1,332 @@
+# clinica_app/analitica.py
+
+"""
+=== ANALÍTICA DE MÉDICOS CON NUMPY (UTILIZACIÓN, CANCELACIONES, HORAS PICO) ===
+
+PROPÓSITO PRINCIPAL:
+- Utilización: minutos agendados vs. minutos disponibles según
+  horario_inicio/horario_fin y dias_laborales, por médico × día de semana × hora
+- Tasas de cancelación y de inasistencia por médico
+- Histogramas de horas pico (hora de inicio y día de semana × hora)
+- Resultado como dict listo para JSON y exportable a CSV
+
+CÓMO SE CALCULA:
+- UNA consulta en streaming (exportacion.cursor_streaming) que trae solo
+  enteros: medico_id, día relativo, minuto de inicio, duración y código de estado
+- Las columnas se guardan en arreglos de NumPy y todos los agrupamientos son
+  np.bincount sobre un índice plano (médico, día de semana, hora): sin
+  bucles de Python por cita. 5 millones de citas se procesan en segundos
+  (ver comando bench_analitica)
+
+INASISTENCIA: El esquema no tiene un estado NO_ASISTIO; se cuenta como
+inasistencia una cita PASADA que sigue PENDIENTE o CONFIRMADA (nadie la marcó
+COMPLETADA ni CANCELADA). La tasa se calcula sobre las citas pasadas NO
+canceladas: inasistencias / (completadas + inasistencias).
+
+DEPENDENCIA OPCIONAL: numpy (pip install numpy). Sin numpy, api_analitica
+responde 503 y el resto del sistema funciona igual.
+"""
+
+import csv
+import io
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # Dependencia opcional
+    np = None
+
+from .disponibilidad import DIAS_SEMANA, cargar_horarios
+from .exportacion import cursor_streaming
+from .models import CustomUser
+
+# Código numérico de cada estado (FIELD() en la consulta); 0 = desconocido
+ESTADOS = ('PENDIENTE', 'CONFIRMADA', 'CANCELADA', 'COMPLETADA')
+PENDIENTE, CONFIRMADA, CANCELADA, COMPLETADA = 1, 2, 3, 4
+
+CONSULTA = """
+    SELECT medico_id, DATEDIFF(fecha, %s), TIME_TO_SEC(hora) DIV 60, COALESCE(duracion, 30),
+           FIELD(estado, 'PENDIENTE', 'CONFIRMADA', 'CANCELADA', 'COMPLETADA')
+    FROM citas
+    WHERE fecha BETWEEN %s AND %s
+"""
+
+
+def numpy_disponible():
+    return np is not None
+
+
+class DatosCitas:
+    """
+    CLASE: Columnas de citas como arreglos de NumPy (una posición por cita)
+
+    - dia: días desde 'inicio' (0 = inicio)
+    - minuto: minuto del día en que empieza la cita
+    """
+
+    __slots__ = ('inicio', 'dias', 'medico', 'dia', 'minuto', 'duracion', 'estado')
+
+    def __init__(self, inicio, dias, medico, dia, minuto, duracion, estado):
+        self.inicio = inicio
+        self.dias = dias
+        self.medico = medico
+        self.dia = dia
+        self.minuto = minuto
+        self.duracion = duracion
+        self.estado = estado
+
+    def __len__(self):
+        return len(self.medico)
+
+
+def cargar_citas(desde, hasta, medico_ids=None, lote=100000):
+    """
+    FUNCIÓN: Trae las citas del rango en UNA consulta en streaming
+
+    RETORNA: DatosCitas (cada lote de fetchmany se convierte a arreglo y al
+    final se concatenan: nunca hay millones de tuplas de Python a la vez)
+    """
+    if np is None:
+        raise RuntimeError('La analítica requiere numpy (pip install numpy)')
+
+    sql, params = CONSULTA, [desde, desde, hasta]
+    if medico_ids:
+        sql += f" AND medico_id IN ({', '.join(['%s'] * len(medico_ids))})"
+        params += list(medico_ids)
+
+    bloques = []
+    with cursor_streaming() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            filas = cursor.fetchmany(lote)
+            if not filas:
+                break
+            bloques.append(np.array(filas, dtype=np.int32).reshape(-1, 5))
+
+    tabla = np.concatenate(bloques) if bloques else np.empty((0, 5), dtype=np.int32)
+    return DatosCitas(
+        desde, (hasta - desde).days + 1,
+        medico=tabla[:, 0].copy(), dia=tabla[:, 1].copy(),
+        minuto=tabla[:, 2].astype(np.int16), duracion=tabla[:, 3].astype(np.int16),
+        estado=tabla[:, 4].astype(np.int8),
+    )
+
+
+def ocurrencias_dias_semana(inicio, dias):
+    """Cuántos lunes, martes, ... hay en [inicio, inicio + dias): arreglo de 7."""
+    semanas, resto = divmod(dias, 7)
+    conteo = np.full(7, semanas, dtype=np.int64)
+    conteo[(inicio.weekday() + np.arange(resto)) % 7] += 1
+    return conteo
+
+
+def minutos_disponibles(horarios, inicio, dias):
+    """
+    FUNCIÓN: Minutos de atención por médico × día de semana × hora en el rango
+
+    PARÁMETROS:
+    - horarios: Lista de HorarioMedico (mismo orden que los médicos analizados)
+
+    RETORNA: Arreglo (médicos, 7, 24)
+    """
+    apertura = np.array([h.inicio for h in horarios], dtype=np.int64)[:, None]
+    cierre = np.array([h.fin for h in horarios], dtype=np.int64)[:, None]
+    horas = np.arange(24) * 60
+    # Minutos de cada hora dentro del horario: (médicos, 24)
+    por_hora = np.clip(np.minimum(cierre, horas + 60) - np.maximum(apertura, horas), 0, 60)
+    # reshape: sin médicos (rango o filtro sin citas) el arreglo sería (0,) y no (0, 7)
+    trabaja = np.array(
+        [[d in h.dias for d in range(7)] for h in horarios], dtype=np.int64
+    ).reshape(-1, 7)
+    return trabaja[:, :, None] * ocurrencias_dias_semana(inicio, dias)[None, :, None] * por_hora[:, None, :]
+
+
+def calcular(datos, horarios, hoy):
+    """
+    FUNCIÓN: Todas las métricas con agrupamientos vectorizados
+
+    PARÁMETROS:
+    - datos: DatosCitas
+    - horarios: {medico_id: HorarioMedico}
+    - hoy: date; las citas anteriores sin cerrar cuentan como inasistencia
+
+    RETORNA: dict con 'medico_ids' y arreglos de NumPy (ver resumen() para JSON)
+    """
+    medico_ids, idx = np.unique(datos.medico, return_inverse=True)
+    n_medicos = len(medico_ids)
+    dia_semana = (datos.inicio.weekday() + datos.dia.astype(np.int64)) % 7
+
+    estado = datos.estado
+    activa = estado != CANCELADA
+    pasada = datos.dia < (hoy - datos.inicio).days
+    abierta = (estado == PENDIENTE) | (estado == CONFIRMADA)
+
+    def por_medico(pesos):
+        return np.bincount(idx, weights=pesos, minlength=n_medicos)
+
+    # 1. MINUTOS AGENDADOS por médico × día × hora. Una cita que cruza horas
+    #    reparte sus minutos: se itera sobre las horas que abarca (pocas), no sobre citas
+    inicio_min = datos.minuto.astype(np.int64)
+    fin_min = inicio_min + datos.duracion.astype(np.int64)
+    base = (idx.astype(np.int64) * 7 + dia_semana) * 24
+    agendados = np.zeros(n_medicos * 7 * 24, dtype=np.float64)
+    max_horas = int(((fin_min - 1) // 60 - inicio_min // 60).max(initial=0)) + 1
+    for k in range(max_horas):
+        hora = inicio_min // 60 + k
+        dentro = np.clip(np.minimum(fin_min, (hora + 1) * 60) - np.maximum(inicio_min, hora * 60), 0, 60)
+        valido = activa & (hora < 24) & (dentro > 0)
+        agendados += np.bincount(
+            (base + hora)[valido], weights=dentro[valido], minlength=n_medicos * 7 * 24
+        )
+    agendados = agendados.reshape(n_medicos, 7, 24)
+
+    disponibles = minutos_disponibles(
+        [horarios[int(m)] for m in medico_ids], datos.inicio, datos.dias
+    ).astype(np.float64)
+
+    # 2. CONTEOS POR MÉDICO (una pasada de bincount por métrica)
+    conteos = {
+        'citas': por_medico(None),
+        'canceladas': por_medico((estado == CANCELADA).astype(np.float64)),
+        'completadas': por_medico((estado == COMPLETADA).astype(np.float64)),
+        'inasistencias': por_medico((pasada & abierta).astype(np.float64)),
+        # Denominador de la inasistencia: citas pasadas a las que se esperaba al
+        # paciente (las canceladas no cuentan)
+        'pasadas': por_medico((pasada & activa).astype(np.float64)),
+    }
+
+    # 3. HORAS PICO (citas no canceladas, por hora de inicio)
+    hora_inicio = np.minimum(inicio_min // 60, 23)
+    pico = np.bincount(
+        (dia_semana * 24 + hora_inicio)[activa], minlength=7 * 24
+    ).reshape(7, 24)
+
+    return {
+        'medico_ids': medico_ids,
+        'agendados': agendados,
+        'disponibles': disponibles,
+        'conteos': conteos,
+        'pico': pico,
+    }
+
+
+def _tasa(parte, total):
+    return round(float(parte) / float(total), 4) if total else None
+
+
+def _mapa(agendados, disponibles):
+    """Utilización 7×24 (None donde el médico no atiende)."""
+    con_horario = disponibles > 0
+    razon = np.divide(agendados, disponibles, out=np.zeros_like(agendados), where=con_horario)
+    return [
+        [round(float(razon[d, h]), 3) if con_horario[d, h] else None for h in range(24)]
+        for d in range(7)
+    ]
+
+
+def resumen(calculo, nombres):
+    """
+    FUNCIÓN: Convierte el resultado de calcular() a tipos de Python (JSON)
+
+    PARÁMETROS:
+    - nombres: {medico_id: nombre completo}
+    """
+    conteos = calculo['conteos']
+    agendados, disponibles = calculo['agendados'], calculo['disponibles']
+    medicos = []
+    for i, medico_id in enumerate(calculo['medico_ids']):
+        medicos.append({
+            'medico_id': int(medico_id),
+            'nombre': nombres.get(int(medico_id), ''),
+            'citas': int(conteos['citas'][i]),
+            'canceladas': int(conteos['canceladas'][i]),
+            'completadas': int(conteos['completadas'][i]),
+            'inasistencias': int(conteos['inasistencias'][i]),
+            'tasa_cancelacion': _tasa(conteos['canceladas'][i], conteos['citas'][i]),
+            'tasa_inasistencia': _tasa(conteos['inasistencias'][i], conteos['pasadas'][i]),
+            'minutos_agendados': int(agendados[i].sum()),
+            'minutos_disponibles': int(disponibles[i].sum()),
+            'utilizacion': _tasa(agendados[i].sum(), disponibles[i].sum()),
+            'mapa_utilizacion': _mapa(agendados[i], disponibles[i]),
+        })
+
+    total = {clave: valores.sum() for clave, valores in conteos.items()}
+    return {
+        'dias_semana': DIAS_SEMANA,
+        'global': {
+            'citas': int(total['citas']),
+            'tasa_cancelacion': _tasa(total['canceladas'], total['citas']),
+            'tasa_inasistencia': _tasa(total['inasistencias'], total['pasadas']),
+            'utilizacion': _tasa(agendados.sum(), disponibles.sum()),
+            'mapa_utilizacion': _mapa(agendados.sum(axis=0), disponibles.sum(axis=0)),
+        },
+        'horas_pico': {
+            'por_hora': [int(v) for v in calculo['pico'].sum(axis=0)],
+            'por_dia_hora': [[int(v) for v in fila] for fila in calculo['pico']],
+        },
+        'medicos': medicos,
+    }
+
+
+def analizar(desde, hasta, medico_ids=None, hoy=None):
+    """
+    FUNCIÓN: Carga, calcula y resume (lo que usa api_analitica)
+
+    RETORNA: dict listo para JsonResponse
+    """
+    datos = cargar_citas(desde, hasta, medico_ids)
+    ids = [int(m) for m in np.unique(datos.medico)]
+    calculo = calcular(datos, cargar_horarios(ids), hoy or date.today())
+    nombres = {
+        user_id: f"{nombre or ''} {apellido or ''}".strip()
+        for user_id, nombre, apellido in CustomUser.objects.filter(id__in=ids).values_list(
+            'id', 'first_name', 'last_name'
+        )
+    }
+    resultado = resumen(calculo, nombres)
+    resultado['rango'] = {'desde': desde.isoformat(), 'hasta': hasta.isoformat()}
+    return resultado
+
+
+def leer_rango(params, dias_defecto=90):
+    """desde/hasta del querystring (por defecto los últimos 'dias_defecto' días)."""
+    hasta = date.today()
+    desde = hasta - timedelta(days=dias_defecto)
+    try:
+        desde = date.fromisoformat(params.get('desde', '')) if params.get('desde') else desde
+        hasta = date.fromisoformat(params.get('hasta', '')) if params.get('hasta') else hasta
+    except ValueError:
+        raise ValueError('Fechas inválidas (use YYYY-MM-DD)')
+    if desde > hasta:
+        raise ValueError('desde debe ser anterior a hasta')
+    return desde, hasta
+
+
+# ========== EXPORTACIÓN CSV ==========
+
+def csv_medicos(resultado):
+    """Una línea por médico con sus tasas y utilización total."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    columnas = (
+        'medico_id', 'nombre', 'citas', 'canceladas', 'completadas', 'inasistencias',
+        'tasa_cancelacion', 'tasa_inasistencia', 'minutos_agendados',
+        'minutos_disponibles', 'utilizacion',
+    )
+    escritor.writerow(columnas)
+    for medico in resultado['medicos']:
+        escritor.writerow([medico[c] if medico[c] is not None else '' for c in columnas])
+    return salida.getvalue()
+
+
+def csv_mapa(resultado):
+    """Formato largo del mapa de calor: médico, día de semana, hora, utilización."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(('medico_id', 'nombre', 'dia_semana', 'hora', 'utilizacion'))
+    for medico in resultado['medicos']:
+        for d, fila in enumerate(medico['mapa_utilizacion']):
+            for hora, valor in enumerate(fila):
+                if valor is not None:
+                    escritor.writerow((medico['medico_id'], medico['nombre'], DIAS_SEMANA[d], hora, valor))
+    return salida.getvalue()
@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class ClinicaAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinica_app'
+
+    def ready(self):
+        # last_login lo escribe SPAuthBackend._registrar_login() (una sola
+        # sentencia o el buffer); sin esto auth.login() haría además un
+        # user.save(update_fields=['last_login']) por cada login
+        from django.contrib.auth.signals import user_logged_in
+        user_logged_in.disconnect(dispatch_uid='update_last_login')
+
+        # Logins exitosos/fallidos para /metrics (metricas.py)
+        from .metricas import conectar_senales
+        conectar_senales()
+
+        # Conexiones nuevas/reutilizadas/recuperadas (conexiones.py)
+        from . import conexiones
+        conexiones.conectar_senales()
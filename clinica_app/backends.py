@@ -16,10 +16,189 @@ PROBLEMA QUE RESUELVE:
 - Necesitamos mantener compatibilidad mientras migramos a seguridad
 """
 
+import atexit
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth.backends import BaseBackend
 from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.hashers import check_password, make_password, identify_hasher
+from .metricas import contar
 from .models import CustomUser
+from .replicas import marcar_escritura, usar_primario
+
+
+METRICA = 'clinica_usuarios_cache_total'
+
+
+class _CacheUsuarios:
+    """
+    CLASE: Caché LRU con expiración (TTL) de objetos CustomUser por proceso
+
+    PROPÓSITO:
+    - Django llama get_user() en CADA request autenticado
+    - Sin caché, cada página cuesta un SELECT extra a auth_user_custom
+    - Guardar el usuario unos segundos evita repetir esa consulta
+
+    UNA SOLA CAPA según la configuración:
+    - Con USUARIOS_CACHE_ALIAS (Redis/Memcached): SOLO la caché compartida.
+      No hay copia local, así una invalidación llega a todos los procesos
+    - Sin alias: diccionario local del proceso (OrderedDict = orden LRU). Otro
+      worker no se entera de invalidar(): un usuario desactivado o con otro rol
+      puede seguir vigente en los demás procesos hasta USUARIOS_CACHE_TTL_LOCAL
+      segundos (por eso ese TTL es corto)
+
+    CONFIGURACIÓN (settings.py):
+    - USUARIOS_CACHE_TTL: Segundos de vida de cada entrada (0 = desactivado)
+    - USUARIOS_CACHE_TTL_LOCAL: Tope del TTL cuando solo hay capa local
+    - USUARIOS_CACHE_MAX: Máximo de usuarios en memoria por proceso
+    - USUARIOS_CACHE_ALIAS: Alias de CACHES compartida entre workers (o None)
+    """
+
+    PREFIJO = 'clinica:usuario:'
+
+    def __init__(self):
+        self._datos = OrderedDict()  # user_id -> (expira, CustomUser)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'USUARIOS_CACHE_TTL', 60)
+
+    @property
+    def ttl_local(self):
+        return min(self.ttl, getattr(settings, 'USUARIOS_CACHE_TTL_LOCAL', 5))
+
+    def _compartida(self):
+        """Retorna la caché de Django configurada o None."""
+        alias = getattr(settings, 'USUARIOS_CACHE_ALIAS', None)
+        if not alias:
+            return None
+        from django.core.cache import caches
+        return caches[alias]
+
+    def obtener(self, user_id, cargar):
+        """
+        MÉTODO: Retorna el usuario desde caché o llamando a cargar(user_id)
+
+        RETORNA: Una copia del CustomUser (cada request recibe su propio objeto)
+        o None si el usuario no existe
+        """
+        if self.ttl <= 0:
+            return cargar(user_id)
+
+        compartida = self._compartida()
+        if compartida:
+            usuario = compartida.get(self.PREFIJO + str(user_id))
+            with self._lock:
+                if usuario is not None:
+                    self.aciertos += 1
+                else:
+                    self.fallos += 1
+            contar(METRICA, resultado='acierto' if usuario is not None else 'fallo')
+            if usuario is None:
+                # Se guarda para otros workers: nunca desde la réplica (ver replicas.py)
+                with usar_primario():
+                    usuario = cargar(user_id)
+                if usuario is None:
+                    return None  # No se cachean usuarios inexistentes
+                compartida.set(self.PREFIJO + str(user_id), usuario, self.ttl)
+            return copy.copy(usuario)
+
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(user_id)
+            if entrada and entrada[0] > ahora:
+                self._datos.move_to_end(user_id)
+                self.aciertos += 1
+                usuario = entrada[1]
+            else:
+                usuario = None
+                self.fallos += 1
+        if usuario is not None:
+            contar(METRICA, resultado='acierto')
+            return copy.copy(usuario)
+        contar(METRICA, resultado='fallo')
+
+        with usar_primario():
+            usuario = cargar(user_id)
+        if usuario is None:
+            return None
+        self._guardar_local(user_id, ahora, usuario)
+        return copy.copy(usuario)
+
+    def _guardar_local(self, user_id, ahora, usuario):
+        with self._lock:
+            self._datos[user_id] = (ahora + self.ttl_local, usuario)
+            self._datos.move_to_end(user_id)
+            while len(self._datos) > getattr(settings, 'USUARIOS_CACHE_MAX', 1000):
+                self._datos.popitem(last=False)  # Sacar el menos usado
+
+    def guardar(self, usuario):
+        """MÉTODO: Precarga un usuario recién leído (ej: tras el login)."""
+        if self.ttl <= 0:
+            return
+        compartida = self._compartida()
+        if compartida:
+            compartida.set(self.PREFIJO + str(usuario.id), usuario, self.ttl)
+        else:
+            self._guardar_local(usuario.id, time.monotonic(), copy.copy(usuario))
+
+    def invalidar(self, user_id):
+        """MÉTODO: Elimina al usuario de la caché (local y compartida) tras una escritura."""
+        user_id = int(user_id)
+        with self._lock:
+            self._datos.pop(user_id, None)
+            self.invalidaciones += 1
+        contar(METRICA, resultado='invalidacion')
+        compartida = self._compartida()
+        if compartida:
+            compartida.delete(self.PREFIJO + str(user_id))
+
+    def limpiar(self):
+        """MÉTODO: Vacía la capa local y reinicia contadores."""
+        with self._lock:
+            self._datos.clear()
+            self.aciertos = self.fallos = self.invalidaciones = 0
+
+    def estadisticas(self):
+        """
+        MÉTODO: Contadores de ESTE proceso (los imprime bench_endpoints)
+
+        Bajo carga con varios workers, la suma de todos los procesos está en
+        /metrics: clinica_usuarios_cache_total{resultado=acierto|fallo|invalidacion}
+        """
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': round(self.aciertos / total, 4) if total else 0.0,
+                'tamano': len(self._datos),
+            }
+
+
+# Instancia única por proceso
+cache_usuarios = _CacheUsuarios()
+
+
+def invalidar_usuario(user_id):
+    """
+    FUNCIÓN: Invalida el usuario cacheado tras modificarlo o eliminarlo
+
+    USO: editar_usuario_view, eliminar_usuario_view, migración de contraseña
+    """
+    cache_usuarios.invalidar(user_id)
+    marcar_escritura()  # Leer del primario hasta que la réplica tenga el cambio
 
 def _is_django_hash(s: str) -> bool:
     """
@@ -29,9 +208,11 @@ def _is_django_hash(s: str) -> bool:
     - s: String que podría ser un hash de Django
     
     LÓGICA DE DETECCIÓN:
-    - Hash Django format: "algoritmo$iteraciones$salt$hash"
-    - Ejemplo: "pbkdf2_sha256$600000$randomsalt$hashvalue"
-    - Debe empezar con "pbkdf2_sha256$" y tener exactamente 3 símbolos "$"
+    - Hash Django format: "algoritmo$...$salt$hash"
+    - Ejemplos: "pbkdf2_sha256$600000$randomsalt$hashvalue",
+      "scrypt$16384$salt$8$1$hash", "argon2$argon2id$v=19$..."
+    - El algoritmo debe estar en settings.PASSWORD_HASHERS
+    - El hasher debe poder decodificarlo (descarta "pbkdf2_sha256$260000$admin123")
     
     RETORNA: 
     - True: Si es hash Django válido
@@ -39,7 +220,13 @@ def _is_django_hash(s: str) -> bool:
     
     USO: Determinar cómo validar la contraseña
     """
-    return isinstance(s, str) and s.startswith("pbkdf2_sha256$") and s.count("$") == 3
+    if not isinstance(s, str) or "$" not in s:
+        return False
+    try:
+        identify_hasher(s).decode(s)
+    except (ValueError, TypeError, IndexError):
+        return False
+    return True
 
 class SPAuthBackend(BaseBackend):
     """
@@ -59,6 +246,7 @@ class SPAuthBackend(BaseBackend):
     - Si encuentra contraseña en texto plano y es correcta
     - La convierte automáticamente a hash Django seguro
     - Guarda el hash en la BD para próximos logins
+    - Si el hash usa otro algoritmo/costo que HASH_POLITICA, también lo regenera
     """
     
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -90,31 +278,34 @@ class SPAuthBackend(BaseBackend):
             return None
         
         # CONSULTA A BASE DE DATOS: Buscar usuario por username O email
-        with connection.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, password FROM auth_user_custom
-                WHERE (username=%s OR email=%s) AND is_active=1
-                LIMIT 1
-                """,
-                [username, username],  # username puede ser email también
-            )
-            row = cur.fetchone()
+        # Se trae la fila COMPLETA: ya no hace falta un segundo SELECT al final
+        user = CustomUser.objects.filter(
+            Q(username=username) | Q(email=username),  # username puede ser email también
+            is_active=True,
+        ).first()
         
         # USUARIO NO ENCONTRADO: No existe o está inactivo
-        if not row:
+        if user is None:
             return None
         
-        # EXTRAER DATOS: ID del usuario y contraseña almacenada
-        user_id, stored = row[0], row[1] or ""
+        # CONTRASEÑA ALMACENADA
+        stored = user.password or ""
         
         # CASO 1: CONTRASEÑA YA ES HASH DE DJANGO (seguro)
         if _is_django_hash(stored):
+            # Si el hash usa otro algoritmo u otro costo que la política actual,
+            # Django llama a este setter con la contraseña correcta para regenerarlo
+            rehash = []
+            
+            def setter(raw_password):
+                rehash.append(make_password(raw_password))
+            
             # Usar validación estándar de Django
-            if check_password(password, stored):
-                # Contraseña correcta: actualizar último login y retornar usuario
-                self._touch_last_login(user_id)
-                return self._get_user(user_id)
+            if check_password(password, stored, setter):
+                # Contraseña correcta: registrar último login (y el hash nuevo si hubo)
+                if rehash:
+                    invalidar_usuario(user.id)
+                return self._registrar_login(user, rehash[0] if rehash else None)
             # Contraseña incorrecta
             return None
         
@@ -125,20 +316,11 @@ class SPAuthBackend(BaseBackend):
             MIGRACIÓN AUTOMÁTICA A SEGURIDAD:
             - Si la contraseña es correcta
             - Convertir a hash Django seguro
-            - Guardar en BD para futuros logins
+            - Guardar en BD junto con last_login en UN solo UPDATE
             """
-            new_hash = make_password(password)  # Crear hash pbkdf2_sha256 con salt aleatorio
-            
-            # Actualizar BD con hash seguro
-            with connection.cursor() as cur:
-                cur.execute(
-                    "UPDATE auth_user_custom SET password=%s WHERE id=%s",
-                    [new_hash, user_id],
-                )
-            
-            # Login exitoso: actualizar último acceso y retornar usuario
-            self._touch_last_login(user_id)
-            return self._get_user(user_id)
+            new_hash = make_password(password)  # Hash con la política actual (HASH_POLITICA)
+            invalidar_usuario(user.id)  # El objeto cacheado tiene la contraseña vieja
+            return self._registrar_login(user, new_hash)
         
         # CONTRASEÑA INCORRECTA: No coincide en ningún formato
         return None
@@ -154,12 +336,13 @@ class SPAuthBackend(BaseBackend):
         - Django llama este método para recargar usuario desde sesión
         - Usado en cada request para obtener request.user
         - Debe retornar None si usuario no existe
+        - Pasa por cache_usuarios para evitar un SELECT por request
         
         RETORNA:
         - CustomUser object: Si usuario existe
         - None: Si usuario no existe o hay error
         """
-        return self._get_user(user_id)
+        return cache_usuarios.obtener(user_id, self._get_user)
     
     def _get_user(self, user_id):
         """
@@ -182,27 +365,128 @@ class SPAuthBackend(BaseBackend):
         except CustomUser.DoesNotExist:
             return None
     
-    def _touch_last_login(self, user_id):
+    def _registrar_login(self, user, new_hash=None):
         """
-        MÉTODO PRIVADO: Actualizar timestamp de último login
+        MÉTODO PRIVADO: Guardar last_login (y el hash migrado) en una sola escritura
         
         PARÁMETROS:
-        - user_id: ID numérico del usuario
+        - user: CustomUser ya cargado por authenticate()
+        - new_hash: Hash nuevo si se migró desde texto plano (opcional)
         
         PROPÓSITO:
-        - Registrar cuándo fue el último acceso del usuario
-        - Útil para auditoría y seguridad
-        - Actualizar campo 'last_login' en BD
+        - Antes: SELECT + UPDATE password + UPDATE last_login + SELECT = 4 viajes
+        - Ahora: SELECT + 1 UPDATE (o solo el SELECT si last_login va al buffer)
+        
+        MODOS (settings.LAST_LOGIN_EXACTO):
+        - True: UPDATE inmediato con NOW()
+        - False: el timestamp se acumula en buffer_last_login y se escribe
+          en bloque cada LAST_LOGIN_FLUSH segundos. Un hash migrado se
+          escribe siempre de inmediato.
+        
+        RETORNA: El mismo objeto user, actualizado en memoria
+        """
+        exacto = getattr(settings, 'LAST_LOGIN_EXACTO', True)
+        
+        if new_hash:
+            user.password = new_hash
+            with connection.cursor() as cur:
+                cur.execute(
+                    "UPDATE auth_user_custom SET password=%s, last_login=UTC_TIMESTAMP() WHERE id=%s",
+                    [new_hash, user.id],
+                )
+            buffer_last_login.descartar(user.id)
+        elif exacto:
+            with connection.cursor() as cur:
+                cur.execute(
+                    "UPDATE auth_user_custom SET last_login=UTC_TIMESTAMP() WHERE id=%s",
+                    [user.id]
+                )
+        else:
+            buffer_last_login.registrar(user.id)
+        
+        user.last_login = timezone.now()
+        cache_usuarios.guardar(user)  # El siguiente request no necesita otro SELECT
+        return user
+
+
+class _BufferLastLogin:
+    """
+    CLASE: Acumula timestamps de last_login y los escribe en bloque
+    
+    PROPÓSITO:
+    - En horas pico (cambio de turno) cada login hacía su propio UPDATE
+    - Agrupar N logins en UN UPDATE ... CASE reduce los viajes a la BD
+    
+    COMPROMISO:
+    - last_login puede quedar atrasado hasta LAST_LOGIN_FLUSH segundos
+    - Si el proceso muere sin vaciar el buffer se pierden esos timestamps
+      (se intenta vaciar al terminar con atexit)
+    - Usar LAST_LOGIN_EXACTO = True donde se necesite el valor exacto
+    """
+    
+    def __init__(self):
+        self._pendientes = {}  # user_id -> datetime
+        self._lock = threading.Lock()
+        self._ultimo_flush = time.monotonic()
+    
+    def registrar(self, user_id):
+        """Guarda el timestamp y vacía el buffer si ya pasó el intervalo."""
+        with self._lock:
+            self._pendientes[user_id] = timezone.now()
+            vencido = (
+                time.monotonic() - self._ultimo_flush
+                >= getattr(settings, 'LAST_LOGIN_FLUSH', 30)
+            )
+        if vencido:
+            self.vaciar()
+    
+    def descartar(self, user_id):
+        """Quita un usuario cuyo last_login ya se escribió por otra vía."""
+        with self._lock:
+            self._pendientes.pop(user_id, None)
+    
+    def vaciar(self):
+        """
+        MÉTODO: Escribe todos los timestamps pendientes en UN solo UPDATE
         
-        IMPLEMENTACIÓN:
-        - Usar NOW() de MySQL para timestamp actual
-        - Consulta SQL directa para mejor rendimiento
+        RETORNA: Número de usuarios actualizados
         """
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+            self._ultimo_flush = time.monotonic()
+        if not pendientes:
+            return 0
+        
+        casos = ' '.join(['WHEN %s THEN %s'] * len(pendientes))
+        marcadores = ','.join(['%s'] * len(pendientes))
+        params = []
+        for user_id, momento in pendientes.items():
+            # Con USE_TZ Django guarda UTC sin zona: mismo formato que el ORM
+            params.extend([user_id, connection.ops.adapt_datetimefield_value(momento)])
+        params.extend(pendientes.keys())
+        
         with connection.cursor() as cur:
             cur.execute(
-                "UPDATE auth_user_custom SET last_login=NOW() WHERE id=%s", 
-                [user_id]
+                f"UPDATE auth_user_custom SET last_login = CASE id {casos} END "
+                f"WHERE id IN ({marcadores})",
+                params,
             )
+        return len(pendientes)
+
+
+# Instancia única por proceso
+buffer_last_login = _BufferLastLogin()
+
+
+def _vaciar_al_salir():
+    """Último intento de guardar los last_login pendientes al apagar el worker."""
+    try:
+        buffer_last_login.vaciar()
+    except Exception as e:
+        print(f"Error guardando last_login pendientes: {e}")
+
+
+atexit.register(_vaciar_al_salir)
 
 """
 === FLUJO COMPLETO DE AUTENTICACIÓN ===
@@ -220,16 +504,16 @@ class SPAuthBackend(BaseBackend):
 
 4. MIGRACIÓN AUTOMÁTICA (si texto plano):
    - Convertir a hash Django seguro
-   - Actualizar BD con nuevo hash
+   - Actualizar BD con nuevo hash (mismo UPDATE que last_login)
 
 5. LOGIN EXITOSO:
-   - Actualizar last_login
-   - Retornar objeto CustomUser
+   - Actualizar last_login (inmediato o en bloque, ver LAST_LOGIN_EXACTO)
+   - Retornar el objeto CustomUser ya cargado (sin segundo SELECT)
    - Django crea sesión automáticamente
 
 6. REQUESTS POSTERIORES:
    - Django llama get_user() con ID de sesión
-   - Backend retorna objeto usuario actual
+   - Backend retorna objeto usuario actual (desde cache_usuarios si está vigente)
 
 === VENTAJAS DE ESTE BACKEND ===
 
@@ -249,7 +533,7 @@ AUTHENTICATION_BACKENDS = [
 
 === SEGURIDAD IMPLEMENTADA ===
 
-1. HASH PBKDF2_SHA256: Estándar de Django con salt aleatorio
+1. HASH CONFIGURABLE: PBKDF2 / scrypt / Argon2 según HASH_POLITICA (hashers.py)
 2. MIGRACIÓN AUTOMÁTICA: De texto plano a hash seguro
 3. VALIDACIÓN ROBUSTA: Manejo de casos edge
 4. AUDITORÍA: Registro de último acceso
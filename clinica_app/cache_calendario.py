@@ -0,0 +1,98 @@
+# clinica_app/cache_calendario.py
+
+"""
+=== CACHÉ DEL MES DEL CALENDARIO ===
+
+PROPÓSITO PRINCIPAL:
+- Guardar ya serializado el JSON de citas que calendario_view envía al template
+- Clave por (alcance del rol, usuario, año, mes)
+- Invalidar SOLO los meses afectados cuando se agenda, cancela o cambia una cita
+- Dar a cada mes un ETag y una fecha de modificación para responder 304
+
+ALCANCES (quién ve qué):
+- paciente:<id>  → sus propias citas
+- medico:<id>    → sus propias citas
+- admin:0        → todas las citas (compartido por todos los administradores)
+
+INVALIDACIÓN:
+- Una cita afecta exactamente 3 claves de su mes: su médico, su paciente y admin
+- Cambios de nombre de usuarios no invalidan: se reflejan al vencer el TTL
+
+IMPORTANTE: Con varios workers, CALENDARIO_CACHE_ALIAS debe apuntar a una
+caché compartida (Redis/Memcached); con LocMemCache cada proceso invalida
+solo su propia copia y el resto espera al TTL.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .dashboard import invalidar_dashboard
+from .replicas import marcar_escritura, usar_primario
+
+PREFIJO = 'calendario'
+
+
+def _cache():
+    return caches[getattr(settings, 'CALENDARIO_CACHE_ALIAS', 'default')]
+
+
+def alcance_usuario(usuario):
+    """Retorna (alcance, id) según el rol: lo que el usuario puede ver."""
+    if usuario.is_paciente:
+        return 'paciente', usuario.id
+    if usuario.is_medico:
+        return 'medico', usuario.id
+    return 'admin', 0
+
+
+def clave_mes(alcance, user_id, año, mes):
+    return f"{PREFIJO}:{alcance}:{user_id}:{año}:{mes}"
+
+
+def obtener_mes(usuario, año, mes, construir):
+    """
+    FUNCIÓN: Payload del mes desde caché o construyéndolo
+
+    PARÁMETROS:
+    - construir: Función sin argumentos que retorna (citas, token de cambios)
+
+    RETORNA: {'citas': JSON serializado, 'token': str, 'etag': str, 'modificado': epoch}
+    """
+    clave = clave_mes(*alcance_usuario(usuario), año, mes)
+    payload = _cache().get(clave)
+    if payload is None:
+        # Se guarda para otros requests: nunca desde la réplica (ver replicas.py)
+        with usar_primario():
+            citas, token = construir()
+        citas_json = json.dumps(citas)
+        payload = {
+            'citas': citas_json,
+            'token': token,
+            'etag': hashlib.md5(citas_json.encode('utf-8')).hexdigest(),
+            'modificado': int(time.time()),
+        }
+        _cache().set(clave, payload, getattr(settings, 'CALENDARIO_CACHE_TTL', 300))
+    return payload
+
+
+def invalidar_cita(medico_id, paciente_id, fecha):
+    """
+    FUNCIÓN: Borra los meses cacheados que contienen esta cita
+
+    USO: agendar_cita_view, cancelar_cita_view, actualizar_estado_cita
+
+    También invalida el dashboard de home_view de los mismos usuarios (dashboard.py)
+    y hace que el navegador lea del primario unos segundos (replicas.py)
+    """
+    año, mes = fecha.year, fecha.month
+    _cache().delete_many([
+        clave_mes('medico', medico_id, año, mes),
+        clave_mes('paciente', paciente_id, año, mes),
+        clave_mes('admin', 0, año, mes),
+    ])
+    invalidar_dashboard(medico_id, paciente_id)
+    marcar_escritura()
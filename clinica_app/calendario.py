@@ -0,0 +1,113 @@
+# clinica_app/calendario.py
+
+"""
+=== DATOS DEL CALENDARIO: MES COMPLETO Y CAMBIOS INCREMENTALES ===
+
+PROPÓSITO PRINCIPAL:
+- Una sola consulta de citas del mes, filtrada por rol (la usan calendario_view
+  y api_calendario)
+- Sincronización incremental: con un token de cambios ('since') devolver solo
+  las citas creadas, modificadas o canceladas desde la última consulta
+
+TOKEN DE CAMBIOS:
+- Es el mayor citas.updated_at visto por el cliente (ISO 8601)
+- updated_at tiene resolución de segundos y una transacción puede confirmar
+  después con un timestamp anterior: por eso cada consulta incremental repite
+  una ventana de FEED_MARGEN segundos. El cliente aplica los cambios por id,
+  así que recibir una cita dos veces no tiene efecto
+
+LIMITACIÓN:
+- Las citas BORRADAS (eliminar usuario en cascada) no dejan rastro en
+  updated_at; el cliente las deja de ver al recargar el mes completo
+"""
+
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+
+from .models import Cita
+
+# Estados que se muestran en el calendario; el resto se informa como 'eliminadas'
+ESTADOS_ACTIVOS = ('PENDIENTE', 'CONFIRMADA')
+
+COLUMNAS = (
+    'id', 'fecha', 'hora', 'duracion', 'estado', 'motivo',
+    'paciente__first_name', 'paciente__last_name',
+    'medico__first_name', 'medico__last_name', 'updated_at',
+)
+
+
+def rango_mes(año, mes):
+    """Retorna (primer día, último día) del mes."""
+    inicio = date(año, mes, 1)
+    if mes == 12:
+        return inicio, date(año + 1, 1, 1) - timedelta(days=1)
+    return inicio, date(año, mes + 1, 1) - timedelta(days=1)
+
+
+def codificar_token(momento):
+    return momento.isoformat() if momento else None
+
+
+def decodificar_token(token):
+    """
+    Inverso de codificar_token(); retorna None si el token es inválido
+
+    Los tokens propios llevan zona (USE_TZ); uno sin zona no se puede comparar
+    con updated_at y se rechaza (api_calendario responde 400)
+    """
+    try:
+        momento = datetime.fromisoformat(token)
+    except (TypeError, ValueError):
+        return None
+    return momento if momento.tzinfo is not None else None
+
+
+def _consulta_rol(usuario, fecha_inicio, fecha_fin):
+    citas = Cita.objects.filter(fecha__range=[fecha_inicio, fecha_fin])
+    if usuario.is_paciente:
+        citas = citas.filter(paciente_id=usuario.id)  # Pacientes: solo sus propias citas
+    elif usuario.is_medico:
+        citas = citas.filter(medico_id=usuario.id)  # Médicos: solo sus propias citas
+    return citas  # Administradores: todas las citas
+
+
+def citas_mes(usuario, año, mes, desde=None):
+    """
+    FUNCIÓN: Citas del mes visibles para el usuario
+
+    PARÁMETROS:
+    - desde: datetime del token del cliente; None = mes completo (solo activas)
+
+    RETORNA: (citas, eliminadas, token)
+    - citas: dicts listos para JSON (activas)
+    - eliminadas: ids que el cliente debe quitar (canceladas/completadas)
+    - token: mayor updated_at visto, para la próxima consulta incremental
+    """
+    citas = _consulta_rol(usuario, *rango_mes(año, mes))
+    if desde is None:
+        citas = citas.filter(estado__in=ESTADOS_ACTIVOS)
+    else:
+        margen = getattr(settings, 'CALENDARIO_FEED_MARGEN', 2)
+        citas = citas.filter(updated_at__gte=desde - timedelta(seconds=margen))
+
+    activas, eliminadas, token = [], [], desde
+    # Solo las columnas que usa el calendario (sin instanciar modelos)
+    for (cita_id, fecha, hora, duracion, estado, motivo, pac_nombre, pac_apellido,
+         med_nombre, med_apellido, actualizado) in citas.values_list(*COLUMNAS):
+        if actualizado is not None and (token is None or actualizado > token):
+            token = actualizado
+        if estado not in ESTADOS_ACTIVOS:
+            eliminadas.append(cita_id)
+            continue
+        activas.append({
+            'id': cita_id,
+            'fecha': str(fecha),
+            'hora': str(hora),
+            'duracion': duracion,
+            'estado': estado,
+            'motivo': motivo,
+            'paciente_nombre': f"{pac_nombre} {pac_apellido}".strip(),
+            'medico_nombre': f"{med_nombre} {med_apellido}".strip(),
+        })
+    return activas, eliminadas, codificar_token(token)
@@ -0,0 +1,208 @@
+# clinica_app/conexiones.py
+
+"""
+=== CONEXIONES A LA BASE DE DATOS: PERSISTENTES O EN POOL, CON MÉTRICAS ===
+
+PROPÓSITO PRINCIPAL:
+- Dejar de abrir una conexión MySQL nueva en cada request
+- Contar conexiones nuevas, reutilizadas, recuperadas (rotas) y esperas por
+  el pool en /metrics (clinica_db_conexiones_total, clinica_db_pool_espera_seconds)
+  para dimensionar contra el número de workers
+
+DOS MODOS (settings.py, sección CONEXIONES):
+1. PERSISTENTE (CLINICA_DB_CONN_MAX_AGE, SOLO workers síncronos de gunicorn/uwsgi):
+   CONN_MAX_AGE + CONN_HEALTH_CHECKS de Django. Cada hilo conserva su conexión
+   entre requests; si murió (timeout de MySQL, reinicio) se detecta con un
+   ping al primer uso y se reconecta. Métricas por señales (conectar_senales).
+   Sin la variable, CONN_MAX_AGE = 0 (una conexión por request); asgi.py
+   rechaza CONN_MAX_AGE > 0
+2. POOL (CLINICA_DB_POOL=<tamaño>, obligatorio para ASGI o workers con hilos):
+   ENGINE 'clinica_app.pool_mysql'. Con ASGI cada request puede correr en un
+   hilo distinto y las conexiones persistentes por hilo se acumulan; el pool
+   limita las conexiones del proceso a DB_POOL_TAMANO y los demás esperan
+   hasta DB_POOL_ESPERA segundos
+
+EVENTOS (etiqueta 'evento' de clinica_db_conexiones_total):
+- nueva: Se abrió una conexión física a MySQL
+- reutilizada: Modo persistente: un request empezó con la conexión del anterior
+  (si resulta rota cuenta además como recuperada). Pool: se tomó una conexión libre
+- recuperada: La conexión reutilizada estaba rota y se reemplazó
+- descartada: Pool: se cerró por vieja (DB_POOL_VIDA) o por fallar al devolverla
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+
+from .metricas import contar, observar
+
+
+class PoolAgotado(Exception):
+    """No se liberó ninguna conexión en DB_POOL_ESPERA segundos."""
+
+
+class PoolConexiones:
+    """
+    CLASE: Pool de conexiones físicas de UN alias, compartido por los hilos del proceso
+
+    - tomar(crear): Conexión libre (verificada con ping si estuvo ociosa más de
+      'verificar' segundos) o una nueva si hay cupo; si no, espera
+    - devolver(conexion): Hace rollback y la deja libre (o la cierra si falla)
+    """
+
+    def __init__(self, alias, tamano, espera, verificar, vida):
+        self.alias = alias
+        self.tamano = tamano
+        self.espera = espera
+        self.verificar = verificar
+        self.vida = vida
+        self._cond = threading.Condition()
+        self._libres = deque()  # (conexion, creada, devuelta) con tiempos monotonic
+        self._creadas = {}      # id(conexion) -> creada
+        self._abiertas = 0
+
+    def _evento(self, evento):
+        contar('clinica_db_conexiones_total', alias=self.alias, evento=evento)
+
+    def _descartar(self, conexion, evento='descartada'):
+        with self._cond:
+            self._creadas.pop(id(conexion), None)
+            self._abiertas -= 1
+            self._cond.notify()
+        try:
+            conexion.close()
+        except Exception:
+            pass
+        self._evento(evento)
+
+    def tomar(self, crear):
+        inicio = time.monotonic()
+        limite = inicio + self.espera
+        espero = False
+        while True:
+            libre = None
+            with self._cond:
+                while not self._libres and self._abiertas >= self.tamano:
+                    espero = True
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        contar('clinica_db_pool_agotado_total', alias=self.alias)
+                        raise PoolAgotado(
+                            f"Pool '{self.alias}' sin conexiones libres tras {self.espera} s "
+                            f"(DB_POOL_TAMANO={self.tamano})"
+                        )
+                    self._cond.wait(restante)
+                if self._libres:
+                    libre = self._libres.pop()  # La más reciente: ping menos probable
+                else:
+                    self._abiertas += 1
+
+            if espero:
+                observar('clinica_db_pool_espera_seconds', time.monotonic() - inicio,
+                         alias=self.alias)
+                espero = False
+
+            if libre is None:
+                try:
+                    conexion = crear()
+                except Exception:
+                    with self._cond:
+                        self._abiertas -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._creadas[id(conexion)] = time.monotonic()
+                self._evento('nueva')
+                return conexion
+
+            conexion, creada, devuelta = libre
+            ahora = time.monotonic()
+            if self.vida and ahora - creada > self.vida:
+                self._descartar(conexion)
+                continue
+            if ahora - devuelta > self.verificar:
+                try:
+                    conexion.ping()
+                except Exception:
+                    # Timeout de MySQL (wait_timeout), reinicio del servidor, red
+                    self._descartar(conexion, evento='recuperada')
+                    continue
+            self._evento('reutilizada')
+            return conexion
+
+    def devolver(self, conexion):
+        try:
+            conexion.rollback()  # Nada de una transacción a medias pasa al siguiente
+        except Exception:
+            self._descartar(conexion)
+            return
+        with self._cond:
+            creada = self._creadas.get(id(conexion), time.monotonic())
+            self._libres.append((conexion, creada, time.monotonic()))
+            self._cond.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_de(alias):
+    """El pool del alias (se crea al primer uso con los DB_POOL_* de settings)."""
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = _pools[alias] = PoolConexiones(
+                    alias,
+                    tamano=getattr(settings, 'DB_POOL_TAMANO', 10),
+                    espera=getattr(settings, 'DB_POOL_ESPERA', 10),
+                    verificar=getattr(settings, 'DB_POOL_VERIFICAR', 5),
+                    vida=getattr(settings, 'DB_POOL_VIDA', 600),
+                )
+    return pool
+
+
+def _reiniciar_tras_fork():
+    # Un proceso hijo (gunicorn --preload) no debe usar los sockets del padre
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+# ========== MODO PERSISTENTE: MÉTRICAS POR SEÑALES ==========
+
+def _request_iniciado(sender, **kwargs):
+    # Se conecta después del close_old_connections de Django: lo que sigue
+    # abierto aquí se va a reutilizar en este request
+    for conexion in connections.all(initialized_only=True):
+        if conexion.connection is not None and not getattr(conexion, 'usa_pool', False):
+            conexion.clinica_reutilizada = True
+            contar('clinica_db_conexiones_total', alias=conexion.alias, evento='reutilizada')
+
+
+def _conexion_creada(sender, connection, **kwargs):
+    if getattr(connection, 'usa_pool', False):
+        return  # El pool cuenta sus propios eventos
+    # Conexión nueva en un request que empezó con una abierta: el health
+    # check de Django la encontró rota y la reemplazó
+    evento = 'recuperada' if getattr(connection, 'clinica_reutilizada', False) else 'nueva'
+    connection.clinica_reutilizada = False
+    contar('clinica_db_conexiones_total', alias=connection.alias, evento=evento)
+
+
+def conectar_senales():
+    """Llamado desde ClinicaAppConfig.ready()."""
+    from django.core.signals import request_started
+    from django.db.backends.signals import connection_created
+
+    request_started.connect(_request_iniciado, dispatch_uid='conexiones_request_iniciado')
+    connection_created.connect(_conexion_creada, dispatch_uid='conexiones_creada')
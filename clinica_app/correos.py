@@ -0,0 +1,285 @@
+# clinica_app/correos.py
+
+"""
+=== COLA PERSISTENTE DE CORREOS (OUTBOX) ===
+
+PROPÓSITO PRINCIPAL:
+- Sacar el envío SMTP del ciclo request/response de las vistas
+- Guardar cada notificación en la tabla 'correos_pendientes'
+- Enviar los correos por lotes reutilizando UNA sola conexión SMTP
+- Reintentar con backoff exponencial cuando el servidor falla
+
+PROBLEMA QUE RESUELVE:
+- send_mail() abre una conexión a smtp.gmail.com por cada correo
+- agendar_cita_view hacía 2 envíos seguidos: el usuario esperaba al servidor
+- Si Gmail fallaba, el correo se perdía para siempre
+
+FLUJO:
+1. La vista llama encolar_correo() → un INSERT y retorna de inmediato
+2. El comando 'python manage.py procesar_correos' toma un lote
+3. Se abre una conexión, se envían todos los correos del lote y se cierra
+4. Los fallidos se reprograman (30s, 60s, 120s, ...) hasta CORREOS_MAX_INTENTOS
+"""
+
+import time
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import connection
+
+from .instrumentacion import medir
+from .metricas import contar, observar, volcar
+
+# ALIAS CORTOS PARA BACKENDS DE CORREO (útiles sin red en desarrollo)
+BACKENDS_CORREO = {
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+def _config(nombre, defecto):
+    """Lee un parámetro CORREOS_* de settings con valor por defecto."""
+    return getattr(settings, nombre, defecto)
+
+
+def resolver_backend(backend=None):
+    """
+    FUNCIÓN: Traduce un alias ('console', 'file', ...) a la ruta del backend
+
+    RETORNA: Ruta completa del backend o None para usar EMAIL_BACKEND
+    """
+    if not backend:
+        return None
+    return BACKENDS_CORREO.get(backend, backend)
+
+
+def encolar_correo(asunto, mensaje, destinatarios):
+    """
+    FUNCIÓN: Agrega un correo a la cola persistente
+
+    PARÁMETROS:
+    - asunto: Asunto del correo
+    - mensaje: Cuerpo en texto plano
+    - destinatarios: Lista de emails
+
+    PROPÓSITO:
+    - Un solo INSERT, sin tocar el servidor SMTP
+    - Si CORREOS_ASINCRONOS = False se envía en el momento (modo anterior)
+
+    RETORNA: True si quedó encolado (o enviado), False si hubo error
+    """
+    destinatarios = [d for d in destinatarios if d]
+    if not destinatarios:
+        return False
+
+    try:
+        with medir('correo'):  # Tiempo de correo en Server-Timing (instrumentacion.py)
+            if not _config('CORREOS_ASINCRONOS', True):
+                send_mail(
+                    asunto,
+                    mensaje,
+                    settings.EMAIL_HOST_USER,
+                    destinatarios,
+                    fail_silently=False,
+                )
+                return True
+
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO correos_pendientes
+                    (destinatarios, asunto, mensaje, estado, intentos, proximo_intento)
+                    VALUES (%s, %s, %s, 'PENDIENTE', 0, NOW())
+                """, [','.join(destinatarios), asunto, mensaje])
+            contar('clinica_correos_encolados_total')
+            return True
+    except Exception as e:
+        print(f"Error encolando correo: {e}")
+        return False
+
+
+def _segundos_backoff(intentos):
+    """
+    FUNCIÓN AUXILIAR: Espera antes del siguiente reintento
+
+    LÓGICA: base * 2^(intentos-1), con tope CORREOS_BACKOFF_MAX
+    Ejemplo con base 30: 30s, 60s, 120s, 240s, ...
+    """
+    base = _config('CORREOS_BACKOFF_BASE', 30)
+    tope = _config('CORREOS_BACKOFF_MAX', 3600)
+    return min(tope, base * (2 ** max(0, intentos - 1)))
+
+
+def tomar_lote(limite):
+    """
+    FUNCIÓN: Reserva un lote de correos listos para enviar
+
+    PROPÓSITO:
+    - Marcar los correos con un identificador de lote en un solo UPDATE
+    - Varios workers pueden correr a la vez sin enviar dos veces el mismo
+    - El "lease" (proximo_intento en el futuro) permite recuperar correos
+      de un worker que murió a mitad de envío
+    - El intento se cuenta AL TOMAR el correo: uno que tumba al worker en
+      cada envío también llega a CORREOS_MAX_INTENTOS y pasa a FALLIDO
+
+    RETORNA: Lista de tuplas (id, destinatarios, asunto, mensaje, intentos,
+    segundos en cola desde created_at)
+    """
+    lote = uuid.uuid4().hex
+    lease = _config('CORREOS_LEASE', 300)
+    max_intentos = _config('CORREOS_MAX_INTENTOS', 5)
+
+    with connection.cursor() as cursor:
+        # Leases vencidos que ya agotaron sus intentos: no se vuelven a tomar
+        cursor.execute("""
+            UPDATE correos_pendientes
+            SET estado='FALLIDO', lote=NULL,
+                ultimo_error='Lease vencido: el worker terminó a mitad de envío'
+            WHERE estado='ENVIANDO' AND proximo_intento <= NOW() AND intentos >= %s
+        """, [max_intentos])
+        if cursor.rowcount:
+            contar('clinica_correos_procesados_total', cursor.rowcount, resultado='fallidos')
+
+        cursor.execute("""
+            UPDATE correos_pendientes
+            SET estado='ENVIANDO', lote=%s, intentos=intentos + 1,
+                proximo_intento=DATE_ADD(NOW(), INTERVAL %s SECOND)
+            WHERE estado IN ('PENDIENTE', 'ENVIANDO') AND proximo_intento <= NOW()
+              AND intentos < %s
+            ORDER BY id
+            LIMIT %s
+        """, [lote, lease, max_intentos, limite])
+
+        cursor.execute("""
+            SELECT id, destinatarios, asunto, mensaje, intentos,
+                   TIMESTAMPDIFF(SECOND, created_at, NOW())
+            FROM correos_pendientes
+            WHERE lote=%s AND estado='ENVIANDO'
+            ORDER BY id
+        """, [lote])
+        return cursor.fetchall()
+
+
+def _marcar_enviados(ids):
+    """Marca como ENVIADO todos los ids en un solo UPDATE."""
+    if not ids:
+        return
+    marcadores = ','.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE correos_pendientes
+            SET estado='ENVIADO', enviado_at=NOW(), lote=NULL, ultimo_error=NULL
+            WHERE id IN ({marcadores})
+        """, list(ids))
+
+
+def _marcar_error(correo_id, intentos, error):
+    """
+    FUNCIÓN AUXILIAR: Registra un fallo y reprograma (o descarta) el correo
+
+    PARÁMETROS:
+    - intentos: Ya incluye el intento actual (tomar_lote lo sumó)
+
+    RETORNA: True si se reprogramó, False si pasó a FALLIDO
+    """
+    reintentar = intentos < _config('CORREOS_MAX_INTENTOS', 5)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE correos_pendientes
+            SET estado=%s, intentos=%s, lote=NULL, ultimo_error=%s,
+                proximo_intento=DATE_ADD(NOW(), INTERVAL %s SECOND)
+            WHERE id=%s
+        """, [
+            'PENDIENTE' if reintentar else 'FALLIDO',
+            intentos,
+            str(error)[:1000],
+            _segundos_backoff(intentos),
+            correo_id,
+        ])
+    return reintentar
+
+
+def _registrar_resultado(resultado):
+    """Suma el lote a las métricas (metricas.py) y las vuelca a disco."""
+    for clave, valor in resultado.items():
+        if valor:
+            contar('clinica_correos_procesados_total', valor, resultado=clave)
+    volcar()  # El worker no pasa por el middleware de métricas
+
+
+def procesar_lote(limite=None, backend=None):
+    """
+    FUNCIÓN: Envía un lote de la cola usando UNA conexión reutilizada
+
+    PARÁMETROS:
+    - limite: Máximo de correos del lote (por defecto CORREOS_LOTE)
+    - backend: Alias o ruta de backend; None usa settings.EMAIL_BACKEND
+
+    RETORNA: Diccionario {'enviados', 'reintentos', 'fallidos'}
+    """
+    resultado = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+    correos = tomar_lote(limite or _config('CORREOS_LOTE', 50))
+    if not correos:
+        return resultado
+
+    conexion = get_connection(backend=resolver_backend(backend), fail_silently=False)
+    enviados = []
+
+    try:
+        conexion.open()
+    except Exception as e:
+        # Sin conexión no se envía nada: reprogramar todo el lote
+        for correo_id, _, _, _, intentos, _ in correos:
+            if _marcar_error(correo_id, intentos, e):
+                resultado['reintentos'] += 1
+            else:
+                resultado['fallidos'] += 1
+        _registrar_resultado(resultado)
+        return resultado
+
+    try:
+        for correo_id, destinatarios, asunto, mensaje, intentos, espera in correos:
+            inicio = time.perf_counter()
+            try:
+                EmailMessage(
+                    asunto,
+                    mensaje,
+                    settings.EMAIL_HOST_USER,
+                    destinatarios.split(','),
+                    connection=conexion,
+                ).send(fail_silently=False)
+                enviados.append(correo_id)
+                observar('clinica_correo_envio_seconds', time.perf_counter() - inicio)
+                if espera is not None:
+                    observar('clinica_correo_espera_seconds', espera)
+            except Exception as e:
+                if _marcar_error(correo_id, intentos, e):
+                    resultado['reintentos'] += 1
+                else:
+                    resultado['fallidos'] += 1
+    finally:
+        conexion.close()
+        _marcar_enviados(enviados)
+
+    resultado['enviados'] = len(enviados)
+    _registrar_resultado(resultado)
+    return resultado
+
+
+"""
+=== CONFIGURACIÓN (settings.py) ===
+
+CORREOS_ASINCRONOS     True = encolar, False = enviar dentro del request
+CORREOS_LOTE           Correos por lote / por conexión SMTP
+CORREOS_MAX_INTENTOS   Intentos antes de marcar FALLIDO
+CORREOS_BACKOFF_BASE   Segundos de espera tras el primer fallo
+CORREOS_BACKOFF_MAX    Tope de espera entre reintentos
+CORREOS_LEASE          Segundos antes de recuperar un lote abandonado
+
+=== PRUEBAS SIN RED ===
+
+python manage.py procesar_correos --backend console   # imprime en terminal
+python manage.py procesar_correos --backend file      # escribe en EMAIL_FILE_PATH
+"""
@@ -0,0 +1,161 @@
+# clinica_app/dashboard.py
+
+"""
+=== DATOS DEL DASHBOARD DE home_view (UNA CONSULTA POR WIDGET) ===
+
+PROPÓSITO PRINCIPAL:
+- Médico: sus citas activas de hoy
+- Paciente: sus próximas 5 citas activas
+- Admin: totales de hoy por estado y carga por médico, de UN solo GROUP BY
+- Guardar el resultado por usuario unos segundos en la caché de Django
+
+PROBLEMA QUE RESUELVE:
+- home_view pasaba querysets sin select_related y home.html llamaba
+  cita.paciente.get_full_name por fila: 30 citas hoy = 31 consultas
+- Ahora cada widget trae nombres con JOIN en values_list() y el template
+  recibe dicts ya armados
+
+INVALIDACIÓN:
+- cache_calendario.invalidar_cita() (la llaman todas las vistas que agendan,
+  cancelan o cambian el estado de una cita) también llama invalidar_dashboard()
+- La clave incluye la fecha: a medianoche el dashboard de ayer deja de usarse
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q, Sum
+
+from .models import Cita
+from .replicas import usar_primario
+
+ESTADOS_ACTIVOS = ('PENDIENTE', 'CONFIRMADA')
+ESTADOS = ('PENDIENTE', 'CONFIRMADA', 'COMPLETADA', 'CANCELADA')
+
+COLUMNAS_CITA = (
+    'id', 'fecha', 'hora', 'duracion', 'estado', 'motivo',
+    'paciente__first_name', 'paciente__last_name',
+    'medico__first_name', 'medico__last_name',
+)
+
+PREFIJO = 'dashboard'
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _nombre(nombre, apellido):
+    """Igual que CustomUser.get_full_name() pero sin instanciar el usuario."""
+    return f"{nombre or ''} {apellido or ''}".strip()
+
+
+def _como_dicts(filas):
+    return [
+        {
+            'id': cita_id, 'fecha': fecha, 'hora': hora, 'duracion': duracion,
+            'estado': estado, 'motivo': motivo,
+            'paciente': _nombre(p_nombre, p_apellido),
+            'medico': _nombre(m_nombre, m_apellido),
+        }
+        for (cita_id, fecha, hora, duracion, estado, motivo,
+             p_nombre, p_apellido, m_nombre, m_apellido) in filas
+    ]
+
+
+# ========== CONSULTAS (también las usa explicar_consultas) ==========
+
+def consulta_citas_hoy(medico_id, hoy):
+    return Cita.objects.filter(
+        medico_id=medico_id, fecha=hoy, estado__in=ESTADOS_ACTIVOS
+    ).order_by('hora').values_list(*COLUMNAS_CITA)
+
+
+def consulta_proximas(paciente_id, hoy, limite=5):
+    return Cita.objects.filter(
+        paciente_id=paciente_id, fecha__gte=hoy, estado__in=ESTADOS_ACTIVOS
+    ).order_by('fecha', 'hora').values_list(*COLUMNAS_CITA)[:limite]
+
+
+def consulta_carga_hoy(hoy):
+    """Un GROUP BY medico_id con conteos condicionales por estado (JOIN para el nombre)."""
+    activas = Q(estado__in=ESTADOS_ACTIVOS)
+    return Cita.objects.filter(fecha=hoy).values(
+        'medico_id', 'medico__first_name', 'medico__last_name'
+    ).annotate(
+        total=Count('id'),
+        activas=Count('id', filter=activas),
+        minutos=Sum('duracion', filter=activas),
+        **{estado.lower(): Count('id', filter=Q(estado=estado)) for estado in ESTADOS},
+    ).order_by()
+
+
+# ========== WIDGETS POR ROL ==========
+
+def _kpis_admin(hoy):
+    """
+    RETORNA: {'totales': {'total', 'pendiente', ...}, 'carga': [dict por médico]}
+    Los totales salen de sumar la carga por médico: no hace falta otra consulta.
+    """
+    totales = {'total': 0, 'minutos': 0, **{estado.lower(): 0 for estado in ESTADOS}}
+    carga = []
+    for fila in consulta_carga_hoy(hoy):
+        fila['medico'] = _nombre(fila.pop('medico__first_name'), fila.pop('medico__last_name'))
+        fila['minutos'] = fila['minutos'] or 0
+        for clave in totales:
+            totales[clave] += fila[clave]
+        carga.append(fila)
+    carga.sort(key=lambda f: (-f['activas'], f['medico']))
+    return {'totales': totales, 'carga': carga}
+
+
+def _alcance(usuario):
+    if usuario.is_medico:
+        return 'medico', usuario.id
+    if usuario.is_paciente:
+        return 'paciente', usuario.id
+    return 'admin', 0
+
+
+def clave_dashboard(alcance, user_id, hoy):
+    return f"{PREFIJO}:{alcance}:{user_id}:{hoy.isoformat()}"
+
+
+def datos_dashboard(usuario, hoy=None):
+    """
+    FUNCIÓN: Datos del dashboard del usuario (desde caché o consultando)
+
+    RETORNA según el rol:
+    - médico:   {'citas_hoy': [dict, ...]}
+    - paciente: {'citas_proximas': [dict, ...]}
+    - admin:    {'kpis': {'totales': {...}, 'carga': [...]}}
+    """
+    hoy = hoy or date.today()
+    alcance, user_id = _alcance(usuario)
+    clave = clave_dashboard(alcance, user_id, hoy)
+    datos = _cache().get(clave)
+    if datos is not None:
+        return datos
+
+    # Se guarda para otros requests: nunca desde la réplica (ver replicas.py)
+    with usar_primario():
+        if alcance == 'medico':
+            datos = {'citas_hoy': _como_dicts(consulta_citas_hoy(user_id, hoy))}
+        elif alcance == 'paciente':
+            datos = {'citas_proximas': _como_dicts(consulta_proximas(user_id, hoy))}
+        else:
+            datos = {'kpis': _kpis_admin(hoy)}
+
+    _cache().set(clave, datos, getattr(settings, 'DASHBOARD_CACHE_TTL', 60))
+    return datos
+
+
+def invalidar_dashboard(medico_id, paciente_id):
+    """Borra el dashboard de hoy del médico, del paciente y de los admins."""
+    hoy = date.today()
+    _cache().delete_many([
+        clave_dashboard('medico', medico_id, hoy),
+        clave_dashboard('paciente', paciente_id, hoy),
+        clave_dashboard('admin', 0, hoy),
+    ])
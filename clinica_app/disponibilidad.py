@@ -0,0 +1,431 @@
+# clinica_app/disponibilidad.py
+
+"""
+=== MOTOR DE DISPONIBILIDAD DE HORARIOS ===
+
+PROPÓSITO PRINCIPAL:
+- Calcular los horarios libres de uno o varios médicos en uno o varios días
+- Respetar el horario de cada médico (horario_inicio, horario_fin, dias_laborales)
+- Respetar la duración real de cada cita (Cita.duracion), no solo su hora de inicio
+
+PROBLEMA QUE RESUELVE:
+- api_citas_disponibles recorría una grilla fija 08:00-17:00 cada 30 minutos
+- Por cada slot reconstruía la lista de horas ocupadas formateadas: O(slots × citas)
+- Una cita de 45 minutos a las 13:00 dejaba "libre" el slot de las 13:30
+
+ALGORITMO (todo en minutos desde medianoche):
+1. Ocupados: intervalos [hora, hora + duracion) ordenados y fusionados
+2. Libres: ventana del médico menos los ocupados (resta de intervalos)
+3. Slots: inicios cada 'paso' minutos donde cabe 'duracion' dentro de un libre
+
+CONSULTAS: 2 en total sin importar cuántos médicos × días se pidan
+
+BÚSQUEDA MASIVA: primeros_disponibles() usa bitmaps de 5 minutos por médico/día
+"""
+
+from datetime import date, time, timedelta
+from functools import lru_cache
+
+from .models import Cita, Medico
+
+# CÓDIGOS DE DÍA usados en medicos.dias_laborales ("LUN,MAR,MIE,JUE,VIE")
+# El índice coincide con date.weekday() (0 = lunes)
+DIAS_SEMANA = ('LUN', 'MAR', 'MIE', 'JUE', 'VIE', 'SAB', 'DOM')
+
+# HORARIO POR DEFECTO (el mismo que usa registro_view al crear médicos)
+HORARIO_INICIO_DEFECTO = time(8, 0)
+HORARIO_FIN_DEFECTO = time(17, 0)
+DIAS_LABORALES_DEFECTO = 'LUN,MAR,MIE,JUE,VIE'
+
+ESTADOS_ACTIVOS = ('PENDIENTE', 'CONFIRMADA')
+
+
+def a_minutos(valor):
+    """Convierte un time (o timedelta de MySQL) a minutos desde medianoche."""
+    if isinstance(valor, timedelta):
+        return int(valor.total_seconds()) // 60
+    return valor.hour * 60 + valor.minute
+
+
+def a_texto(minutos):
+    """Convierte minutos desde medianoche a 'HH:MM'."""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def fusionar_intervalos(intervalos):
+    """
+    FUNCIÓN: Ordena y fusiona intervalos solapados o contiguos
+
+    EJEMPLO: [(60, 90), (0, 30), (20, 45)] → [(0, 45), (60, 90)]
+    COMPLEJIDAD: O(n log n) por el ordenamiento
+    """
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fusionados and inicio <= fusionados[-1][1]:
+            if fin > fusionados[-1][1]:
+                fusionados[-1][1] = fin
+        else:
+            fusionados.append([inicio, fin])
+    return [(inicio, fin) for inicio, fin in fusionados]
+
+
+def restar_intervalos(ventana, ocupados):
+    """
+    FUNCIÓN: Resta intervalos ocupados (ya fusionados) a una ventana
+
+    EJEMPLO: (480, 1020) - [(540, 600)] → [(480, 540), (600, 1020)]
+    COMPLEJIDAD: O(n) un solo recorrido
+    """
+    libres = []
+    cursor, fin_ventana = ventana
+    for inicio, fin in ocupados:
+        if fin <= cursor:
+            continue
+        if inicio >= fin_ventana:
+            break
+        if inicio > cursor:
+            libres.append((cursor, inicio))
+        cursor = max(cursor, fin)
+    if cursor < fin_ventana:
+        libres.append((cursor, fin_ventana))
+    return libres
+
+
+def generar_slots(libres, duracion, paso, origen):
+    """
+    FUNCIÓN: Genera horas de inicio donde cabe una cita de 'duracion' minutos
+
+    PARÁMETROS:
+    - libres: Intervalos libres (minutos)
+    - duracion: Minutos que necesita la nueva cita
+    - paso: Separación entre slots (ej: 30 minutos)
+    - origen: Minuto de referencia de la grilla (inicio del horario del médico)
+
+    ERRORES: ValueError si paso o duracion no son positivos (el bucle no terminaría)
+    """
+    if paso <= 0 or duracion <= 0:
+        raise ValueError('paso y duracion deben ser mayores que 0')
+    slots = []
+    for inicio, fin in libres:
+        # Alinear el primer slot a la grilla del médico
+        desfase = (inicio - origen) % paso
+        s = inicio if desfase == 0 else inicio + (paso - desfase)
+        while s + duracion <= fin:
+            slots.append(a_texto(s))
+            s += paso
+    return slots
+
+
+class HorarioMedico:
+    """
+    CLASE: Horario laboral de un médico ya normalizado a minutos
+
+    ATRIBUTOS:
+    - inicio / fin: Minutos desde medianoche
+    - dias: Conjunto de índices de weekday() en los que trabaja
+    """
+
+    __slots__ = ('inicio', 'fin', 'dias')
+
+    def __init__(self, horario_inicio=None, horario_fin=None, dias_laborales=None):
+        self.inicio = a_minutos(horario_inicio or HORARIO_INICIO_DEFECTO)
+        self.fin = a_minutos(horario_fin or HORARIO_FIN_DEFECTO)
+        codigos = (dias_laborales or DIAS_LABORALES_DEFECTO).upper().split(',')
+        self.dias = {DIAS_SEMANA.index(c.strip()) for c in codigos if c.strip() in DIAS_SEMANA}
+
+    def trabaja(self, fecha):
+        """Retorna True si el médico atiende ese día de la semana."""
+        return fecha.weekday() in self.dias
+
+
+def cargar_horarios(medico_ids):
+    """
+    FUNCIÓN: Obtiene el horario de varios médicos en UNA consulta
+
+    RETORNA: {medico_user_id: HorarioMedico}
+    Médicos sin registro en 'medicos' reciben el horario por defecto
+    """
+    horarios = {int(m): HorarioMedico() for m in medico_ids}
+    filas = Medico.objects.filter(user_id__in=list(horarios)).values_list(
+        'user_id', 'horario_inicio', 'horario_fin', 'dias_laborales'
+    )
+    for user_id, inicio, fin, dias in filas:
+        horarios[user_id] = HorarioMedico(inicio, fin, dias)
+    return horarios
+
+
+def cargar_ocupados(medico_ids, fecha_inicio, fecha_fin):
+    """
+    FUNCIÓN: Obtiene y fusiona los intervalos ocupados en UNA consulta
+
+    RETORNA: {(medico_id, fecha): [(inicio, fin), ...]} ya fusionados
+    """
+    crudos = {}
+    filas = Cita.objects.filter(
+        medico_id__in=list(medico_ids),
+        fecha__range=[fecha_inicio, fecha_fin],
+        estado__in=ESTADOS_ACTIVOS,
+    ).values_list('medico_id', 'fecha', 'hora', 'duracion')
+
+    for medico_id, fecha, hora, duracion in filas:
+        inicio = a_minutos(hora)
+        crudos.setdefault((medico_id, fecha), []).append((inicio, inicio + (duracion or 30)))
+
+    return {clave: fusionar_intervalos(intervalos) for clave, intervalos in crudos.items()}
+
+
+def calcular_disponibilidad(medico_ids, fechas, duracion=30, paso=30):
+    """
+    FUNCIÓN PRINCIPAL: Horarios libres para varios médicos × varios días
+
+    PARÁMETROS:
+    - medico_ids: IDs de usuario de los médicos
+    - fechas: Lista de objetos date
+    - duracion: Minutos de la cita a agendar
+    - paso: Separación entre slots ofrecidos
+
+    RETORNA: {medico_id: {'YYYY-MM-DD': ['08:00', '08:30', ...]}}
+    """
+    medico_ids = [int(m) for m in medico_ids]
+    fechas = sorted(set(fechas))
+    resultado = {m: {} for m in medico_ids}
+    if not medico_ids or not fechas:
+        return resultado
+
+    horarios = cargar_horarios(medico_ids)
+    ocupados = cargar_ocupados(medico_ids, fechas[0], fechas[-1])
+
+    for medico_id in medico_ids:
+        horario = horarios[medico_id]
+        for fecha in fechas:
+            if not horario.trabaja(fecha):
+                resultado[medico_id][fecha.isoformat()] = []
+                continue
+            libres = restar_intervalos(
+                (horario.inicio, horario.fin),
+                ocupados.get((medico_id, fecha), []),
+            )
+            resultado[medico_id][fecha.isoformat()] = generar_slots(
+                libres, duracion, paso, horario.inicio
+            )
+    return resultado
+
+
+def rango_fechas(fecha_inicio, dias):
+    """Lista de 'dias' fechas consecutivas desde fecha_inicio."""
+    return [fecha_inicio + timedelta(days=i) for i in range(dias)]
+
+
+def parsear_fecha(valor):
+    """Convierte 'YYYY-MM-DD' (o date) a date."""
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor))
+
+
+def validar_duracion_paso(duracion, paso, maximo=240):
+    """
+    FUNCIÓN: Valida duración y paso que llegan del cliente
+
+    - Ambos entre 5 y 'maximo' minutos (DISPONIBILIDAD_MINUTOS_MAX): un paso
+      negativo o cero dejaría a generar_slots() en un bucle infinito y uno de
+      1 minuto multiplica por 30 los slots de cada día
+
+    ERRORES: ValueError con el motivo (la vista responde 400)
+    """
+    for nombre, valor in (('duracion', duracion), ('paso', paso)):
+        if not 5 <= valor <= maximo:
+            raise ValueError(f'{nombre} debe estar entre 5 y {maximo} minutos')
+    return duracion, paso
+
+
+# ========== MAPA DE OCUPACIÓN (BITMAP) PARA BÚSQUEDAS MASIVAS ==========
+"""
+IDEA:
+- Cada día de cada médico es un entero de Python donde el bit i representa
+  el bloque [i*5, i*5+5) minutos del día (288 bits por día)
+- Marcar una cita = OR con una máscara; fusionar solapes es gratis
+- Encontrar un hueco de N bloques = AND de desplazamientos (doblando el tamaño)
+- El primer hueco es el bit menos significativo: (x & -x).bit_length() - 1
+
+USO: "primer horario libre de cualquier dermatólogo en los próximos 14 días"
+
+HORARIOS NO ALINEADOS: Un horario_inicio/horario_fin que no cae en múltiplo de
+5 minutos (08:07-16:58) se redondea hacia ADENTRO (08:10-16:55): el bitmap no
+puede representar 08:07 y nunca debe ofrecer minutos fuera del horario
+"""
+
+RESOLUCION_MINUTOS = 5
+
+
+def _bloque_arriba(minuto):
+    """Índice del primer bloque que empieza en 'minuto' o después."""
+    return -(-minuto // RESOLUCION_MINUTOS)
+
+
+def mascara_bloques(inicio, fin):
+    """
+    FUNCIÓN: Máscara de bits que cubre [inicio, fin) en minutos
+
+    Redondea hacia afuera: una cita 10:02-10:31 ocupa los bloques 10:00-10:35
+    """
+    a = inicio // RESOLUCION_MINUTOS
+    b = _bloque_arriba(fin)
+    if b <= a:
+        return 0
+    return ((1 << (b - a)) - 1) << a
+
+
+@lru_cache(maxsize=256)
+def mascara_grilla(origen, fin, paso):
+    """
+    Bits de los inicios de slot permitidos: origen, origen+paso, ... < fin
+
+    Cada inicio se redondea hacia arriba al bloque de 5 minutos: nunca antes
+    del horario del médico (origen 08:07 → primer slot 08:10)
+    """
+    mascara = 0
+    origen = _bloque_arriba(origen) * RESOLUCION_MINUTOS
+    for minuto in range(origen, fin, paso):
+        mascara |= 1 << _bloque_arriba(minuto)
+    return mascara
+
+
+def construir_mapas(filas):
+    """
+    FUNCIÓN: Construye los bitmaps de ocupación a partir de filas de citas
+
+    PARÁMETROS:
+    - filas: Iterable de (medico_id, fecha, hora, duracion)
+
+    RETORNA: {(medico_id, fecha): int}
+    """
+    mapas = {}
+    for medico_id, fecha, hora, duracion in filas:
+        inicio = a_minutos(hora)
+        clave = (medico_id, fecha)
+        mapas[clave] = mapas.get(clave, 0) | mascara_bloques(inicio, inicio + (duracion or 30))
+    return mapas
+
+
+def primer_hueco(ocupado, horario, duracion, paso, desde=0):
+    """
+    FUNCIÓN: Primer minuto del día donde cabe una cita de 'duracion'
+
+    PARÁMETROS:
+    - ocupado: Bitmap de ocupación del día
+    - horario: HorarioMedico
+    - desde: No ofrecer horarios antes de este minuto (ej: hoy, hora actual)
+
+    RETORNA: Minuto de inicio o None si el día está lleno
+    """
+    # Ventana redondeada hacia adentro: el inicio (y 'desde', para no ofrecer un
+    # bloque ya iniciado) hacia arriba y el fin hacia abajo
+    inicio = _bloque_arriba(max(horario.inicio, desde)) * RESOLUCION_MINUTOS
+    fin = horario.fin // RESOLUCION_MINUTOS * RESOLUCION_MINUTOS
+    libre = mascara_bloques(inicio, fin) & ~ocupado
+
+    # Bit j queda encendido solo si los bloques j..j+k-1 están libres
+    k = -(-duracion // RESOLUCION_MINUTOS)
+    tramo = 1
+    while tramo < k and libre:
+        desplazamiento = min(tramo, k - tramo)
+        libre &= libre >> desplazamiento
+        tramo += desplazamiento
+
+    candidatos = libre & mascara_grilla(horario.inicio, horario.fin, paso)
+    if not candidatos:
+        return None
+    return ((candidatos & -candidatos).bit_length() - 1) * RESOLUCION_MINUTOS
+
+
+def buscar_primeros_huecos(medicos, mapas, fechas, duracion=30, paso=30, limite=10, desde=None):
+    """
+    FUNCIÓN: Ranking de los primeros horarios libres (uno por médico)
+
+    PARÁMETROS:
+    - medicos: Lista de (medico_id, HorarioMedico)
+    - mapas: Resultado de construir_mapas()
+    - fechas: Fechas ordenadas a revisar
+    - desde: (fecha, minuto) opcional; antes de eso no se ofrece nada
+
+    RETORNA: Lista ordenada de (fecha, minuto, medico_id), máximo 'limite'
+    """
+    resultados = []
+    for medico_id, horario in medicos:
+        for fecha in fechas:
+            if not horario.trabaja(fecha):
+                continue
+            minimo = 0
+            if desde:
+                if fecha < desde[0]:
+                    continue
+                if fecha == desde[0]:
+                    minimo = desde[1]
+            minuto = primer_hueco(mapas.get((medico_id, fecha), 0), horario, duracion, paso, minimo)
+            if minuto is not None:
+                resultados.append((fecha, minuto, medico_id))
+                break  # Solo el primer hueco de cada médico
+
+    resultados.sort()
+    return resultados[:limite]
+
+
+def primeros_disponibles(fecha_inicio, fecha_fin, especialidad=None, duracion=30,
+                         paso=30, limite=10, desde=None):
+    """
+    FUNCIÓN PRINCIPAL: Primeros horarios libres de todos los médicos activos
+
+    PARÁMETROS:
+    - fecha_inicio / fecha_fin: Rango de búsqueda (inclusive)
+    - especialidad: ID o nombre de especialidad (opcional)
+    - desde: (fecha, minuto) para no ofrecer horarios ya pasados
+
+    CONSULTAS: 2 (médicos con especialidad + todas las citas activas del rango)
+
+    RETORNA: Lista de diccionarios listos para JSON
+    """
+    medicos_qs = Medico.objects.filter(
+        user__role=2, user__is_active=True
+    ).select_related('user', 'especialidad')
+
+    if especialidad:
+        if str(especialidad).isdigit():
+            medicos_qs = medicos_qs.filter(especialidad_id=int(especialidad))
+        else:
+            medicos_qs = medicos_qs.filter(especialidad__nombre__iexact=especialidad)
+
+    info = {}
+    medicos = []
+    for m in medicos_qs:
+        info[m.user_id] = (
+            m.user.get_full_name() or m.user.username,
+            m.especialidad.nombre if m.especialidad else '',
+        )
+        medicos.append((m.user_id, HorarioMedico(m.horario_inicio, m.horario_fin, m.dias_laborales)))
+
+    if not medicos:
+        return []
+
+    filas = Cita.objects.filter(
+        medico_id__in=list(info),
+        fecha__range=[fecha_inicio, fecha_fin],
+        estado__in=ESTADOS_ACTIVOS,
+    ).values_list('medico_id', 'fecha', 'hora', 'duracion')
+
+    mapas = construir_mapas(filas)
+    dias = (fecha_fin - fecha_inicio).days + 1
+    ranking = buscar_primeros_huecos(
+        medicos, mapas, rango_fechas(fecha_inicio, dias), duracion, paso, limite, desde
+    )
+
+    return [
+        {
+            'medico_id': medico_id,
+            'medico_nombre': info[medico_id][0],
+            'especialidad': info[medico_id][1],
+            'fecha': fecha.isoformat(),
+            'hora': a_texto(minuto),
+        }
+        for fecha, minuto, medico_id in ranking
+    ]
@@ -0,0 +1,181 @@
+# clinica_app/eventos.py
+
+"""
+=== EVENTOS DE CITAS EN TIEMPO REAL (PUBLICAR / SUSCRIBIR) ===
+
+PROPÓSITO PRINCIPAL:
+- Avisar a médicos y administradores cuando se agenda, cancela o cambia
+  el estado de una cita, sin que tengan que recargar home.html o calendar.html
+- Las vistas publican (código síncrono); eventos_citas_view entrega los
+  eventos por Server-Sent Events (código asíncrono, requiere ASGI)
+
+CANALES:
+- medico:<id>  → eventos de las citas de ese médico
+- admin        → todos los eventos
+
+BROKERS (settings.EVENTOS_BROKER):
+- BrokerMemoria: dentro del proceso; suficiente con UN solo worker ASGI
+- BrokerRedis: Redis pub/sub (requiere el paquete redis); con varios workers
+  el evento publicado en uno llega a los suscriptores de todos
+
+FORMATO DEL EVENTO:
+    {"tipo": "creada" | "cancelada" | "estado", "id": 15, "fecha": "2025-09-26",
+     "hora": "10:00:00", "estado": "PENDIENTE", "medico_id": 6, "paciente_id": 9}
+
+IMPORTANTE: Un evento es solo un aviso. El cliente vuelve a pedir los datos
+(api_calendario con 'since'), así un evento perdido se corrige en el
+siguiente sondeo.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CANAL_ADMIN = 'admin'
+
+
+def canal_medico(medico_id):
+    return f"medico:{medico_id}"
+
+
+def canales_usuario(usuario):
+    """Canales que puede escuchar el usuario (pacientes: ninguno)."""
+    if usuario.is_admin:
+        return [CANAL_ADMIN]
+    if usuario.is_medico:
+        return [canal_medico(usuario.id)]
+    return []
+
+
+class BrokerMemoria:
+    """
+    CLASE: Broker dentro del proceso
+
+    PROPÓSITO:
+    - Cada suscriptor es una asyncio.Queue de su propio event loop
+    - publicar() puede llamarse desde cualquier hilo (las vistas síncronas
+      corren en el thread pool de ASGI): se entrega con call_soon_threadsafe
+    """
+
+    def __init__(self, maximo_cola=100):
+        self.maximo_cola = maximo_cola
+        self._suscriptores = {}  # canal -> {(loop, cola)}
+        self._lock = threading.Lock()
+
+    def publicar(self, canal, evento):
+        with self._lock:
+            destinos = list(self._suscriptores.get(canal, ()))
+        for loop, cola in destinos:
+            try:
+                loop.call_soon_threadsafe(self._entregar, cola, evento)
+            except RuntimeError:
+                pass  # El loop del suscriptor ya se cerró
+
+    @staticmethod
+    def _entregar(cola, evento):
+        if not cola.full():
+            cola.put_nowait(evento)  # Un cliente lento pierde eventos, no bloquea
+
+    async def escuchar(self, canales):
+        """Generador asíncrono de eventos de los canales dados."""
+        entrada = (asyncio.get_running_loop(), asyncio.Queue(self.maximo_cola))
+        with self._lock:
+            for canal in canales:
+                self._suscriptores.setdefault(canal, set()).add(entrada)
+        try:
+            while True:
+                yield await entrada[1].get()
+        finally:
+            with self._lock:
+                for canal in canales:
+                    suscriptores = self._suscriptores.get(canal)
+                    if suscriptores is not None:
+                        suscriptores.discard(entrada)
+                        if not suscriptores:
+                            del self._suscriptores[canal]
+
+
+class BrokerRedis:
+    """
+    CLASE: Broker sobre Redis pub/sub (varios workers o servidores)
+
+    CONFIGURACIÓN: settings.EVENTOS_REDIS_URL (ej: redis://localhost:6379/0)
+    """
+
+    def __init__(self, url=None, prefijo='clinica:eventos:'):
+        import redis  # Dependencia opcional: solo si se elige este broker
+
+        self._redis = redis
+        self.url = url or getattr(settings, 'EVENTOS_REDIS_URL', 'redis://localhost:6379/0')
+        self.prefijo = prefijo
+        self._cliente = redis.Redis.from_url(self.url)
+
+    def publicar(self, canal, evento):
+        self._cliente.publish(self.prefijo + canal, json.dumps(evento))
+
+    async def escuchar(self, canales):
+        cliente = self._redis.asyncio.Redis.from_url(self.url)
+        pubsub = cliente.pubsub()
+        await pubsub.subscribe(*[self.prefijo + canal for canal in canales])
+        try:
+            async for mensaje in pubsub.listen():
+                if mensaje['type'] == 'message':
+                    yield json.loads(mensaje['data'])
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+            await cliente.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    """Instancia única del broker configurado en EVENTOS_BROKER."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                ruta = getattr(settings, 'EVENTOS_BROKER', 'clinica_app.eventos.BrokerMemoria')
+                _broker = import_string(ruta)()
+    return _broker
+
+
+def publicar_cita(tipo, cita):
+    """
+    FUNCIÓN: Publica un evento de cita al médico de la cita y a los admins
+
+    PARÁMETROS:
+    - tipo: 'creada', 'cancelada' o 'estado'
+    - cita: Cita (o cualquier objeto con id, fecha, hora, estado, medico_id, paciente_id)
+
+    IMPORTANTE: Se envía al confirmar la transacción; un fallo del broker se
+    registra y nunca interrumpe la vista que hizo el cambio
+    """
+    evento = {
+        'tipo': tipo,
+        'id': cita.id,
+        'fecha': str(cita.fecha),
+        'hora': str(cita.hora),
+        'estado': cita.estado,
+        'medico_id': cita.medico_id,
+        'paciente_id': cita.paciente_id,
+    }
+
+    def enviar():
+        try:
+            broker = obtener_broker()
+            broker.publicar(canal_medico(cita.medico_id), evento)
+            broker.publicar(CANAL_ADMIN, evento)
+        except Exception:
+            logger.exception('No se pudo publicar el evento de la cita %s', cita.id)
+
+    transaction.on_commit(enviar)
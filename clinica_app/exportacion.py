@@ -0,0 +1,136 @@
+# clinica_app/exportacion.py
+
+"""
+=== EXPORTACIÓN EN STREAMING DEL HISTORIAL DE CITAS ===
+
+PROPÓSITO PRINCIPAL:
+- Entregar a auditoría TODO el historial de citas con nombres de paciente y médico
+- Formatos CSV y JSONL (un objeto JSON por línea)
+- Memoria constante sin importar cuántas filas haya
+
+CÓMO SE LOGRA:
+- Cursor del lado del servidor (SSCursor de MySQLdb): las filas llegan de MySQL
+  a medida que se leen, no todas juntas en memoria del proceso
+- fetchmany() por lotes y generadores: cada lote se formatea y se entrega
+- StreamingHttpResponse (web) o escritura directa a archivo (comando)
+
+CONSULTA: la misma del admin en historial_citas_view (historial.SELECT_ADMIN)
+
+RÉPLICA: La consulta va a replicas.alias_lectura() (la réplica en requests
+GET o dentro de usar_replica()). Como StreamingHttpResponse itera DESPUÉS de
+que el middleware terminó, la vista resuelve el alias antes y lo pasa.
+"""
+
+import csv
+import json
+from contextlib import contextmanager
+from datetime import time, timedelta
+
+from django.db import connections
+
+from .historial import SELECT_ADMIN, construir_consulta
+from .replicas import alias_lectura
+
+COLUMNAS_EXPORTACION = (
+    'id', 'fecha', 'hora', 'duracion', 'estado', 'motivo',
+    'medico_id', 'paciente_id', 'paciente_nombre', 'medico_nombre',
+)
+
+
+@contextmanager
+def cursor_streaming(alias=None):
+    """
+    GESTOR DE CONTEXTO: Cursor que no carga el resultado completo en memoria
+
+    - MySQL: SSCursor sobre la conexión nativa de Django
+    - Otros motores (SQLite en desarrollo): cursor normal + fetchmany
+    - alias: Base de datos; por defecto replicas.alias_lectura()
+    """
+    connection = connections[alias or alias_lectura()]
+    if connection.vendor == 'mysql':
+        from MySQLdb.cursors import SSCursor
+
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(SSCursor)
+        try:
+            yield cursor
+        finally:
+            cursor.close()  # Descarta filas pendientes y libera la conexión
+    else:
+        with connection.cursor() as cursor:
+            yield cursor
+
+
+def filas_historial(usuario=None, filtros=None, lote=2000, alias=None):
+    """
+    GENERADOR: Lotes de filas del historial (tuplas en el orden de COLUMNAS_EXPORTACION)
+
+    PARÁMETROS:
+    - usuario: request.user para limitar por rol; None = todas las citas
+    - filtros: Mismo formato que historial.leer_filtros()
+    - lote: Filas pedidas al servidor por cada fetchmany()
+    - alias: Base de datos (ver cursor_streaming)
+    """
+    sql, params = construir_consulta(usuario, filtros or {}, select=SELECT_ADMIN)
+    with cursor_streaming(alias) as cursor:
+        cursor.execute(sql, params)
+        while True:
+            filas = cursor.fetchmany(lote)
+            if not filas:
+                break
+            yield filas
+
+
+def _texto_hora(valor):
+    """'HH:MM:SS' tanto para time como para el timedelta que devuelve MySQLdb."""
+    if isinstance(valor, timedelta):
+        segundos = int(valor.total_seconds())
+        return f"{segundos // 3600:02d}:{segundos % 3600 // 60:02d}:{segundos % 60:02d}"
+    if isinstance(valor, time):
+        return valor.strftime('%H:%M:%S')
+    return valor
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: write() devuelve el texto en lugar de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(lotes):
+    """
+    GENERADOR: Texto CSV por lotes (encabezado + una línea por cita)
+
+    Cada yield contiene un lote completo: menos llamadas que una por fila
+    """
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS_EXPORTACION)
+    indice_hora = COLUMNAS_EXPORTACION.index('hora')
+    for filas in lotes:
+        partes = []
+        for fila in filas:
+            fila = list(fila)
+            fila[indice_hora] = _texto_hora(fila[indice_hora])
+            partes.append(escritor.writerow(fila))
+        yield ''.join(partes)
+
+
+def generar_jsonl(lotes):
+    """GENERADOR: JSON Lines por lotes (un objeto por cita y por línea)."""
+    indice_hora = COLUMNAS_EXPORTACION.index('hora')
+    for filas in lotes:
+        partes = []
+        for fila in filas:
+            fila = list(fila)
+            fila[indice_hora] = _texto_hora(fila[indice_hora])
+            partes.append(json.dumps(
+                dict(zip(COLUMNAS_EXPORTACION, fila)), ensure_ascii=False, default=str
+            ))
+        yield '\n'.join(partes) + '\n'
+
+
+FORMATOS = {
+    'csv': (generar_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (generar_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
@@ -0,0 +1,63 @@
+# clinica_app/hashers.py
+
+"""
+=== HASHERS DE CONTRASEÑA CON COSTO CONFIGURABLE ===
+
+PROPÓSITO PRINCIPAL:
+- Permitir elegir el algoritmo de hash (política) desde settings.py
+- Ajustar el costo (work factor) sin tocar código
+- Reaprovechar el "upgrade" automático de Django: si el hash guardado usa otro
+  algoritmo u otro costo, SPAuthBackend lo regenera en el siguiente login
+
+PROBLEMA QUE RESUELVE:
+- Todos los logins usaban pbkdf2_sha256 con las iteraciones por defecto de Django
+- En el cambio de turno el CPU de los servidores web se saturaba
+
+POLÍTICAS (settings.HASH_POLITICA):
+- 'pbkdf2': PBKDF2-SHA256, costo = HASH_PBKDF2_ITERACIONES
+- 'scrypt': scrypt de hashlib (sin dependencias), costo = HASH_SCRYPT_N
+- 'argon2': Argon2id (requiere argon2-cffi), costo = HASH_ARGON2_*
+- 'auto':   argon2 si está instalado, si no pbkdf2
+
+IMPORTANTE: Los algoritmos conservan su nombre estándar de Django
+("pbkdf2_sha256", "scrypt", "argon2"), así los hashes existentes siguen siendo
+válidos y solo cambia el costo con el que se generan los nuevos.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+)
+
+
+class ClinicaPBKDF2Hasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 con iteraciones tomadas de HASH_PBKDF2_ITERACIONES."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'HASH_PBKDF2_ITERACIONES', PBKDF2PasswordHasher.iterations)
+
+
+class ClinicaScryptHasher(ScryptPasswordHasher):
+    """scrypt con factor de trabajo N tomado de HASH_SCRYPT_N (potencia de 2)."""
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'HASH_SCRYPT_N', ScryptPasswordHasher.work_factor)
+
+
+class ClinicaArgon2Hasher(Argon2PasswordHasher):
+    """Argon2id con tiempo, memoria y paralelismo tomados de HASH_ARGON2_*."""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'HASH_ARGON2_TIEMPO', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'HASH_ARGON2_MEMORIA_KB', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'HASH_ARGON2_PARALELISMO', Argon2PasswordHasher.parallelism)
+
@@ -0,0 +1,211 @@
+# clinica_app/historial.py
+
+"""
+=== CONSULTAS DEL HISTORIAL DE CITAS (PAGINACIÓN POR CLAVE) ===
+
+PROPÓSITO PRINCIPAL:
+- Centralizar las consultas SQL del historial por rol (paciente, médico, admin)
+- Paginar con "keyset" (seek) sobre (fecha, hora, id) en lugar de OFFSET
+- Filtrar en el servidor por estado, médico y rango de fechas
+- Representar cada fila con un objeto liviano (__slots__) en vez de un dict
+
+PROBLEMA QUE RESUELVE:
+- historial_citas_view hacía SELECT sin límite + fetchall() + un dict por fila
+- Con años de citas era la página más lenta y el mayor pico de memoria
+
+PAGINACIÓN POR CLAVE:
+- Orden: fecha DESC, hora DESC, id DESC (id desempata citas a la misma hora)
+- La página siguiente pide "filas estrictamente menores que la última vista"
+- El costo es el mismo en la página 1 que en la página 1000 (OFFSET no)
+"""
+
+from datetime import date, datetime, time
+
+from .models import Cita
+
+# ========== CONSULTAS POR ROL ==========
+# SELECT + JOINs de cada rol — los mismos que usaba la vista
+
+SELECT_PACIENTE = """
+    SELECT
+        c.id, c.fecha, c.hora, c.duracion, c.estado, c.motivo,
+        c.medico_id,
+        CONCAT(um.first_name, ' ', um.last_name) AS medico_nombre,
+        e.nombre AS especialidad
+    FROM citas c
+    INNER JOIN auth_user_custom um ON c.medico_id = um.id
+    LEFT JOIN medicos m ON um.id = m.user_id
+    LEFT JOIN especialidades e ON m.especialidad_id = e.id
+"""
+
+SELECT_MEDICO = """
+    SELECT
+        c.id, c.fecha, c.hora, c.duracion, c.estado, c.motivo,
+        c.medico_id,
+        CONCAT(up.first_name, ' ', up.last_name) AS paciente_nombre,
+        up.phone AS paciente_telefono
+    FROM citas c
+    INNER JOIN auth_user_custom up ON c.paciente_id = up.id
+"""
+
+SELECT_ADMIN = """
+    SELECT
+        c.id, c.fecha, c.hora, c.duracion, c.estado, c.motivo,
+        c.medico_id, c.paciente_id,
+        CONCAT(up.first_name, ' ', up.last_name) AS paciente_nombre,
+        CONCAT(um.first_name, ' ', um.last_name) AS medico_nombre
+    FROM citas c
+    INNER JOIN auth_user_custom up ON c.paciente_id = up.id
+    INNER JOIN auth_user_custom um ON c.medico_id = um.id
+"""
+
+ORDEN = " ORDER BY c.fecha DESC, c.hora DESC, c.id DESC"
+
+ESTADOS_VALIDOS = {estado for estado, _ in Cita.ESTADOS}
+
+
+class FilaCita:
+    """
+    CLASE: Fila del historial con atributos fijos (__slots__)
+
+    PROPÓSITO:
+    - Ocupa mucho menos memoria que un dict por fila
+    - Los templates la usan igual: {{ cita.fecha }}, {{ cita.medico_nombre }}
+    - Los campos que el rol no consulta quedan en None
+    """
+
+    __slots__ = (
+        'id', 'fecha', 'hora', 'duracion', 'estado', 'motivo', 'observaciones',
+        'medico_id', 'paciente_id', 'medico_nombre', 'paciente_nombre',
+        'paciente_telefono', 'especialidad',
+    )
+
+    def __init__(self, columnas, fila):
+        for campo in self.__slots__:
+            setattr(self, campo, None)
+        for campo, valor in zip(columnas, fila):
+            setattr(self, campo, valor)
+
+
+def leer_filtros(params):
+    """
+    FUNCIÓN: Extrae y valida los filtros del querystring
+
+    PARÁMETROS GET:
+    - estado: PENDIENTE / CONFIRMADA / CANCELADA / COMPLETADA
+    - medico: ID del médico
+    - desde / hasta: YYYY-MM-DD (inclusive)
+
+    RETORNA: dict solo con los filtros válidos (valores inválidos se ignoran)
+    """
+    filtros = {}
+    estado = params.get('estado', '')
+    if estado in ESTADOS_VALIDOS:
+        filtros['estado'] = estado
+    if str(params.get('medico', '')).isdigit():
+        filtros['medico'] = int(params['medico'])
+    for campo in ('desde', 'hasta'):
+        try:
+            filtros[campo] = date.fromisoformat(params.get(campo, ''))
+        except ValueError:
+            pass
+    return filtros
+
+
+def codificar_cursor(fila):
+    """Token de la última fila vista: 'YYYY-MM-DD_HH:MM:SS_id'."""
+    hora = fila.hora
+    if not isinstance(hora, time):
+        hora = (datetime.min + hora).time()  # MySQLdb puede devolver timedelta
+    return f"{fila.fecha.isoformat()}_{hora.strftime('%H:%M:%S')}_{fila.id}"
+
+
+def decodificar_cursor(token):
+    """Inverso de codificar_cursor(); retorna None si el token es inválido."""
+    try:
+        fecha, hora, cita_id = token.split('_')
+        return date.fromisoformat(fecha), time.fromisoformat(hora), int(cita_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def construir_consulta(usuario, filtros, despues=None, limite=None, select=None):
+    """
+    FUNCIÓN: Arma el SQL del historial según rol, filtros y cursor
+
+    PARÁMETROS:
+    - usuario: request.user (define el rol y la condición base);
+      None = sin restricción de rol (exportaciones desde la terminal)
+    - filtros: Resultado de leer_filtros()
+    - despues: (fecha, hora, id) de la última fila vista, o None
+    - limite: LIMIT a aplicar (None = sin límite, ej: exportaciones)
+    - select: SELECT ... FROM alternativo (por defecto el del rol)
+
+    RETORNA: (sql, params)
+    """
+    condiciones = []
+    params = []
+
+    if usuario is None:
+        select = select or SELECT_ADMIN
+    elif usuario.is_paciente:
+        select = select or SELECT_PACIENTE
+        condiciones.append("c.paciente_id = %s")
+        params.append(usuario.id)
+    elif usuario.is_medico:
+        select = select or SELECT_MEDICO
+        condiciones.append("c.medico_id = %s")
+        params.append(usuario.id)
+    else:
+        select = select or SELECT_ADMIN
+
+    if 'estado' in filtros:
+        condiciones.append("c.estado = %s")
+        params.append(filtros['estado'])
+    if 'medico' in filtros and not (usuario is not None and usuario.is_medico):
+        condiciones.append("c.medico_id = %s")
+        params.append(filtros['medico'])
+    if 'desde' in filtros:
+        condiciones.append("c.fecha >= %s")
+        params.append(filtros['desde'])
+    if 'hasta' in filtros:
+        condiciones.append("c.fecha <= %s")
+        params.append(filtros['hasta'])
+
+    if despues:
+        # Equivalente a (fecha, hora, id) < (f, h, i) escrito para que use índices
+        fecha, hora, cita_id = despues
+        condiciones.append(
+            "(c.fecha < %s OR (c.fecha = %s AND (c.hora < %s OR (c.hora = %s AND c.id < %s))))"
+        )
+        params.extend([fecha, fecha, hora, hora, cita_id])
+
+    sql = select
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += ORDEN
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite)
+    return sql, params
+
+
+def pagina_historial(cursor, usuario, filtros, despues=None, por_pagina=50):
+    """
+    FUNCIÓN: Una página del historial
+
+    PROPÓSITO:
+    - Pide por_pagina + 1 filas: la extra solo indica si hay página siguiente
+
+    RETORNA: (lista de FilaCita, token de la página siguiente o None)
+    """
+    sql, params = construir_consulta(usuario, filtros, despues, por_pagina + 1)
+    cursor.execute(sql, params)
+    columnas = [col[0] for col in cursor.description]
+    filas = [FilaCita(columnas, fila) for fila in cursor.fetchall()]
+
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        siguiente = codificar_cursor(filas[-1])
+    return filas, siguiente
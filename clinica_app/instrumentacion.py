@@ -0,0 +1,195 @@
+# clinica_app/instrumentacion.py
+
+"""
+=== INSTRUMENTACIÓN POR REQUEST (CONSULTAS SQL, TIEMPOS Y N+1) ===
+
+PROPÓSITO PRINCIPAL:
+- Saber cuántas consultas SQL emite cada vista y cuánto tardan
+- Medir el tiempo de render de templates y de envío/encolado de correos
+- Exponerlo en el header Server-Timing (visible en DevTools → Network → Timing)
+  y en una línea de log JSON por request
+- Detectar patrones N+1: la misma forma de SQL repetida más de
+  INSTRUMENTACION_N_MAS_1 veces en un request (ej: get_full_name() de cada
+  cita sin select_related)
+
+ACTIVACIÓN (settings.py):
+- INSTRUMENTACION_ACTIVA = True (o variable de entorno CLINICA_INSTRUMENTACION=1)
+- Desactivada, Django descarta el middleware al arrancar (costo cero)
+
+CÓMO MIDE:
+- SQL: connection.execute_wrapper() en todas las conexiones del request
+- Templates: se envuelve una vez Template.render del backend de Django
+  (solo el render de nivel superior; los {% include %} quedan dentro)
+- Correos: correos.encolar_correo() usa medir('correo')
+
+LIMITACIÓN: Las respuestas en streaming (exportaciones, SSE) consultan la BD
+después de que el middleware terminó; esas consultas no se cuentan.
+"""
+
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Medición del request en curso (None fuera de un request instrumentado)
+_medicion = contextvars.ContextVar('medicion_request', default=None)
+
+# Listas IN (%s, %s, ...) de largo variable → una sola forma
+_LISTA_IN = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMEROS = re.compile(r'\b\d+\b')
+_TEXTOS = re.compile(r"'(?:[^'\\]|\\.)*'")
+
+
+def forma_sql(sql):
+    """Normaliza un SQL para agrupar consultas iguales con distintos valores."""
+    sql = _TEXTOS.sub('?', sql)
+    sql = _NUMEROS.sub('?', sql)
+    sql = _LISTA_IN.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+class Medicion:
+    """
+    CLASE: Acumulador de un request
+
+    - tiempos: {'db': s, 'plantilla': s, 'correo': s}
+    - formas: Counter de formas de SQL (para detectar N+1)
+    """
+
+    __slots__ = ('inicio', 'consultas', 'tiempos', 'formas')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempos = {'db': 0.0, 'plantilla': 0.0, 'correo': 0.0}
+        self.formas = Counter()
+
+    def repetidas(self, umbral):
+        """Formas de SQL ejecutadas más de 'umbral' veces: [(forma, veces), ...]."""
+        return [(forma, veces) for forma, veces in self.formas.most_common() if veces > umbral]
+
+
+@contextmanager
+def medir(tipo):
+    """
+    FUNCIÓN: Suma el tiempo del bloque a la medición del request (si hay una)
+
+    USO:
+        with medir('correo'):
+            send_mail(...)
+    """
+    medicion = _medicion.get()
+    if medicion is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion.tiempos[tipo] = medicion.tiempos.get(tipo, 0.0) + time.perf_counter() - inicio
+
+
+def _registrar_sql(execute, sql, params, many, context):
+    """execute_wrapper: cuenta, cronometra y agrupa cada consulta."""
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.tiempos['db'] += time.perf_counter() - inicio
+        medicion.consultas += 1
+        medicion.formas[forma_sql(sql)] += 1
+
+
+_plantillas_instrumentadas = False
+
+
+def _instrumentar_plantillas():
+    """Envuelve una sola vez el render del backend de templates de Django."""
+    global _plantillas_instrumentadas
+    if _plantillas_instrumentadas:
+        return
+    from django.template.backends.django import Template
+
+    render_original = Template.render
+
+    def render(self, context=None, request=None):
+        with medir('plantilla'):
+            return render_original(self, context, request)
+
+    Template.render = render
+    _plantillas_instrumentadas = True
+
+
+# Forma de SQL → máximo de repeticiones vistas, por nombre de vista (en este proceso)
+patrones_n_mas_1 = {}
+
+
+class InstrumentacionMiddleware:
+    """
+    MIDDLEWARE: Mide cada request y agrega Server-Timing + log estructurado
+
+    HEADER DE EJEMPLO:
+        Server-Timing: db;dur=12.4;desc="9 consultas", plantilla;dur=30.1,
+                       correo;dur=0.0, total;dur=55.2
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION_ACTIVA', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.umbral = getattr(settings, 'INSTRUMENTACION_N_MAS_1', 5)
+        _instrumentar_plantillas()
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(_registrar_sql))
+                response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+
+        total = time.perf_counter() - medicion.inicio
+        vista = getattr(request.resolver_match, 'view_name', None) or request.path
+        repetidas = medicion.repetidas(self.umbral)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={medicion.tiempos["db"] * 1000:.1f};desc="{medicion.consultas} consultas"',
+            f'plantilla;dur={medicion.tiempos["plantilla"] * 1000:.1f}',
+            f'correo;dur={medicion.tiempos["correo"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        logger.info(json.dumps({
+            'vista': vista,
+            'metodo': request.method,
+            'ruta': request.path,
+            'status': response.status_code,
+            'consultas': medicion.consultas,
+            'db_ms': round(medicion.tiempos['db'] * 1000, 1),
+            'plantilla_ms': round(medicion.tiempos['plantilla'] * 1000, 1),
+            'correo_ms': round(medicion.tiempos['correo'] * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+            'n_mas_1': len(repetidas),
+        }, ensure_ascii=False))
+
+        for forma, veces in repetidas:
+            vistos = patrones_n_mas_1.setdefault(vista, {})
+            vistos[forma] = max(veces, vistos.get(forma, 0))
+            logger.warning('Posible N+1 en %s: %d veces → %s', vista, veces, forma[:300])
+
+        return response
@@ -0,0 +1,55 @@
+# clinica_app/management/commands/actualizar_resumen.py
+
+"""
+COMANDO: Actualiza la tabla resumen citas_resumen_diario (ver reportes.py)
+
+USO:
+    python manage.py actualizar_resumen                          # Incremental
+    python manage.py actualizar_resumen --completo               # Reconstruir todo
+    python manage.py actualizar_resumen --completo --desde 2025-01-01
+
+PROGRAMACIÓN SUGERIDA (cron, cada minuto):
+    * * * * * cd /ruta/proyecto && python manage.py actualizar_resumen
+
+La corrida incremental solo recalcula los días de los médicos con citas
+modificadas desde la última vez; si no hubo cambios cuesta una consulta.
+"""
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinica_app.reportes import refrescar_resumen
+
+
+class Command(BaseCommand):
+    help = 'Actualiza citas_resumen_diario desde citas.updated_at (incremental o completo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Reconstruir en lugar de actualizar solo lo modificado')
+        parser.add_argument('--desde', help='Con --completo: reconstruir solo desde YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            if not options['completo']:
+                raise CommandError('--desde solo se usa junto con --completo')
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('--desde debe tener formato YYYY-MM-DD')
+
+        inicio = time.perf_counter()
+        resultado = refrescar_resumen(completo=options['completo'], desde=desde)
+        segundos = time.perf_counter() - inicio
+
+        if resultado['modo'] == 'completo':
+            detalle = f"{resultado['filas']} fila(s) de resumen reconstruidas"
+        else:
+            detalle = f"{resultado['dias']} día(s)-médico recalculados"
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumen {resultado['modo']}: {detalle} en {segundos:.2f} s "
+            f"(al día hasta {resultado['marca'] or 'sin citas'})"
+        ))
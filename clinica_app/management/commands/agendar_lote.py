@@ -0,0 +1,86 @@
+# clinica_app/management/commands/agendar_lote.py
+
+"""
+COMANDO: Agenda citas en lote desde un CSV o una serie recurrente
+
+USO:
+    # CSV con encabezado: paciente_id,medico_id,fecha,hora[,duracion,motivo]
+    python manage.py agendar_lote --csv citas.csv
+    python manage.py agendar_lote --csv citas.csv --simular
+
+    # Fototerapia semanal por 12 semanas
+    python manage.py agendar_lote --paciente 9 --medico 6 --fecha 2025-10-06 \\
+        --hora 09:00 --veces 12 --frecuencia semanal --motivo "Fototerapia"
+
+Todo el lote se valida contra las citas existentes en una sola consulta; las
+filas con conflicto se reportan y el resto se inserta (ver reservas.py).
+Se envía un correo resumen por paciente y por médico.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinica_app.cache_calendario import invalidar_cita
+from clinica_app.eventos import publicar_cita
+from clinica_app.reservas import FRECUENCIAS, agendar_lote, generar_serie, leer_csv, notificar_lote
+
+
+class Command(BaseCommand):
+    help = 'Agenda citas en lote (CSV o serie recurrente) con un correo resumen por persona'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', help='Archivo CSV de citas')
+        parser.add_argument('--paciente', type=int, help='Serie: ID del paciente')
+        parser.add_argument('--medico', type=int, help='Serie: ID del médico')
+        parser.add_argument('--fecha', help='Serie: primera fecha YYYY-MM-DD')
+        parser.add_argument('--hora', help='Serie: hora HH:MM')
+        parser.add_argument('--veces', type=int, default=1, help='Serie: cantidad de citas')
+        parser.add_argument('--frecuencia', choices=sorted(FRECUENCIAS), default='semanal')
+        parser.add_argument('--intervalo', type=int, default=1,
+                            help='Serie: cada cuántos días/semanas/meses')
+        parser.add_argument('--duracion', type=int, default=30, help='Minutos de cada cita')
+        parser.add_argument('--motivo', default='')
+        parser.add_argument('--simular', action='store_true', help='Solo validar, no insertar')
+        parser.add_argument('--sin-correos', action='store_true', help='No encolar correos resumen')
+
+    def handle(self, *args, **options):
+        rechazadas = []
+        try:
+            if options['csv']:
+                with open(options['csv'], newline='', encoding='utf-8') as archivo:
+                    solicitudes, rechazadas = leer_csv(archivo)
+            elif all(options[c] for c in ('paciente', 'medico', 'fecha', 'hora')):
+                solicitudes = generar_serie(
+                    options['paciente'], options['medico'], options['fecha'], options['hora'],
+                    options['veces'], options['frecuencia'], options['intervalo'],
+                    options['duracion'], options['motivo'],
+                )
+            else:
+                raise CommandError('Use --csv o --paciente/--medico/--fecha/--hora')
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        resultado = agendar_lote(solicitudes, simular=options['simular'])
+        creadas = resultado['creadas']
+        rechazadas = sorted(rechazadas + resultado['rechazadas'], key=lambda r: r['fila'])
+
+        for rechazo in rechazadas:
+            self.stdout.write(self.style.WARNING(f"Fila {rechazo['fila']}: {rechazo['motivo']}"))
+
+        if options['simular']:
+            validas = len(solicitudes) - len(resultado['rechazadas'])
+            self.stdout.write(f"Simulación: {validas} válidas, {len(rechazadas)} rechazadas")
+            return
+
+        if creadas:
+            if not options['sin_correos']:
+                notificar_lote(creadas)
+            for medico_id, paciente_id, fecha in {
+                (c.medico_id, c.paciente_id, c.fecha.replace(day=1)) for c in creadas
+            }:
+                invalidar_cita(medico_id, paciente_id, fecha)
+            for cita in creadas:
+                publicar_cita('creada', cita)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(creadas)} cita(s) creadas, {len(rechazadas)} rechazada(s)"
+        ))
@@ -0,0 +1,111 @@
+# clinica_app/management/commands/bench_analitica.py
+
+"""
+COMANDO: Benchmark de la analítica con NumPy sobre citas sintéticas (sin base de datos)
+
+USO:
+    python manage.py bench_analitica
+    python manage.py bench_analitica --citas 5000000 --medicos 300 --dias 1095
+
+MIDE: Tiempo de analitica.calcular() + resumen() sobre arreglos sintéticos con
+la forma que entrega cargar_citas(), y como referencia el mismo agrupamiento
+(minutos por médico × día × hora y conteos por estado) con bucles de Python
+sobre las primeras --muestra citas, extrapolado al total.
+"""
+
+import resource
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinica_app import analitica
+from clinica_app.disponibilidad import HorarioMedico
+
+
+def datos_sinteticos(citas, medicos, dias, semilla=7):
+    """DatosCitas aleatorios de lunes a viernes, 8:00 a 16:45 (sin evitar solapes)."""
+    np = analitica.np
+    rnd = np.random.default_rng(semilla)
+    return analitica.DatosCitas(
+        date(2022, 1, 3), dias,
+        medico=rnd.integers(1, medicos + 1, citas, dtype=np.int32),
+        dia=np.minimum(
+            rnd.integers(0, dias // 7 + 1, citas) * 7 + rnd.integers(0, 5, citas), dias - 1
+        ).astype(np.int32),
+        minuto=(rnd.integers(32, 68, citas) * 15).astype(np.int16),
+        duracion=rnd.choice(np.array([15, 30, 45, 60], dtype=np.int16), citas),
+        estado=rnd.choice(
+            np.array([1, 2, 3, 4], dtype=np.int8), citas, p=[0.1, 0.15, 0.15, 0.6]
+        ),
+    )
+
+
+def agrupar_python(datos, n):
+    """El mismo agrupamiento con dicts, para comparar."""
+    minutos, conteos = {}, {}
+    dia_base = datos.inicio.weekday()
+    for medico, dia, minuto, duracion, estado in zip(
+        datos.medico[:n].tolist(), datos.dia[:n].tolist(), datos.minuto[:n].tolist(),
+        datos.duracion[:n].tolist(), datos.estado[:n].tolist(),
+    ):
+        clave = (medico, estado)
+        conteos[clave] = conteos.get(clave, 0) + 1
+        if estado == analitica.CANCELADA:
+            continue
+        dia_semana = (dia_base + dia) % 7
+        fin = minuto + duracion
+        while minuto < fin:
+            hora = minuto // 60
+            tramo = min(fin, (hora + 1) * 60) - minuto
+            celda = (medico, dia_semana, hora)
+            minutos[celda] = minutos.get(celda, 0) + tramo
+            minuto += tramo
+    return minutos, conteos
+
+
+class Command(BaseCommand):
+    help = 'Mide la analítica vectorizada sobre millones de citas sintéticas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citas', type=int, default=5_000_000)
+        parser.add_argument('--medicos', type=int, default=300)
+        parser.add_argument('--dias', type=int, default=1095)
+        parser.add_argument('--muestra', type=int, default=200_000,
+                            help='Citas para la referencia en Python puro (0 = omitir)')
+
+    def handle(self, *args, **options):
+        if not analitica.numpy_disponible():
+            raise CommandError('Este benchmark requiere numpy (pip install numpy)')
+
+        datos = datos_sinteticos(options['citas'], options['medicos'], options['dias'])
+        horarios = {m: HorarioMedico() for m in range(1, options['medicos'] + 1)}
+        hoy = date(2024, 6, 1)  # Citas posteriores cuentan como futuras
+
+        rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        calculo = analitica.calcular(datos, horarios, hoy)
+        t1 = time.perf_counter()
+        segundos_numpy = t1 - t0
+        resultado = analitica.resumen(calculo, {})
+        t2 = time.perf_counter()
+        rss_final = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        self.stdout.write(f"Citas:          {options['citas']:,}")
+        self.stdout.write(f"Médicos:        {len(resultado['medicos'])}")
+        self.stdout.write(f"Días:           {options['dias']}")
+        self.stdout.write(f"calcular():     {segundos_numpy:.2f} s "
+                          f"({options['citas'] / segundos_numpy:,.0f} citas/s)")
+        self.stdout.write(f"resumen():      {t2 - t1:.2f} s")
+        self.stdout.write(f"Utilización:    {resultado['global']['utilizacion']}")
+        # ru_maxrss está en KiB en Linux
+        self.stdout.write(f"RSS máximo:     {rss_final / 1024:.1f} MiB")
+        self.stdout.write(f"Crecimiento:    {(rss_final - rss_inicial) / 1024:.1f} MiB")
+
+        muestra = min(options['muestra'], options['citas'])
+        if muestra:
+            t0 = time.perf_counter()
+            agrupar_python(datos, muestra)
+            segundos = (time.perf_counter() - t0) * options['citas'] / muestra
+            self.stdout.write(f"Python puro:    {segundos:.2f} s estimados "
+                              f"(x{segundos / segundos_numpy:.0f} más lento)")
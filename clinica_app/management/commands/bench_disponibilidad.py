@@ -0,0 +1,110 @@
+# clinica_app/management/commands/bench_disponibilidad.py
+
+"""
+COMANDO: Benchmark del motor de disponibilidad (no toca la base de datos)
+
+USO:
+    python manage.py bench_disponibilidad
+    python manage.py bench_disponibilidad --medicos 50 --dias 90 --citas-dia 12
+
+MIDE:
+- Construcción de bitmaps a partir de filas sintéticas de citas
+- Ranking de primeros huecos (bitmap) para todos los médicos
+- Listado completo de slots por intervalos (el motor de api_citas_disponibles)
+"""
+
+import random
+import time
+from datetime import date, time as dtime
+
+from django.core.management.base import BaseCommand
+
+from clinica_app.disponibilidad import (
+    HorarioMedico, a_minutos, buscar_primeros_huecos, construir_mapas,
+    fusionar_intervalos, generar_slots, rango_fechas, restar_intervalos,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de disponibilidad con médicos × días de citas sintéticas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=50)
+        parser.add_argument('--dias', type=int, default=90)
+        parser.add_argument('--citas-dia', type=int, default=12,
+                            help='Citas promedio por médico y día')
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def _generar(self, medicos, fechas, citas_dia, rnd):
+        """Filas (medico_id, fecha, hora, duracion) sin solapes exactos de inicio."""
+        filas = []
+        for medico_id in range(1, medicos + 1):
+            for fecha in fechas:
+                inicios = rnd.sample(range(8 * 60, 17 * 60, 15), citas_dia)
+                for inicio in inicios:
+                    filas.append((
+                        medico_id, fecha,
+                        dtime(inicio // 60, inicio % 60),
+                        rnd.choice((15, 30, 30, 30, 45, 60)),
+                    ))
+        return filas
+
+    def _medir(self, funcion, repeticiones):
+        """Mejor tiempo en milisegundos de 'repeticiones' ejecuciones."""
+        mejor = None
+        resultado = None
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            resultado = funcion()
+            transcurrido = (time.perf_counter() - t0) * 1000
+            mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+        return mejor, resultado
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        fechas = rango_fechas(date.today(), options['dias'])
+        filas = self._generar(options['medicos'], fechas, options['citas_dia'], rnd)
+        medicos = [
+            (medico_id, HorarioMedico()) for medico_id in range(1, options['medicos'] + 1)
+        ]
+        reps = options['repeticiones']
+
+        self.stdout.write(
+            f"Médicos: {options['medicos']} | Días: {options['dias']} | Citas: {len(filas)}"
+        )
+
+        # 1. BITMAPS
+        t_mapas, mapas = self._medir(lambda: construir_mapas(filas), reps)
+        t_ranking, ranking = self._medir(
+            lambda: buscar_primeros_huecos(medicos, mapas, fechas, 30, 30, 10), reps
+        )
+
+        # 2. INTERVALOS (listado completo de slots de todos los médicos × días)
+        def por_intervalos():
+            crudos = {}
+            for medico_id, fecha, hora, duracion in filas:
+                inicio = a_minutos(hora)
+                crudos.setdefault((medico_id, fecha), []).append((inicio, inicio + duracion))
+            total = 0
+            for medico_id, horario in medicos:
+                for fecha in fechas:
+                    if not horario.trabaja(fecha):
+                        continue
+                    ocupados = fusionar_intervalos(crudos.get((medico_id, fecha), []))
+                    libres = restar_intervalos((horario.inicio, horario.fin), ocupados)
+                    total += len(generar_slots(libres, 30, 30, horario.inicio))
+            return total
+
+        t_intervalos, total_slots = self._medir(por_intervalos, reps)
+
+        self.stdout.write(f"Construir bitmaps:          {t_mapas:8.2f} ms")
+        self.stdout.write(f"Ranking primeros huecos:    {t_ranking:8.2f} ms")
+        self.stdout.write(
+            f"Listado completo (interv.): {t_intervalos:8.2f} ms  ({total_slots} slots)"
+        )
+        if ranking:
+            fecha, minuto, medico_id = ranking[0]
+            self.stdout.write(
+                f"Primer hueco: médico {medico_id} el {fecha} a las {minuto // 60:02d}:{minuto % 60:02d}"
+            )
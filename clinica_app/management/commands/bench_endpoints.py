@@ -0,0 +1,361 @@
+# clinica_app/management/commands/bench_endpoints.py
+
+"""
+COMANDO: Benchmark de las vistas más usadas con el cliente de pruebas de Django
+
+USO:
+    # Siembra datos 'bench_*' (si faltan), mide y guarda la línea base
+    python manage.py bench_endpoints --guardar bench_base.json
+
+    # Después de un cambio: compara contra la línea base (falla si empeora)
+    python manage.py bench_endpoints --base bench_base.json
+
+    python manage.py bench_endpoints --medicos 50 --pacientes 5000 --citas 200000 \\
+        --iteraciones 100 --escenarios home_medico calendario historial
+    python manage.py bench_endpoints --limpiar     # Borra los datos 'bench_*'
+
+QUÉ MIDE (por escenario):
+- Latencia p50/p95/p99 en ms (request completo: middlewares, vista y template)
+- Consultas SQL por request (promedio)
+- Al final, el RSS máximo del proceso y los aciertos de la caché de usuarios
+  (cada acierto es un SELECT a auth_user_custom ahorrado)
+
+BASE DE DATOS:
+- Usa la BD configurada en settings (MariaDB local). Las tablas son
+  managed=False y dependen de stored procedures, por eso no se usa SQLite ni
+  la BD de pruebas de Django
+- Los datos sembrados usan usuarios 'bench_*' con correo @bench.invalid; las
+  citas y correos que crea el escenario agendar_cita se borran al terminar
+
+COMPARACIÓN (--base): Un escenario es regresión si su p95 supera al de la
+línea base en más de --tolerancia (por defecto 20%) o si hace más consultas.
+"""
+
+import json
+import math
+import random
+import resource
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clinica_app.backends import cache_usuarios
+from clinica_app.models import Cita, CustomUser, Especialidad, Medico, Paciente
+
+PREFIJO = 'bench_'
+DOMINIO = 'bench.invalid'
+CLAVE = 'bench-clave-123'
+MOTIVO_PRUEBA = '[bench_endpoints]'
+ESTADOS = ('PENDIENTE',) * 3 + ('CONFIRMADA',) * 3 + ('COMPLETADA',) * 3 + ('CANCELADA',)
+
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Mide p50/p95/p99, consultas por request y RSS de las vistas principales'
+
+    ESCENARIOS = (
+        'login', 'home_medico', 'home_paciente', 'calendario', 'historial',
+        'agendar_cita_form', 'agendar_cita', 'api_citas_disponibles',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=20)
+        parser.add_argument('--pacientes', type=int, default=500)
+        parser.add_argument('--citas', type=int, default=20000)
+        parser.add_argument('--dias', type=int, default=365,
+                            help='Días alrededor de hoy donde se reparten las citas')
+        parser.add_argument('--iteraciones', type=int, default=50)
+        parser.add_argument('--calentamiento', type=int, default=3,
+                            help='Requests descartados por escenario (cachés, imports)')
+        parser.add_argument('--escenarios', nargs='+', choices=self.ESCENARIOS)
+        parser.add_argument('--guardar', help='Escribe los resultados como línea base JSON')
+        parser.add_argument('--base', help='Línea base JSON contra la cual comparar')
+        parser.add_argument('--tolerancia', type=float, default=0.20)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Solo borrar los datos bench_* y salir')
+
+    # ========== DATOS ==========
+
+    def _ids_bench(self, rol):
+        return list(
+            CustomUser.objects.filter(username__startswith=PREFIJO, role=rol)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def _crear_usuarios(self, rol, cantidad, etiqueta, clave):
+        """Crea los usuarios bench que falten del rol y retorna todos sus IDs."""
+        existentes = self._ids_bench(rol)
+        ahora = timezone.now()
+        nuevos = [
+            CustomUser(
+                username=f"{PREFIJO}{etiqueta}{i}", email=f"{etiqueta}{i}@{DOMINIO}",
+                password=clave, first_name=etiqueta.capitalize(), last_name=f"Bench {i:05d}",
+                role=rol, is_active=True, date_joined=ahora, created_at=ahora, updated_at=ahora,
+            )
+            for i in range(len(existentes), cantidad)
+        ]
+        CustomUser.objects.bulk_create(nuevos, batch_size=1000)
+        return self._ids_bench(rol)[:max(cantidad, 1)]
+
+    def _sembrar(self, options, rnd):
+        """Crea admin, médicos, pacientes y citas bench (solo lo que falte)."""
+        clave = make_password(CLAVE)
+        ahora = timezone.now()
+        with transaction.atomic():
+            admin = self._crear_usuarios(1, 1, 'admin', clave)
+            medicos = self._crear_usuarios(2, options['medicos'], 'medico', clave)
+            pacientes = self._crear_usuarios(3, options['pacientes'], 'paciente', clave)
+
+            especialidad = Especialidad.objects.order_by('id').first()
+            con_ficha = set(Medico.objects.filter(user_id__in=medicos).values_list('user_id', flat=True))
+            Medico.objects.bulk_create([
+                Medico(user_id=m, especialidad=especialidad, numero_colegiado=f"B-{m}",
+                       horario_inicio=dtime(8), horario_fin=dtime(17),
+                       dias_laborales='LUN,MAR,MIE,JUE,VIE', created_at=ahora)
+                for m in medicos if m not in con_ficha
+            ])
+            con_ficha = set(Paciente.objects.filter(user_id__in=pacientes).values_list('user_id', flat=True))
+            Paciente.objects.bulk_create([
+                Paciente(user_id=p, created_at=ahora) for p in pacientes if p not in con_ficha
+            ])
+
+            faltan = options['citas'] - Cita.objects.filter(medico_id__in=medicos).count()
+            if faltan > 0:
+                ocupados = set(
+                    Cita.objects.filter(medico_id__in=medicos).values_list('medico_id', 'fecha', 'hora')
+                )
+                inicio = date.today() - timedelta(days=options['dias'] // 2)
+                laborables = [
+                    inicio + timedelta(days=d) for d in range(options['dias'])
+                    if (inicio + timedelta(days=d)).weekday() < 5
+                ]
+                slots = [dtime(*divmod(m, 60)) for m in range(8 * 60, 17 * 60, 30)]
+                capacidad = len(medicos) * len(laborables) * len(slots) - len(ocupados)
+                faltan = min(faltan, capacidad)
+                lote = []
+                while faltan > 0:
+                    clave_cita = (rnd.choice(medicos), rnd.choice(laborables), rnd.choice(slots))
+                    if clave_cita in ocupados:
+                        continue
+                    ocupados.add(clave_cita)
+                    medico_id, fecha, hora = clave_cita
+                    lote.append(Cita(
+                        paciente_id=rnd.choice(pacientes), medico_id=medico_id, fecha=fecha,
+                        hora=hora, duracion=30, motivo='Control', estado=rnd.choice(ESTADOS),
+                        created_at=ahora, updated_at=ahora,
+                    ))
+                    faltan -= 1
+                    if len(lote) >= 5000:
+                        Cita.objects.bulk_create(lote)
+                        lote = []
+                Cita.objects.bulk_create(lote)
+        return admin[0], medicos, pacientes
+
+    def _limpiar(self):
+        ids = list(CustomUser.objects.filter(username__startswith=PREFIJO).values_list('id', flat=True))
+        with transaction.atomic():
+            Cita.objects.filter(medico_id__in=ids).delete()
+            Cita.objects.filter(paciente_id__in=ids).delete()
+            Medico.objects.filter(user_id__in=ids).delete()
+            Paciente.objects.filter(user_id__in=ids).delete()
+            CustomUser.objects.filter(id__in=ids).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM correos_pendientes WHERE destinatarios LIKE %s",
+                    [f'%@{DOMINIO}%'],
+                )
+        self.stdout.write(f"{len(ids)} usuario(s) bench eliminados con sus citas")
+
+    # ========== ESCENARIOS ==========
+
+    def _cliente(self, user_id=None):
+        """Cliente de pruebas (ALLOWED_HOSTS no incluye 'testserver')."""
+        cliente = Client(SERVER_NAME='localhost')
+        if user_id:
+            cliente.post(reverse('login'), {
+                'username': CustomUser.objects.get(id=user_id).username, 'password': CLAVE,
+            })
+        return cliente
+
+    def _escenarios(self, admin, medicos, pacientes, rnd):
+        """{nombre: (función(i) → response, preparar() antes de cada request o None)}"""
+        hoy = date.today()
+        cliente_admin = self._cliente(admin)
+        cliente_medico = self._cliente(medicos[0])
+        cliente_paciente = self._cliente(pacientes[0])
+        cliente_login = self._cliente()
+        usuario_login = CustomUser.objects.get(id=pacientes[-1]).username
+        fecha_lejana = hoy + timedelta(days=3650)
+
+        def agendar(i):
+            # Un horario distinto por iteración: nunca choca ni con los datos sembrados
+            dia, slot = divmod(i, 18)
+            return cliente_admin.post(reverse('agendar_cita'), {
+                'paciente': rnd.choice(pacientes), 'medico': medicos[-1],
+                'fecha': (fecha_lejana + timedelta(days=dia)).isoformat(),
+                'hora': '%02d:%02d' % divmod(8 * 60 + slot * 30, 60),
+                'duracion': 30, 'motivo': MOTIVO_PRUEBA,
+            })
+
+        return {
+            'login': (
+                lambda i: cliente_login.post(reverse('login'), {
+                    'username': usuario_login, 'password': CLAVE,
+                }),
+                cliente_login.logout,
+            ),
+            'home_medico': (lambda i: cliente_medico.get(reverse('home')), None),
+            'home_paciente': (lambda i: cliente_paciente.get(reverse('home')), None),
+            'calendario': (lambda i: cliente_medico.get(reverse('calendario')), None),
+            'historial': (lambda i: cliente_admin.get(reverse('historial_citas')), None),
+            'agendar_cita_form': (lambda i: cliente_admin.get(reverse('agendar_cita')), None),
+            'agendar_cita': (agendar, None),
+            'api_citas_disponibles': (
+                lambda i: cliente_admin.post(
+                    reverse('api_citas_disponibles'),
+                    json.dumps({
+                        'medico_ids': medicos[:10], 'fecha_inicio': hoy.isoformat(),
+                        'dias': 7, 'duracion': 30,
+                    }),
+                    content_type='application/json',
+                ),
+                None,
+            ),
+        }
+
+    def _medir(self, funcion, preparar, iteraciones, calentamiento):
+        """Corre un escenario; retorna dict con percentiles y consultas."""
+        tiempos, consultas, errores = [], [], 0
+        for i in range(calentamiento + iteraciones):
+            if preparar:
+                preparar()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                response = funcion(i)
+                transcurrido = time.perf_counter() - inicio
+            if response.status_code >= 400:
+                errores += 1
+            if i >= calentamiento:
+                tiempos.append(transcurrido * 1000)
+                consultas.append(len(capturadas))
+        tiempos.sort()
+        return {
+            'n': len(tiempos),
+            'p50': round(percentil(tiempos, 50), 2),
+            'p95': round(percentil(tiempos, 95), 2),
+            'p99': round(percentil(tiempos, 99), 2),
+            'consultas': round(sum(consultas) / len(consultas), 1) if consultas else 0,
+            'errores': errores,
+        }
+
+    # ========== COMPARACIÓN ==========
+
+    def _comparar(self, resultados, ruta, tolerancia):
+        """Imprime la diferencia contra la línea base; retorna las regresiones."""
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                base = json.load(archivo)['resultados']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'No se pudo leer la línea base {ruta}: {e}')
+
+        regresiones = []
+        self.stdout.write(f"\nComparación contra {ruta} (tolerancia p95 {tolerancia:.0%}):")
+        for nombre, actual in resultados.items():
+            anterior = base.get(nombre)
+            if not anterior:
+                self.stdout.write(f"  {nombre:24} sin línea base")
+                continue
+            cambio = (actual['p95'] - anterior['p95']) / anterior['p95'] if anterior['p95'] else 0
+            motivos = []
+            if cambio > tolerancia:
+                motivos.append(f"p95 {anterior['p95']:.1f} → {actual['p95']:.1f} ms")
+            if actual['consultas'] > anterior['consultas']:
+                motivos.append(f"consultas {anterior['consultas']} → {actual['consultas']}")
+            if motivos:
+                regresiones.append(nombre)
+                self.stdout.write(self.style.ERROR(f"  {nombre:24} REGRESIÓN: {'; '.join(motivos)}"))
+            else:
+                self.stdout.write(f"  {nombre:24} p95 {cambio:+.0%}")
+        return regresiones
+
+    def handle(self, *args, **options):
+        if options['limpiar']:
+            self._limpiar()
+            return
+
+        rnd = random.Random(options['semilla'])
+        t0 = time.perf_counter()
+        admin, medicos, pacientes = self._sembrar(options, rnd)
+        total_citas = Cita.objects.filter(medico_id__in=medicos).count()
+        self.stdout.write(
+            f"Datos: {len(medicos)} médicos | {len(pacientes)} pacientes | "
+            f"{total_citas} citas ({time.perf_counter() - t0:.1f} s de preparación)"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM correos_pendientes")
+            ultimo_correo = cursor.fetchone()[0]
+
+        escenarios = self._escenarios(admin, medicos, pacientes, rnd)
+        resultados = {}
+        try:
+            self.stdout.write(
+                f"\n{'Escenario':24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'SQL/req':>8} {'errores':>8}"
+            )
+            for nombre in options['escenarios'] or self.ESCENARIOS:
+                funcion, preparar = escenarios[nombre]
+                r = resultados[nombre] = self._medir(
+                    funcion, preparar, options['iteraciones'], options['calentamiento']
+                )
+                self.stdout.write(
+                    f"{nombre:24} {r['p50']:8.1f} {r['p95']:8.1f} {r['p99']:8.1f} "
+                    f"{r['consultas']:8.1f} {r['errores']:8d}"
+                )
+        finally:
+            # Lo que creó el escenario agendar_cita (citas y correos encolados)
+            Cita.objects.filter(medico_id=medicos[-1], motivo=MOTIVO_PRUEBA).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM correos_pendientes WHERE id > %s AND destinatarios LIKE %s",
+                    [ultimo_correo, f'%@{DOMINIO}%'],
+                )
+
+        # ru_maxrss está en KiB en Linux
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f"\nRSS máximo del proceso: {rss_mb:.1f} MiB")
+        usuarios = cache_usuarios.estadisticas()
+        self.stdout.write(
+            f"Caché de usuarios (get_user): {usuarios['aciertos']} aciertos | "
+            f"{usuarios['fallos']} fallos | tasa {usuarios['tasa_aciertos']:.1%}"
+        )
+
+        if options['guardar']:
+            with open(options['guardar'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': datetime.now().isoformat(timespec='seconds'),
+                    'datos': {'medicos': len(medicos), 'pacientes': len(pacientes), 'citas': total_citas},
+                    'iteraciones': options['iteraciones'],
+                    'rss_mb': round(rss_mb, 1),
+                    'resultados': resultados,
+                }, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Línea base guardada en {options['guardar']}")
+
+        if options['base']:
+            regresiones = self._comparar(resultados, options['base'], options['tolerancia'])
+            if regresiones:
+                raise CommandError(f"Regresiones en: {', '.join(regresiones)}")
+            self.stdout.write(self.style.SUCCESS('Sin regresiones'))
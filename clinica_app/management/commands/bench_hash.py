@@ -0,0 +1,54 @@
+# clinica_app/management/commands/bench_hash.py
+
+"""
+COMANDO: Micro-benchmark del costo de hash de contraseñas por política
+
+USO:
+    python manage.py bench_hash
+    python manage.py bench_hash --politica pbkdf2 --repeticiones 20
+
+REPORTA: milisegundos por verificación y logins/segundo por núcleo,
+usando los costos configurados en settings (HASH_PBKDF2_ITERACIONES, etc.)
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = 'Mide logins/segundo por núcleo para cada política de hash de contraseñas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--politica', action='append', default=None,
+                            help='Política a medir (repetible). Por defecto todas')
+        parser.add_argument('--repeticiones', type=int, default=10,
+                            help='Verificaciones por política')
+
+    def handle(self, *args, **options):
+        politicas = options['politica'] or list(settings.HASHERS_POR_POLITICA)
+        password = 'Clinica-Benchmark-2025'
+
+        self.stdout.write(f"Política activa: {settings.HASH_POLITICA}")
+        self.stdout.write(f"{'Política':<10} {'ms/login':>10} {'logins/s/núcleo':>17}")
+
+        for politica in politicas:
+            hasher = import_string(settings.HASHERS_POR_POLITICA[politica])()
+            try:
+                encoded = hasher.encode(password, hasher.salt())
+            except ValueError as e:
+                # Ej: argon2-cffi no instalado
+                self.stdout.write(f"{politica:<10} {'no disponible':>10}  ({e})")
+                continue
+
+            # Un login = una verificación del hash (un solo hilo = un núcleo)
+            t0 = time.perf_counter()
+            for _ in range(options['repeticiones']):
+                hasher.verify(password, encoded)
+            segundos = (time.perf_counter() - t0) / options['repeticiones']
+
+            self.stdout.write(
+                f"{politica:<10} {segundos * 1000:>10.1f} {1 / segundos:>17.1f}"
+            )
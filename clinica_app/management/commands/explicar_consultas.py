@@ -0,0 +1,169 @@
+# clinica_app/management/commands/explicar_consultas.py
+
+"""
+COMANDO: Ejecuta EXPLAIN sobre las consultas calientes de las vistas
+
+USO:
+    python manage.py explicar_consultas
+    python manage.py explicar_consultas --verbose
+    python manage.py explicar_consultas --tablas citas,auth_user_custom,medicos
+
+FALLA (exit code != 0) si alguna consulta hace un recorrido completo
+(type = ALL) sobre una de las tablas vigiladas. Útil en CI tras cambiar
+consultas o índices (ver 'Base de Datos/Script 6 MYSQL.txt').
+
+ALIAS: EXPLAIN muestra el alias de cada tabla ('c', 'up', T3 de Django); se
+traducen a la tabla real leyendo los FROM/JOIN de cada consulta.
+"""
+
+import re
+from datetime import date, datetime, time, timezone
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from clinica_app.calendario import COLUMNAS
+from clinica_app.dashboard import consulta_carga_hoy, consulta_citas_hoy, consulta_proximas
+from clinica_app.disponibilidad import ESTADOS_ACTIVOS
+from clinica_app.historial import construir_consulta
+from clinica_app.models import Cita, CustomUser
+from clinica_app.reservas import INSERTAR_SI_LIBRE
+
+# FROM/JOIN `tabla` [AS] alias  (con o sin comillas invertidas)
+PATRON_TABLA = re.compile(
+    r'\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?', re.IGNORECASE
+)
+
+# La subconsulta de solapes con la que reservas.agendar_cita() decide si
+# inserta: SELECT 1 FROM citas c WHERE c.medico_id = %s AND ...
+SELECT_SOLAPE = INSERTAR_SI_LIBRE.split('NOT EXISTS (', 1)[1].rsplit(')', 1)[0]
+
+
+def tablas_por_alias(sql):
+    """
+    FUNCIÓN: {alias o nombre: tabla real} de los FROM/JOIN de la consulta
+
+    Una palabra clave tras la tabla (WHERE, ON, INNER...) queda como "alias"
+    inofensivo: EXPLAIN nunca reporta una tabla con ese nombre.
+    """
+    alias = {}
+    for tabla, nombre in PATRON_TABLA.findall(sql):
+        alias[tabla] = tabla
+        if nombre:
+            alias[nombre] = tabla
+    return alias
+
+
+def _usuario(rol, user_id):
+    """Usuario mínimo con las propiedades de rol que usa historial.py."""
+    return SimpleNamespace(
+        id=user_id, is_admin=rol == 1, is_medico=rol == 2, is_paciente=rol == 3
+    )
+
+
+def consultas_vistas(medico_id, paciente_id, hoy):
+    """
+    FUNCIÓN: Las consultas que emiten las vistas, con parámetros de ejemplo
+
+    RETORNA: Lista de (nombre, sql, params)
+    """
+    fin_mes = date(hoy.year + (hoy.month == 12), hoy.month % 12 + 1, 1)
+    querysets = [
+        ('login', CustomUser.objects.filter(
+            Q(username='admin') | Q(email='admin'), is_active=True
+        )[:1]),
+        ('home_view (médico)', consulta_citas_hoy(medico_id, hoy)),
+        ('home_view (paciente)', consulta_proximas(paciente_id, hoy)),
+        ('home_view (admin)', consulta_carga_hoy(hoy)),
+        ('calendario_view (médico)', Cita.objects.filter(
+            medico_id=medico_id, fecha__range=[hoy, fin_mes], estado__in=ESTADOS_ACTIVOS
+        ).select_related('medico', 'paciente')),
+        ('calendario_view (paciente)', Cita.objects.filter(
+            paciente_id=paciente_id, fecha__range=[hoy, fin_mes], estado__in=ESTADOS_ACTIVOS
+        ).select_related('medico', 'paciente')),
+        ('calendario_view (admin)', Cita.objects.filter(
+            fecha__range=[hoy, fin_mes], estado__in=ESTADOS_ACTIVOS
+        ).select_related('medico', 'paciente')),
+        ('api_calendario (admin, since)', Cita.objects.filter(
+            fecha__range=[hoy, fin_mes],
+            updated_at__gte=datetime.combine(hoy, time(0, 0), tzinfo=timezone.utc)
+        ).values_list(*COLUMNAS)),
+        ('api_citas_disponibles', Cita.objects.filter(
+            medico_id__in=[medico_id], fecha__range=[hoy, fin_mes], estado__in=ESTADOS_ACTIVOS
+        ).values_list('medico_id', 'fecha', 'hora', 'duracion')),
+    ]
+    consultas = [
+        (nombre, *qs.query.sql_with_params()) for nombre, qs in querysets
+    ]
+
+    # Solape al agendar (reservas.INSERTAR_SI_LIBRE): cita de 9:00 a 9:30
+    consultas.append((
+        'agendar_cita_view (solape)', SELECT_SOLAPE,
+        [medico_id, hoy, time(9, 30), time(9, 0)],
+    ))
+
+    # Historial (SQL crudo de historial.py), primera página y página siguiente
+    despues = (hoy, time(12, 0), 1000)
+    for nombre, rol, user_id in (
+        ('historial (paciente)', 3, paciente_id),
+        ('historial (médico)', 2, medico_id),
+        ('historial (admin)', 1, None),
+    ):
+        usuario = _usuario(rol, user_id)
+        consultas.append((nombre, *construir_consulta(usuario, {}, None, 51)))
+        consultas.append((nombre + ' pág. 2', *construir_consulta(usuario, {}, despues, 51)))
+    return consultas
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN de las consultas de las vistas; falla si alguna recorre una tabla completa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tablas', default='citas,auth_user_custom',
+                            help='Tablas (separadas por coma) donde un type=ALL es error')
+        parser.add_argument('--verbose', action='store_true',
+                            help='Mostrar el plan completo de cada consulta')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('EXPLAIN solo se interpreta para MySQL/MariaDB')
+
+        vigiladas = {t.strip() for t in options['tablas'].split(',') if t.strip()}
+
+        # IDs reales para que el optimizador use estadísticas representativas
+        medico = CustomUser.objects.filter(role=2).values_list('id', flat=True).first() or 1
+        paciente = CustomUser.objects.filter(role=3).values_list('id', flat=True).first() or 1
+
+        errores = []
+        with connection.cursor() as cursor:
+            for nombre, sql, params in consultas_vistas(medico, paciente, date.today()):
+                cursor.execute('EXPLAIN ' + sql, params)
+                columnas = [c[0].lower() for c in cursor.description]
+                plan = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+                alias = tablas_por_alias(sql)
+                escaneos = [
+                    paso for paso in plan
+                    if paso.get('type') == 'ALL'
+                    and alias.get(paso.get('table'), paso.get('table')) in vigiladas
+                ]
+                estado = 'FULL SCAN' if escaneos else 'OK'
+                self.stdout.write(f"[{estado:^9}] {nombre}")
+
+                if options['verbose'] or escaneos:
+                    for paso in plan:
+                        self.stdout.write(
+                            f"    {paso.get('table')}: type={paso.get('type')} "
+                            f"key={paso.get('key')} rows={paso.get('rows')} "
+                            f"extra={paso.get('extra')}"
+                        )
+                if escaneos:
+                    errores.append(nombre)
+
+        if errores:
+            raise CommandError(
+                f"{len(errores)} consulta(s) con recorrido completo: {', '.join(errores)}"
+            )
+        self.stdout.write(self.style.SUCCESS('Todas las consultas usan índices'))
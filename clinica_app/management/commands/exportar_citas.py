@@ -0,0 +1,56 @@
+# clinica_app/management/commands/exportar_citas.py
+
+"""
+COMANDO: Exporta el historial completo de citas (CSV o JSONL) en streaming
+
+USO:
+    python manage.py exportar_citas --salida citas.csv
+    python manage.py exportar_citas --formato jsonl --desde 2024-01-01 > citas.jsonl
+    python manage.py exportar_citas --replica --salida citas.csv
+
+--replica: lee de REPLICA_ALIAS (si está configurada) en lugar del primario
+"""
+
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinica_app.exportacion import FORMATOS, filas_historial
+from clinica_app.historial import leer_filtros
+from clinica_app.replicas import usar_replica
+
+
+class Command(BaseCommand):
+    help = 'Exporta todas las citas con nombres de paciente y médico sin cargarlas en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv')
+        parser.add_argument('--salida', default='-', help="Archivo destino ('-' = stdout)")
+        parser.add_argument('--lote', type=int, default=2000, help='Filas por fetchmany()')
+        parser.add_argument('--estado', default='')
+        parser.add_argument('--medico', default='')
+        parser.add_argument('--desde', default='', help='YYYY-MM-DD')
+        parser.add_argument('--hasta', default='', help='YYYY-MM-DD')
+        parser.add_argument('--replica', action='store_true', help='Leer de la réplica')
+
+    def handle(self, *args, **options):
+        filtros = leer_filtros(options)
+        generador, _ = FORMATOS[options['formato']]
+
+        if options['salida'] == '-':
+            destino = sys.stdout
+        else:
+            try:
+                destino = open(options['salida'], 'w', encoding='utf-8', newline='')
+            except OSError as e:
+                raise CommandError(f'No se pudo abrir {options["salida"]}: {e}')
+
+        contexto = usar_replica() if options['replica'] else nullcontext()
+        try:
+            with contexto:
+                for bloque in generador(filas_historial(None, filtros, options['lote'])):
+                    destino.write(bloque)
+        finally:
+            if destino is not sys.stdout:
+                destino.close()
@@ -0,0 +1,304 @@
+# clinica_app/management/commands/generar_datos.py
+
+"""
+COMANDO: Genera datos sintéticos a escala de producción (pacientes, médicos, citas)
+
+USO:
+    python manage.py generar_datos --pacientes 100000 --medicos 80 --años 3
+    python manage.py generar_datos --pacientes 500000 --medicos 300 --años 5 --ocupacion 0.8
+    python manage.py generar_datos --limpiar      # Borra todo lo generado (usuarios sint_*)
+
+DISTRIBUCIONES:
+- Médicos: repartidos entre las especialidades existentes, con horario
+  (horario_inicio/fin) y dias_laborales variados
+- Citas: se recorre la agenda de cada médico día por día, solo en sus días
+  laborales y dentro de su horario; cada hueco se ocupa con probabilidad
+  --ocupacion, con duraciones de 15 a 60 minutos. Así nunca se solapan y
+  (medico_id, fecha, hora) es único: unique_cita no rechaza nada
+- Estado según la fecha: pasadas casi todas COMPLETADA/CANCELADA, futuras
+  PENDIENTE/CONFIRMADA
+- Pacientes: unos pocos concentran muchas citas (pacientes frecuentes)
+
+VELOCIDAD:
+- Un INSERT multi-fila por cada --lote filas (por defecto 5000) en lugar de
+  un INSERT por fila: millones de citas en segundos, no horas
+- Las contraseñas son un único hash compartido (make_password una sola vez)
+- created_at/updated_at se escriben en UTC, como lo hace el ORM con USE_TZ
+"""
+
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from clinica_app.disponibilidad import DIAS_SEMANA
+from clinica_app.models import CustomUser, Especialidad
+
+PREFIJO = 'sint_'
+DOMINIO = 'sintetico.invalid'
+CLAVE = 'sintetico-123'
+
+NOMBRES = (
+    'Ana', 'Luis', 'María', 'José', 'Carmen', 'Carlos', 'Lucía', 'Jorge', 'Sofía', 'Pedro',
+    'Elena', 'Miguel', 'Rosa', 'Juan', 'Isabel', 'Diego', 'Marta', 'Andrés', 'Paula', 'Raúl',
+)
+APELLIDOS = (
+    'López', 'García', 'Pérez', 'Martínez', 'Rodríguez', 'Hernández', 'González', 'Morales',
+    'Castillo', 'Ramírez', 'Flores', 'Méndez', 'Cruz', 'Reyes', 'Orellana', 'Barrios',
+)
+MOTIVOS = (
+    'Control', 'Acné', 'Dermatitis', 'Revisión de lunares', 'Psoriasis', 'Rosácea',
+    'Fototerapia', 'Biopsia de piel', 'Alergia cutánea', 'Retiro de puntos',
+)
+TIPOS_SANGRE = ('O+', 'O+', 'O+', 'A+', 'A+', 'B+', 'AB+', 'O-', 'A-')
+HORARIOS = ((dtime(7), dtime(15)), (dtime(8), dtime(17)), (dtime(9), dtime(18)), (dtime(13), dtime(20)))
+DIAS_LABORALES = ('LUN,MAR,MIE,JUE,VIE',) * 3 + ('LUN,MAR,MIE,JUE,VIE,SAB', 'LUN,MIE,VIE', 'MAR,JUE,SAB')
+DURACIONES = (15, 30, 30, 30, 30, 45, 60)
+
+# (estado, peso) según si la cita ya pasó
+ESTADOS_PASADO = (('COMPLETADA', 78), ('CANCELADA', 15), ('CONFIRMADA', 4), ('PENDIENTE', 3))
+ESTADOS_FUTURO = (('PENDIENTE', 60), ('CONFIRMADA', 30), ('CANCELADA', 10))
+
+ESPECIALIDADES_DEFECTO = (
+    ('Dermatología General', 'Diagnóstico y tratamiento de enfermedades de la piel'),
+    ('Dermatología Cosmética', 'Procedimientos estéticos y cuidado de la piel'),
+    ('Dermatología Pediátrica', 'Tratamiento de condiciones de piel en niños'),
+    ('Cirugía Dermatológica', 'Procedimientos quirúrgicos menores de piel'),
+)
+
+COLUMNAS_USUARIO = (
+    'username', 'email', 'password', 'first_name', 'last_name', 'phone', 'role',
+    'is_active', 'date_joined', 'created_at', 'updated_at',
+)
+COLUMNAS_CITA = (
+    'paciente_id', 'medico_id', 'fecha', 'hora', 'duracion', 'motivo', 'estado',
+    'created_at', 'updated_at',
+)
+
+
+def insertar(cursor, tabla, columnas, filas):
+    """Un solo INSERT ... VALUES (...), (...), ... con todas las filas."""
+    if not filas:
+        return
+    marcador = '(' + ', '.join(['%s'] * len(columnas)) + ')'
+    cursor.execute(
+        f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES {', '.join([marcador] * len(filas))}",
+        [valor for fila in filas for valor in fila],
+    )
+
+
+def ruleta(pesos):
+    """Lista de 100 valores para elegir con rnd.choice según los pesos (%)."""
+    return [valor for valor, peso in pesos for _ in range(peso)]
+
+
+class Command(BaseCommand):
+    help = 'Genera pacientes, médicos y años de citas sintéticas con INSERTs multi-fila'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=10000)
+        parser.add_argument('--medicos', type=int, default=40)
+        parser.add_argument('--años', type=float, default=2.0, help='Años de historia hacia atrás')
+        parser.add_argument('--futuro', type=int, default=60, help='Días de agenda hacia adelante')
+        parser.add_argument('--ocupacion', type=float, default=0.7,
+                            help='Probabilidad de que un hueco del horario tenga cita (0-1)')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por INSERT')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Borrar los datos generados (usuarios sint_*) y salir')
+
+    # ========== USUARIOS ==========
+
+    def _siguiente_numero(self, etiqueta):
+        """Continúa la numeración si ya se generaron datos antes."""
+        return CustomUser.objects.filter(username__startswith=f"{PREFIJO}{etiqueta}").count()
+
+    def _crear_usuarios(self, cursor, rol, etiqueta, cantidad, clave, ahora, rnd, lote):
+        """Inserta los usuarios en lotes y retorna sus IDs (una consulta)."""
+        inicio = self._siguiente_numero(etiqueta)
+        filas = []
+        for i in range(inicio, inicio + cantidad):
+            filas.append((
+                f"{PREFIJO}{etiqueta}{i}", f"{etiqueta}{i}@{DOMINIO}", clave,
+                rnd.choice(NOMBRES), f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+                f"5{rnd.randrange(1000000, 9999999)}", rol, True, ahora, ahora, ahora,
+            ))
+            if len(filas) >= lote:
+                insertar(cursor, 'auth_user_custom', COLUMNAS_USUARIO, filas)
+                filas = []
+        insertar(cursor, 'auth_user_custom', COLUMNAS_USUARIO, filas)
+
+        return list(
+            CustomUser.objects.filter(
+                username__startswith=f"{PREFIJO}{etiqueta}", role=rol,
+            ).order_by('id').values_list('id', flat=True)[inicio:inicio + cantidad]
+        )
+
+    # ========== CITAS ==========
+
+    def _agenda(self, medico, paciente_de, desde, hasta, ahora, ocupacion, rnd, a_utc):
+        """
+        Genera las citas de un médico día por día dentro de su horario.
+        Nunca se solapan: después de cada cita se avanza su duración.
+        """
+        medico_id, inicio, fin, dias = medico
+        hoy = ahora.date()
+        estados_pasado = ruleta(ESTADOS_PASADO)
+        estados_futuro = ruleta(ESTADOS_FUTURO)
+        fecha = desde
+        while fecha <= hasta:
+            if fecha.weekday() in dias:
+                minuto = inicio
+                while minuto < fin:
+                    duracion = rnd.choice(DURACIONES)
+                    if minuto + duracion > fin:
+                        break
+                    if rnd.random() < ocupacion:
+                        hora = dtime(minuto // 60, minuto % 60)
+                        pasada = fecha < hoy
+                        momento = datetime.combine(fecha, hora)
+                        # Agendada 1-29 días antes; las pasadas se actualizaron al atenderse
+                        creada = min(momento - timedelta(days=rnd.randrange(1, 30)), ahora)
+                        modificada = min(momento + timedelta(hours=1), ahora) if pasada else creada
+                        yield (
+                            paciente_de(), medico_id, fecha, hora, duracion, rnd.choice(MOTIVOS),
+                            rnd.choice(estados_pasado if pasada else estados_futuro),
+                            a_utc(creada), a_utc(modificada),
+                        )
+                        minuto += duracion
+                    else:
+                        minuto += rnd.choice((15, 30))
+            fecha += timedelta(days=1)
+
+    # ========== LIMPIEZA ==========
+
+    def _limpiar(self):
+        ids = list(CustomUser.objects.filter(username__startswith=PREFIJO).values_list('id', flat=True))
+        if not ids:
+            self.stdout.write('No hay datos sintéticos')
+            return
+        borradas = 0
+        with connection.cursor() as cursor:
+            # Por tramos de IDs y con LIMIT: no bloquea la tabla con una transacción gigante
+            for i in range(0, len(ids), 1000):
+                tramo = ids[i:i + 1000]
+                marcadores = ', '.join(['%s'] * len(tramo))
+                for columna in ('medico_id', 'paciente_id'):
+                    while True:
+                        cursor.execute(
+                            f"DELETE FROM citas WHERE {columna} IN ({marcadores}) LIMIT 50000", tramo
+                        )
+                        borradas += cursor.rowcount
+                        if cursor.rowcount < 50000:
+                            break
+                for tabla in ('medicos', 'pacientes'):
+                    cursor.execute(f"DELETE FROM {tabla} WHERE user_id IN ({marcadores})", tramo)
+                cursor.execute(f"DELETE FROM auth_user_custom WHERE id IN ({marcadores})", tramo)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(ids)} usuario(s) sintéticos y {borradas} cita(s) eliminados"
+        ))
+
+    def handle(self, *args, **options):
+        if options['limpiar']:
+            self._limpiar()
+            return
+        if not 0 < options['ocupacion'] <= 1:
+            raise CommandError('--ocupacion debe estar entre 0 y 1')
+
+        rnd = random.Random(options['semilla'])
+        lote = options['lote']
+        clave = make_password(CLAVE)
+        ahora_local = timezone.localtime()
+        hoy = ahora_local.date()
+        # America/Guatemala no tiene horario de verano: un solo desfase a UTC
+        desfase = ahora_local.utcoffset()
+        ahora_local = ahora_local.replace(tzinfo=None)
+        ahora = ahora_local - desfase
+
+        def a_utc(momento):
+            return momento - desfase
+
+        t0 = time.perf_counter()
+        with connection.cursor() as cursor:
+            # 1. ESPECIALIDADES (las del Script 1 si la tabla está vacía)
+            especialidades = list(Especialidad.objects.values_list('id', flat=True))
+            if not especialidades:
+                insertar(cursor, 'especialidades', ('nombre', 'descripcion'), ESPECIALIDADES_DEFECTO)
+                especialidades = list(Especialidad.objects.values_list('id', flat=True))
+
+            # 2. USUARIOS + FICHAS DE MÉDICO Y PACIENTE
+            with transaction.atomic():
+                medico_ids = self._crear_usuarios(
+                    cursor, 2, 'medico', options['medicos'], clave, ahora, rnd, lote)
+                paciente_ids = self._crear_usuarios(
+                    cursor, 3, 'paciente', options['pacientes'], clave, ahora, rnd, lote)
+
+                medicos = []
+                filas = []
+                for medico_id in medico_ids:
+                    inicio, fin = rnd.choice(HORARIOS)
+                    dias = rnd.choice(DIAS_LABORALES)
+                    filas.append((
+                        medico_id, rnd.choice(especialidades), f"COL-{medico_id}",
+                        inicio, fin, dias, ahora,
+                    ))
+                    medicos.append((
+                        medico_id, inicio.hour * 60, fin.hour * 60,
+                        {DIAS_SEMANA.index(d) for d in dias.split(',')},
+                    ))
+                insertar(cursor, 'medicos', (
+                    'user_id', 'especialidad_id', 'numero_colegiado',
+                    'horario_inicio', 'horario_fin', 'dias_laborales', 'created_at',
+                ), filas)
+
+                for i in range(0, len(paciente_ids), lote):
+                    insertar(cursor, 'pacientes', (
+                        'user_id', 'fecha_nacimiento', 'tipo_sangre', 'alergias', 'created_at',
+                    ), [
+                        (p, date(1940, 1, 1) + timedelta(days=rnd.randrange(30000)),
+                         rnd.choice(TIPOS_SANGRE), '', ahora)
+                        for p in paciente_ids[i:i + lote]
+                    ])
+            t_usuarios = time.perf_counter() - t0
+            self.stdout.write(
+                f"{len(medico_ids)} médicos y {len(paciente_ids)} pacientes en {t_usuarios:.1f} s"
+            )
+
+            # 3. CITAS: un INSERT multi-fila por lote, una transacción por médico
+            if not (medico_ids and paciente_ids):
+                return
+            n_pacientes = len(paciente_ids)
+
+            def paciente_de():
+                # Sesgo hacia el inicio de la lista: pacientes frecuentes
+                return paciente_ids[int(n_pacientes * rnd.random() ** 2)]
+
+            desde = hoy - timedelta(days=int(options['años'] * 365))
+            hasta = hoy + timedelta(days=options['futuro'])
+            total = 0
+            t1 = time.perf_counter()
+            for numero, medico in enumerate(medicos, 1):
+                filas = []
+                with transaction.atomic():
+                    for fila in self._agenda(medico, paciente_de, desde, hasta, ahora_local,
+                                             options['ocupacion'], rnd, a_utc):
+                        filas.append(fila)
+                        if len(filas) >= lote:
+                            insertar(cursor, 'citas', COLUMNAS_CITA, filas)
+                            total += len(filas)
+                            filas = []
+                    insertar(cursor, 'citas', COLUMNAS_CITA, filas)
+                    total += len(filas)
+                transcurrido = time.perf_counter() - t1
+                self.stdout.write(
+                    f"  Médico {numero}/{len(medicos)}: {total} citas "
+                    f"({total / transcurrido:,.0f} filas/s)"
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {total} citas de {desde} a {hasta} en {time.perf_counter() - t0:.1f} s"
+        ))
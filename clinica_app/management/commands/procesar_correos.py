@@ -0,0 +1,50 @@
+# clinica_app/management/commands/procesar_correos.py
+
+"""
+COMANDO: Worker de la cola de correos (correos_pendientes)
+
+USO:
+    python manage.py procesar_correos                 # Un lote y termina (cron)
+    python manage.py procesar_correos --continuo      # Worker permanente
+    python manage.py procesar_correos --backend console
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinica_app.correos import procesar_lote
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la cola reutilizando una conexión SMTP por lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None,
+                            help='Máximo de correos por lote (default: CORREOS_LOTE)')
+        parser.add_argument('--backend', default=None,
+                            help="Backend de correo: smtp, console, file, locmem o ruta completa")
+        parser.add_argument('--continuo', action='store_true',
+                            help='No terminar: seguir procesando la cola')
+        parser.add_argument('--intervalo', type=float, default=5.0,
+                            help='Segundos de espera cuando la cola está vacía (modo continuo)')
+
+    def handle(self, *args, **options):
+        while True:
+            # Vaciar la cola lote por lote
+            while True:
+                resultado = procesar_lote(options['lote'], options['backend'])
+                total = sum(resultado.values())
+                if total:
+                    self.stdout.write(
+                        f"Enviados: {resultado['enviados']} | "
+                        f"Reintentos: {resultado['reintentos']} | "
+                        f"Fallidos: {resultado['fallidos']}"
+                    )
+                # Lote vacío o sin éxitos: no insistir en un bucle cerrado
+                if not total or not resultado['enviados']:
+                    break
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
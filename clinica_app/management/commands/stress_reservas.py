@@ -0,0 +1,132 @@
+# clinica_app/management/commands/stress_reservas.py
+
+"""
+COMANDO: Prueba de concurrencia de reservas.agendar_cita()
+
+USO:
+    python manage.py stress_reservas
+    python manage.py stress_reservas --hilos 32 --rondas 10 --medico 6 --paciente 9
+
+QUÉ HACE:
+- En cada ronda, N hilos (cada uno con su propia conexión) intentan agendar al
+  MISMO médico horarios que se solapan entre sí (09:00 + 0..duracion-1 min)
+- Solo una reserva por ronda debe ganar; el resto debe recibir ConflictoHorario
+- Al final verifica en la BD que no quedaron citas activas solapadas
+
+FALLA (exit code != 0) si alguna ronda tiene más de un ganador o si hay
+solapamientos. Las citas de prueba se crean en una fecha lejana y se borran
+al terminar (salvo --conservar).
+"""
+
+import random
+import threading
+import time as reloj
+from datetime import date, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from clinica_app.models import Cita, CustomUser
+from clinica_app.reservas import ConflictoHorario, agendar_cita, fin_cita
+
+MOTIVO_PRUEBA = '[stress_reservas]'
+
+
+class Command(BaseCommand):
+    help = 'Lanza reservas concurrentes solapadas y verifica que solo una gane por horario'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=16, help='Reservas simultáneas por ronda')
+        parser.add_argument('--rondas', type=int, default=5, help='Horarios distintos a disputar')
+        parser.add_argument('--duracion', type=int, default=30, help='Minutos de cada cita')
+        parser.add_argument('--medico', type=int, help='ID del médico (por defecto el primero)')
+        parser.add_argument('--paciente', type=int, help='ID del paciente (por defecto el primero)')
+        parser.add_argument('--fecha', type=date.fromisoformat,
+                            help='Fecha de prueba YYYY-MM-DD (por defecto dentro de 10 años)')
+        parser.add_argument('--conservar', action='store_true', help='No borrar las citas creadas')
+
+    def handle(self, *args, **options):
+        medico_id = options['medico'] or CustomUser.objects.filter(role=2).values_list('id', flat=True).first()
+        paciente_id = options['paciente'] or CustomUser.objects.filter(role=3).values_list('id', flat=True).first()
+        if not (medico_id and paciente_id):
+            raise CommandError('Se necesita al menos un médico y un paciente')
+
+        fecha = options['fecha'] or date.today() + timedelta(days=3650)
+        if Cita.objects.filter(medico_id=medico_id, fecha=fecha).exists():
+            raise CommandError(f'El médico {medico_id} ya tiene citas el {fecha}; use otra --fecha')
+
+        duracion = options['duracion']
+        creadas, latencias, errores = [], [], []
+        lock = threading.Lock()
+
+        def reservar(barrera, hora):
+            try:
+                barrera.wait()  # Todos los hilos disparan a la vez
+                inicio = reloj.perf_counter()
+                try:
+                    cita = agendar_cita(paciente_id, medico_id, fecha, hora, duracion, MOTIVO_PRUEBA)
+                    resultado = cita.id
+                except ConflictoHorario:
+                    resultado = None
+                with lock:
+                    latencias.append(reloj.perf_counter() - inicio)
+                    if resultado:
+                        creadas.append(resultado)
+            except Exception as e:
+                with lock:
+                    errores.append(repr(e))
+            finally:
+                connection.close()  # Cada hilo tiene su propia conexión
+
+        rondas_malas = []
+        try:
+            for ronda in range(options['rondas']):
+                base = 9 * 60 + ronda * duracion * 2  # Rondas separadas entre sí
+                antes = len(creadas)
+                barrera = threading.Barrier(options['hilos'])
+                hilos = [
+                    threading.Thread(target=reservar, args=(barrera, time(*divmod(
+                        base + random.randrange(duracion), 60))))
+                    for _ in range(options['hilos'])
+                ]
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+                ganadores = len(creadas) - antes
+                self.stdout.write(f"Ronda {ronda + 1}: {ganadores} ganador(es) de {options['hilos']}")
+                if ganadores != 1:
+                    rondas_malas.append(ronda + 1)
+
+            solapes = self._solapamientos(medico_id, fecha)
+        finally:
+            if not options['conservar']:
+                Cita.objects.filter(id__in=creadas).delete()
+
+        latencias.sort()
+        if latencias:
+            p50 = latencias[len(latencias) // 2] * 1000
+            p95 = latencias[int(len(latencias) * 0.95) - 1] * 1000
+            self.stdout.write(f"Latencia por reserva: p50={p50:.1f} ms  p95={p95:.1f} ms")
+
+        if errores:
+            raise CommandError(f"{len(errores)} error(es) inesperados, ej: {errores[0]}")
+        if rondas_malas or solapes:
+            raise CommandError(
+                f"Rondas con != 1 ganador: {rondas_malas or 'ninguna'}; "
+                f"citas solapadas: {solapes or 'ninguna'}"
+            )
+        self.stdout.write(self.style.SUCCESS('Sin reservas duplicadas ni solapadas'))
+
+    @staticmethod
+    def _solapamientos(medico_id, fecha):
+        """Pares de citas activas del día que se cruzan."""
+        citas = list(
+            Cita.objects.filter(medico_id=medico_id, fecha=fecha, estado__in=['PENDIENTE', 'CONFIRMADA'])
+            .order_by('hora').values_list('id', 'hora', 'duracion')
+        )
+        return [
+            (a_id, b_id)
+            for (a_id, a_hora, a_dur), (b_id, b_hora, _) in zip(citas, citas[1:])
+            if b_hora < fin_cita(fecha, a_hora, a_dur)
+        ]
@@ -0,0 +1,286 @@
+# clinica_app/metricas.py
+
+"""
+=== MÉTRICAS ESTILO PROMETHEUS (/metrics) ===
+
+PROPÓSITO PRINCIPAL:
+- Latencia de requests por nombre de URL (histograma) y consultas SQL por vista
+- Logins exitosos/fallidos (señales de django.contrib.auth → SPAuthBackend)
+- Aciertos/fallos de la caché de usuarios de get_user() (backends.py)
+- Cola de correos: encolados, enviados, fallidos, tiempo de envío y de espera
+- Citas creadas y conflictos de horario detectados al agendar
+- Conexiones a la BD: nuevas, reutilizadas, recuperadas y esperas del pool (conexiones.py)
+- Texto en formato de exposición de Prometheus, sin dependencias externas
+
+VARIOS WORKERS (gunicorn):
+- Cada proceso acumula en memoria (sin compartir nada con los otros)
+- Si METRICAS_DIR está configurado, cada proceso vuelca su estado a
+  METRICAS_DIR/<pid>-<inicio>.json como máximo cada METRICAS_VOLCADO segundos
+  (escritura atómica con os.replace)
+- /metrics suma los archivos de todos los procesos, incluido el worker de
+  correos (procesar_correos). Vaciar el directorio al desplegar
+
+IMPORTANTE: Sin METRICAS_DIR, cada scrape ve solo el proceso que lo atendió.
+
+ACCESO (metricas_view): Con METRICAS_TOKEN. Por IP (METRICAS_IPS) solo con
+METRICAS_SIN_PROXY: detrás de nginx todo llega desde 127.0.0.1.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CORREO = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_ESPERA = (1, 5, 15, 30, 60, 120, 300, 900, 3600)
+BUCKETS_POOL = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nombre -> (tipo, ayuda, buckets)
+DEFINICIONES = {
+    'clinica_http_request_duration_seconds': (
+        'histogram', 'Latencia de requests por nombre de URL', BUCKETS_LATENCIA),
+    'clinica_http_requests_total': (
+        'counter', 'Requests por nombre de URL y código de estado', None),
+    'clinica_db_consultas_total': (
+        'counter', 'Consultas SQL (viajes a la BD) por nombre de URL', None),
+    'clinica_login_total': (
+        'counter', 'Intentos de login por resultado (ok/fallo)', None),
+    'clinica_correos_encolados_total': (
+        'counter', 'Correos agregados a correos_pendientes', None),
+    'clinica_correos_procesados_total': (
+        'counter', 'Correos procesados por el worker por resultado', None),
+    'clinica_correo_envio_seconds': (
+        'histogram', 'Tiempo de envío de cada correo por el backend', BUCKETS_CORREO),
+    'clinica_correo_espera_seconds': (
+        'histogram', 'Tiempo desde que se encoló hasta que se envió', BUCKETS_ESPERA),
+    'clinica_usuarios_cache_total': (
+        'counter', 'Caché de request.user (SPAuthBackend.get_user) por resultado', None),
+    'clinica_citas_creadas_total': (
+        'counter', 'Citas creadas por origen', None),
+    'clinica_citas_conflictos_total': (
+        'counter', 'Reservas rechazadas por conflicto de horario por origen', None),
+    'clinica_db_conexiones_total': (
+        'counter', 'Conexiones a la BD por alias y evento (nueva/reutilizada/recuperada/descartada)',
+        None),
+    'clinica_db_pool_espera_seconds': (
+        'histogram', 'Espera por una conexión libre del pool', BUCKETS_POOL),
+    'clinica_db_pool_agotado_total': (
+        'counter', 'Requests que no obtuvieron conexión del pool en DB_POOL_ESPERA', None),
+}
+
+
+class Registro:
+    """
+    CLASE: Contadores e histogramas de ESTE proceso
+
+    - Clave de cada serie: (nombre, ((etiqueta, valor), ...)) ordenada
+    - Histograma: [conteos por bucket (no acumulados) + inf, suma, cantidad]
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+
+    def contar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = DEFINICIONES[nombre][2]
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        indice = next((i for i, limite in enumerate(buckets) if valor <= limite), len(buckets))
+        with self._lock:
+            serie = self.histogramas.get(clave)
+            if serie is None:
+                serie = self.histogramas[clave] = [[0] * (len(buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def instantanea(self):
+        """Copia serializable (JSON) del estado actual."""
+        with self._lock:
+            return {
+                'contadores': [[n, list(map(list, e)), v] for (n, e), v in self.contadores.items()],
+                'histogramas': [
+                    [n, list(map(list, e)), list(s[0]), s[1], s[2]]
+                    for (n, e), s in self.histogramas.items()
+                ],
+            }
+
+
+registro = Registro()
+contar = registro.contar
+observar = registro.observar
+
+_ARCHIVO = f"{os.getpid()}-{int(time.time())}.json"
+_ultimo_volcado = 0.0
+
+
+def _directorio():
+    ruta = getattr(settings, 'METRICAS_DIR', None)
+    return Path(ruta) if ruta else None
+
+
+def volcar(forzar=False):
+    """Escribe el estado del proceso en METRICAS_DIR (si está configurado)."""
+    global _ultimo_volcado
+    directorio = _directorio()
+    if directorio is None:
+        return
+    ahora = time.monotonic()
+    if not forzar and ahora - _ultimo_volcado < getattr(settings, 'METRICAS_VOLCADO', 1.0):
+        return
+    _ultimo_volcado = ahora
+    directorio.mkdir(parents=True, exist_ok=True)
+    temporal = directorio / f".{_ARCHIVO}.tmp"
+    temporal.write_text(json.dumps(registro.instantanea()))
+    os.replace(temporal, directorio / _ARCHIVO)
+
+
+atexit.register(volcar, forzar=True)
+
+
+def _combinar():
+    """Suma las instantáneas de todos los procesos (o solo la de este)."""
+    directorio = _directorio()
+    if directorio is None:
+        instantaneas = [registro.instantanea()]
+    else:
+        volcar(forzar=True)
+        instantaneas = []
+        for archivo in directorio.glob('*.json'):
+            try:
+                instantaneas.append(json.loads(archivo.read_text()))
+            except (OSError, ValueError):
+                continue  # Archivo a medio escribir de un proceso que murió
+
+    contadores, histogramas = {}, {}
+    for datos in instantaneas:
+        for nombre, etiquetas, valor in datos['contadores']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, conteos, suma, cantidad in datos['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            serie = histogramas.setdefault(clave, [[0] * len(conteos), 0.0, 0])
+            serie[0] = [a + b for a, b in zip(serie[0], conteos)]
+            serie[1] += suma
+            serie[2] += cantidad
+    return contadores, histogramas
+
+
+def _etiquetas(pares, extra=()):
+    pares = list(pares) + list(extra)
+    if not pares:
+        return ''
+    texto = ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pares
+    )
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exponer(medidores=None):
+    """
+    FUNCIÓN: Texto en formato de exposición de Prometheus (versión 0.0.4)
+
+    PARÁMETROS:
+    - medidores: {nombre: (ayuda, [(etiquetas dict, valor), ...])} calculados
+      al momento del scrape (ej: correos pendientes por estado)
+    """
+    contadores, histogramas = _combinar()
+    lineas = []
+    for nombre, (tipo, ayuda, buckets) in DEFINICIONES.items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        if tipo == 'counter':
+            for (n, etiquetas), valor in sorted(contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        else:
+            for (n, etiquetas), (conteos, suma, cantidad) in sorted(histogramas.items()):
+                if n != nombre:
+                    continue
+                acumulado = 0
+                for limite, conteo in zip(list(buckets) + ['+Inf'], conteos):
+                    acumulado += conteo
+                    lineas.append(
+                        f"{nombre}_bucket{_etiquetas(etiquetas, [('le', limite)])} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(suma)}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {cantidad}")
+    for nombre, (ayuda, series) in (medidores or {}).items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} gauge")
+        for etiquetas, valor in series:
+            lineas.append(f"{nombre}{_etiquetas(sorted(etiquetas.items()))} {_numero(valor)}")
+    return '\n'.join(lineas) + '\n'
+
+
+class _ContadorSQL:
+    """execute_wrapper que solo cuenta viajes a la BD (costo mínimo)."""
+
+    __slots__ = ('consultas',)
+
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+class MetricasMiddleware:
+    """
+    MIDDLEWARE: Latencia y consultas SQL de cada request, por nombre de URL
+
+    - Las rutas sin nombre (404, estáticos) se agrupan como 'sin_nombre' para
+      no crear una serie por cada URL distinta
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        contador = _ContadorSQL()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(contador))
+            response = self.get_response(request)
+
+        vista = getattr(request.resolver_match, 'url_name', None) or 'sin_nombre'
+        observar('clinica_http_request_duration_seconds', time.perf_counter() - inicio,
+                 vista=vista, metodo=request.method)
+        contar('clinica_http_requests_total', vista=vista, status=response.status_code)
+        contar('clinica_db_consultas_total', contador.consultas, vista=vista)
+        volcar()
+        return response
+
+
+def _login_ok(sender, request, user, **kwargs):
+    contar('clinica_login_total', resultado='ok')
+
+
+def _login_fallo(sender, credentials, request=None, **kwargs):
+    contar('clinica_login_total', resultado='fallo')
+
+
+def conectar_senales():
+    """Llamado desde ClinicaAppConfig.ready()."""
+    from django.contrib.auth.signals import user_logged_in, user_login_failed
+
+    user_logged_in.connect(_login_ok, dispatch_uid='metricas_login_ok')
+    user_login_failed.connect(_login_fallo, dispatch_uid='metricas_login_fallo')
@@ -1,7 +1,9 @@
 # clinica_app/models.py
 
 # Importaciones necesarias para Django ORM y conexión directa a BD
-from django.db import models, connection
+from django.db import models
+
+from .replicas import cursor_lectura
 
 # ========== USUARIO (tabla: auth_user_custom) ==========
 class CustomUser(models.Model):
@@ -335,6 +337,50 @@ class Cita(models.Model):
         return f"{self.fecha} {self.hora} - {self.paciente.get_full_name()}"
 
 
+# ========== COLA DE CORREOS (tabla: correos_pendientes) ==========
+class CorreoPendiente(models.Model):
+    """
+    MODELO: Correo saliente pendiente de envío (outbox)
+
+    PROPÓSITO:
+    - Desacoplar el envío SMTP del ciclo request/response
+    - Persistir cada notificación para reintentarla si el servidor falla
+    - Ser consumida por el comando 'procesar_correos'
+
+    TABLA BD: correos_pendientes (ver 'Base de Datos/Script 5 MYSQL.txt')
+    """
+
+    ESTADOS = (
+        ('PENDIENTE', 'PENDIENTE'),  # En cola, esperando al worker
+        ('ENVIANDO', 'ENVIANDO'),    # Tomado por un worker
+        ('ENVIADO', 'ENVIADO'),      # Entregado al servidor SMTP
+        ('FALLIDO', 'FALLIDO'),      # Agotó los reintentos
+    )
+
+    id = models.AutoField(primary_key=True)
+    destinatarios = models.TextField()                # Emails separados por coma
+    asunto = models.CharField(max_length=255)
+    mensaje = models.TextField()
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+
+    # CONTROL DE REINTENTOS
+    intentos = models.IntegerField(default=0)
+    proximo_intento = models.DateTimeField(null=True, blank=True)
+    lote = models.CharField(max_length=32, null=True, blank=True)
+    ultimo_error = models.TextField(null=True, blank=True)
+
+    # AUDITORÍA
+    enviado_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'correos_pendientes'
+        managed = False
+
+    def __str__(self):
+        return f"{self.asunto} -> {self.destinatarios} ({self.estado})"
+
+
 # ======== FUNCIONES AUXILIARES: Llamadas a Stored Procedures ========
 
 def obtener_citas_fecha(fecha_inicio, fecha_fin):
@@ -354,7 +400,7 @@ def obtener_citas_fecha(fecha_inicio, fecha_fin):
     
     USO: Cuando necesites citas de un período específico con JOIN optimizado
     """
-    with connection.cursor() as cur:
+    with cursor_lectura() as cur:
         # Llamar al stored procedure con los parámetros
         cur.callproc('sp_obtener_citas_fecha', [fecha_inicio, fecha_fin])
         
@@ -378,7 +424,7 @@ def obtener_medicos_disponibles():
     
     USO: Para poblar dropdowns de médicos en formularios de citas
     """
-    with connection.cursor() as cur:
+    with cursor_lectura() as cur:
         # Llamar al stored procedure (sin parámetros)
         cur.callproc('sp_obtener_medicos')
         
@@ -397,6 +443,7 @@ MODELOS PRINCIPALES:
 3. Medico: Extensión de usuario para médicos (horarios, especialidad)
 4. Paciente: Extensión de usuario para pacientes (datos médicos)
 5. Cita: Sistema de citas médicas con estados y validaciones
+6. CorreoPendiente: Cola persistente de correos salientes
 
 CARACTERÍSTICAS IMPORTANTES:
 - managed = False: Django NO modifica las tablas existentes
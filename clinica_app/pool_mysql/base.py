@@ -0,0 +1,35 @@
+# clinica_app/pool_mysql/base.py
+
+"""
+BACKEND: MySQL de Django con las conexiones físicas en un pool (conexiones.py)
+
+- get_new_connection(): toma una conexión del pool en vez de abrir otra
+- _close(): la devuelve al pool en vez de cerrarla
+
+Django sigue "abriendo y cerrando" en cada request (CONN_MAX_AGE = 0); el
+socket a MySQL se reutiliza entre requests e hilos del mismo proceso.
+"""
+
+from django.db.backends.mysql import base
+
+from clinica_app.conexiones import PoolAgotado, pool_de
+
+Database = base.Database
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    usa_pool = True
+
+    def get_new_connection(self, conn_params):
+        def crear():
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        try:
+            return pool_de(self.alias).tomar(crear)
+        except PoolAgotado as e:
+            raise Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                pool_de(self.alias).devolver(self.connection)
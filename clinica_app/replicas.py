@@ -0,0 +1,186 @@
+# clinica_app/replicas.py
+
+"""
+=== LECTURAS EN RÉPLICA (ROUTER + CURSOR DE LECTURA) ===
+
+PROPÓSITO PRINCIPAL:
+- Mandar las lecturas de requests GET/HEAD (historial, calendario, reportes,
+  exportaciones, analítica) a la réplica REPLICA_ALIAS
+- Dejar en el primario ('default') todas las escrituras, los POST completos y
+  todo lo que ocurra dentro de transaction.atomic()
+- Lectura de lo propio (read-your-writes): quien acaba de agendar, cancelar o
+  cambiar algo lee del primario durante REPLICA_PEGAJOSO segundos
+
+CÓMO SE DECIDE (ReplicaMiddleware + RouterReplica):
+1. El middleware marca el request como "apto para réplica" si es GET/HEAD y
+   el navegador no trae la cookie REPLICA_COOKIE
+2. RouterReplica.db_for_read() usa la réplica solo en requests aptos y fuera
+   de un bloque atómico; db_for_write() siempre retorna 'default'
+3. Cualquier escritura (ORM, invalidar_cita(), invalidar_usuario() o un
+   método POST/PUT/DELETE) llama a marcar_escritura(): el resto del request
+   lee del primario y la respuesta deja la cookie por REPLICA_PEGAJOSO segundos
+
+SQL DIRECTO: connection.cursor() siempre es el primario. Las lecturas pesadas
+con SQL usan cursor_lectura(), que respeta la misma decisión.
+
+CACHÉS COMPARTIDAS: Lo que se guarda en una caché que otros usuarios leen
+(mes del calendario, dashboard, usuarios, índice de pacientes) se construye
+dentro de usar_primario(). La invalidación ocurre al escribir, antes de que la
+réplica se ponga al día; si el primer fallo de caché leyera de la réplica,
+la foto vieja quedaría guardada todo el TTL.
+
+SIN RÉPLICA: Si REPLICA_ALIAS no está en DATABASES todo va a 'default' y el
+router no cambia nada. Fuera de un request (comandos, shell) también se usa
+el primario salvo dentro de usar_replica().
+
+PRUEBAS LOCALES: Definir 'replica' en DATABASES apuntando a otra base
+SQLite/MySQL (con 'TEST': {'MIRROR': 'default'} para que los tests de Django
+la traten como copia del primario).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _Estado:
+    """Decisión del request actual (se muta en sitio: sobrevive a sync_to_async)."""
+
+    __slots__ = ('replica', 'escritura')
+
+    def __init__(self, replica=False):
+        self.replica = replica
+        self.escritura = False
+
+
+_estado = ContextVar('clinica_replica', default=None)
+
+
+def alias_replica():
+    """El alias de la réplica si está configurado en DATABASES, si no None."""
+    alias = getattr(settings, 'REPLICA_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def alias_lectura():
+    """
+    FUNCIÓN: Alias desde el que se debe leer AHORA
+
+    RETORNA: REPLICA_ALIAS si el request es apto, no escribió y no hay una
+    transacción abierta en el primario; si no, 'default'
+    """
+    estado = _estado.get()
+    alias = alias_replica()
+    if (alias is None or estado is None or not estado.replica or estado.escritura
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+def marcar_escritura():
+    """Desde aquí el request lee del primario y la respuesta activa la cookie."""
+    estado = _estado.get()
+    if estado is not None:
+        estado.escritura = True
+
+
+def cursor_lectura():
+    """Cursor para SELECT pesados con SQL directo (réplica cuando corresponde)."""
+    return connections[alias_lectura()].cursor()
+
+
+@contextmanager
+def usar_replica():
+    """
+    GESTOR DE CONTEXTO: Lecturas en la réplica fuera de un request
+
+    USO: Comandos de exportación o reportes que no necesitan lo último escrito
+    """
+    token = _estado.set(_Estado(replica=True))
+    try:
+        yield
+    finally:
+        _estado.reset(token)
+
+
+@contextmanager
+def usar_primario():
+    """
+    GESTOR DE CONTEXTO: Lecturas en el primario aunque el request sea apto para réplica
+
+    USO: Consultas cuyo resultado se guarda en una caché compartida
+    """
+    exterior = _estado.get()
+    if exterior is None:
+        yield  # Fuera de un request ya se lee del primario
+        return
+    estado = _Estado()
+    token = _estado.set(estado)
+    try:
+        yield
+    finally:
+        _estado.reset(token)
+        if estado.escritura:
+            exterior.escritura = True
+
+
+class RouterReplica:
+    """
+    ROUTER: Lecturas a la réplica cuando alias_lectura() lo permite
+
+    Se registra en DATABASE_ROUTERS. Las instancias leídas de la réplica se
+    guardan en el primario (db_for_write ignora instance._state.db).
+    """
+
+    def db_for_read(self, model, **hints):
+        return alias_lectura()
+
+    def db_for_write(self, model, **hints):
+        marcar_escritura()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y réplica tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """
+    MIDDLEWARE: Decide por request si las lecturas pueden ir a la réplica
+
+    La cookie no lleva datos: solo su presencia (max_age = REPLICA_PEGAJOSO)
+    indica que el navegador escribió hace poco.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie = getattr(settings, 'REPLICA_COOKIE', 'clinica_primario')
+        self.pegajoso = getattr(settings, 'REPLICA_PEGAJOSO', 15)
+
+    def __call__(self, request):
+        if alias_replica() is None:
+            return self.get_response(request)
+
+        estado = _Estado(
+            replica=request.method in METODOS_LECTURA and self.cookie not in request.COOKIES
+        )
+        if request.method not in METODOS_LECTURA:
+            estado.escritura = True
+        token = _estado.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+
+        if estado.escritura:
+            response.set_cookie(
+                self.cookie, '1', max_age=self.pegajoso, httponly=True, samesite='Lax'
+            )
+        return response
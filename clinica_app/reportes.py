@@ -0,0 +1,225 @@
+# clinica_app/reportes.py
+
+"""
+=== RESUMEN DIARIO DE CITAS (ROLLUP) Y REPORTES ===
+
+PROPÓSITO PRINCIPAL:
+- Mantener citas_resumen_diario (día × médico × estado → citas, minutos),
+  ver 'Base de Datos/Script 9 MYSQL.txt'
+- Actualizarla de forma incremental a partir de citas.updated_at
+- Armar los reportes de reportes_view leyendo SOLO el resumen
+
+ACTUALIZACIÓN INCREMENTAL (comando actualizar_resumen, cada minuto):
+1. Lee la marca de agua (mayor updated_at ya procesado) con FOR UPDATE:
+   dos corridas simultáneas no se pisan
+2. Busca los pares (médico, fecha) con citas modificadas desde la marca
+   (usa idx_citas_updated_at del Script 7)
+3. Recalcula desde citas SOLO esos días de esos médicos y reemplaza sus
+   filas del resumen: un cambio de estado resta del estado anterior y suma
+   al nuevo sin llevar la cuenta de transiciones
+4. Guarda como nueva marca el mayor updated_at visto
+
+MARGEN: updated_at tiene resolución de segundos y una transacción puede
+confirmar después con un timestamp anterior; cada corrida repite una ventana
+de RESUMEN_MARGEN segundos (recalcular un día dos veces no cambia nada).
+
+LIMITACIÓN: Las citas BORRADAS (eliminar usuario en cascada) no dejan rastro
+en updated_at. Las filas de médicos eliminados se limpian en cada corrida;
+las de pacientes eliminados se corrigen con --completo.
+"""
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .replicas import cursor_lectura
+
+ESTADOS = ('PENDIENTE', 'CONFIRMADA', 'COMPLETADA', 'CANCELADA')
+
+# Minutos "agendados": todo menos lo cancelado
+ESTADOS_CON_MINUTOS = ('PENDIENTE', 'CONFIRMADA', 'COMPLETADA')
+
+MARCA = 'citas_resumen_diario'
+
+INSERTAR_RESUMEN = """
+    INSERT INTO citas_resumen_diario (fecha, medico_id, estado, citas, minutos)
+    SELECT fecha, medico_id, estado, COUNT(*), COALESCE(SUM(duracion), 0)
+    FROM citas
+    WHERE {condicion}
+    GROUP BY fecha, medico_id, estado
+"""
+
+# Pares (médico, fecha) por sentencia: OR de igualdades → rango sobre unique_cita
+TRAMO_DIAS = 200
+
+
+def _recalcular_dias(cursor, dias):
+    """Reemplaza las filas del resumen de los pares (medico_id, fecha) dados."""
+    dias = list(dias)
+    for i in range(0, len(dias), TRAMO_DIAS):
+        tramo = dias[i:i + TRAMO_DIAS]
+        condicion = ' OR '.join(['(medico_id = %s AND fecha = %s)'] * len(tramo))
+        params = [valor for par in tramo for valor in par]
+        cursor.execute(f"DELETE FROM citas_resumen_diario WHERE {condicion}", params)
+        cursor.execute(INSERTAR_RESUMEN.format(condicion=condicion), params)
+
+
+def refrescar_resumen(completo=False, desde=None):
+    """
+    FUNCIÓN: Lleva citas_resumen_diario al día
+
+    PARÁMETROS:
+    - completo: Reconstruir todo (o desde 'desde') en lugar de incremental
+    - desde: date; con completo=True reconstruye solo desde esa fecha
+
+    RETORNA: {'modo': 'completo', 'filas': n} o {'modo': 'incremental', 'dias': n}
+    (pares médico-día recalculados), más 'marca': datetime o None
+    """
+    margen = timedelta(seconds=getattr(settings, 'RESUMEN_MARGEN', 5))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT marca FROM resumen_marcas WHERE nombre = %s FOR UPDATE", [MARCA]
+        )
+        fila = cursor.fetchone()
+        if fila is None:
+            cursor.execute("INSERT INTO resumen_marcas (nombre, marca) VALUES (%s, NULL)", [MARCA])
+        marca = fila[0] if fila else None
+
+        if completo or marca is None:
+            # La marca se lee ANTES de reconstruir: lo que cambie durante la
+            # reconstrucción lo toma la siguiente corrida incremental
+            cursor.execute("SELECT MAX(updated_at) FROM citas")
+            nueva_marca = cursor.fetchone()[0]
+            if desde:
+                cursor.execute("DELETE FROM citas_resumen_diario WHERE fecha >= %s", [desde])
+                cursor.execute(INSERTAR_RESUMEN.format(condicion='fecha >= %s'), [desde])
+            else:
+                cursor.execute("DELETE FROM citas_resumen_diario")
+                cursor.execute(INSERTAR_RESUMEN.format(condicion='1 = 1'))
+            resultado = {'modo': 'completo', 'filas': cursor.rowcount}
+        else:
+            cursor.execute("""
+                SELECT medico_id, fecha, MAX(updated_at)
+                FROM citas
+                WHERE updated_at >= %s
+                GROUP BY medico_id, fecha
+            """, [marca - margen])
+            cambios = cursor.fetchall()
+            nueva_marca = max([m for _, _, m in cambios] + [marca])
+            _recalcular_dias(cursor, [(medico_id, fecha) for medico_id, fecha, _ in cambios])
+            resultado = {'modo': 'incremental', 'dias': len(cambios)}
+
+        # Médicos eliminados: sus citas se borraron en cascada sin tocar updated_at
+        cursor.execute("""
+            DELETE r FROM citas_resumen_diario r
+            LEFT JOIN auth_user_custom u ON u.id = r.medico_id
+            WHERE u.id IS NULL
+        """)
+
+        if nueva_marca is not None:
+            cursor.execute(
+                "UPDATE resumen_marcas SET marca = %s WHERE nombre = %s", [nueva_marca, MARCA]
+            )
+        resultado['marca'] = nueva_marca or marca
+    return resultado
+
+
+def marca_resumen():
+    """Hasta qué citas.updated_at está al día el resumen (o None)."""
+    with cursor_lectura() as cursor:
+        cursor.execute("SELECT marca FROM resumen_marcas WHERE nombre = %s", [MARCA])
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+# ========== REPORTES (solo leen el resumen) ==========
+
+# agrupar → (expresión de la clave, expresión de la etiqueta)
+AGRUPACIONES = {
+    'dia': ('r.fecha', 'r.fecha'),
+    'mes': ("DATE_FORMAT(r.fecha, '%%Y-%%m')", "DATE_FORMAT(r.fecha, '%%Y-%%m')"),
+    'medico': ('r.medico_id', "CONCAT(u.first_name, ' ', u.last_name)"),
+    'especialidad': ('m.especialidad_id', "COALESCE(e.nombre, 'Sin especialidad')"),
+}
+
+
+def leer_filtros_reporte(params):
+    """
+    FUNCIÓN: Extrae y valida los filtros del querystring
+
+    PARÁMETROS GET:
+    - desde / hasta: YYYY-MM-DD (por defecto los últimos 30 días)
+    - agrupar: dia / mes / medico / especialidad (por defecto medico)
+    - medico / especialidad: IDs opcionales
+    """
+    hoy = date.today()
+    filtros = {'desde': hoy - timedelta(days=30), 'hasta': hoy, 'agrupar': 'medico'}
+    for campo in ('desde', 'hasta'):
+        try:
+            filtros[campo] = date.fromisoformat(params.get(campo, ''))
+        except ValueError:
+            pass
+    if params.get('agrupar') in AGRUPACIONES:
+        filtros['agrupar'] = params['agrupar']
+    for campo in ('medico', 'especialidad'):
+        if str(params.get(campo, '')).isdigit():
+            filtros[campo] = int(params[campo])
+    return filtros
+
+
+def reporte_citas(filtros):
+    """
+    FUNCIÓN: Citas y minutos por grupo y estado, desde citas_resumen_diario
+
+    RETORNA: (filas, totales)
+    - filas: [{'clave', 'etiqueta', 'pendiente', ..., 'total', 'minutos'}, ...]
+    - totales: mismo formato con la suma de todas las filas
+    """
+    clave, etiqueta = AGRUPACIONES[filtros['agrupar']]
+    condiciones = ['r.fecha BETWEEN %s AND %s']
+    params = [filtros['desde'], filtros['hasta']]
+    if 'medico' in filtros:
+        condiciones.append('r.medico_id = %s')
+        params.append(filtros['medico'])
+    if 'especialidad' in filtros:
+        condiciones.append('m.especialidad_id = %s')
+        params.append(filtros['especialidad'])
+
+    # auth_user_custom/medicos/especialidades son tablas chicas; citas no se toca
+    sql = f"""
+        SELECT {clave} AS clave, {etiqueta} AS etiqueta, r.estado,
+               SUM(r.citas), SUM(r.minutos)
+        FROM citas_resumen_diario r
+        LEFT JOIN auth_user_custom u ON u.id = r.medico_id
+        LEFT JOIN medicos m ON m.user_id = r.medico_id
+        LEFT JOIN especialidades e ON e.id = m.especialidad_id
+        WHERE {' AND '.join(condiciones)}
+        GROUP BY clave, etiqueta, r.estado
+    """
+
+    def vacio(clave_grupo, etiqueta_grupo):
+        return {
+            'clave': clave_grupo, 'etiqueta': etiqueta_grupo, 'total': 0, 'minutos': 0,
+            **{estado.lower(): 0 for estado in ESTADOS},
+        }
+
+    grupos = {}
+    totales = vacio(None, 'Total')
+    with cursor_lectura() as cursor:
+        cursor.execute(sql, params)
+        for clave_grupo, etiqueta_grupo, estado, citas, minutos in cursor.fetchall():
+            grupo = grupos.setdefault(clave_grupo, vacio(clave_grupo, etiqueta_grupo))
+            for destino in (grupo, totales):
+                destino[estado.lower()] += int(citas)
+                destino['total'] += int(citas)
+                if estado in ESTADOS_CON_MINUTOS:
+                    destino['minutos'] += int(minutos)
+
+    filas = list(grupos.values())
+    if filtros['agrupar'] in ('dia', 'mes'):
+        filas.sort(key=lambda f: str(f['clave']))
+    else:
+        filas.sort(key=lambda f: -f['total'])
+    return filas, totales
@@ -0,0 +1,395 @@
+# clinica_app/reservas.py
+
+"""
+=== AGENDAR CITAS SIN CONDICIONES DE CARRERA ===
+
+PROPÓSITO PRINCIPAL:
+- Verificar conflicto e insertar la cita en UNA transacción
+- Detectar solapamientos reales (hora + duración), no solo la misma hora
+- Devolver la cita creada sin volver a leerla de la base de datos
+
+PROBLEMA QUE RESUELVE:
+- agendar_cita_view hacía exists() → INSERT → Cita.objects.get(): tres viajes
+  a la BD, y dos reservas simultáneas podían pasar ambas el exists()
+- unique_cita (medico_id, fecha, hora) solo detecta citas que empiezan a la
+  misma hora: 10:00 (60 min) y 10:30 quedaban ambas agendadas
+
+CÓMO FUNCIONA:
+1. SELECT ... FOR UPDATE de las filas del médico y del paciente en
+   auth_user_custom: las reservas del mismo médico se ejecutan en fila
+   (y de paso trae los datos que necesitan los correos)
+2. INSERT ... SELECT ... WHERE NOT EXISTS (cita activa solapada):
+   si no insertó ninguna fila, había conflicto
+
+LOTES (agendar_lote): series recurrentes o CSV validados en memoria contra
+las citas existentes e insertados con executemany; ver api_agendar_lote y
+'manage.py agendar_lote'
+"""
+
+import csv
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+
+from django.db import IntegrityError, connection, transaction
+
+from .correos import encolar_correo
+from .disponibilidad import ESTADOS_ACTIVOS, a_minutos, fusionar_intervalos
+from .metricas import contar
+from .models import Cita, CustomUser
+
+# Inserta solo si ninguna cita activa del médico se solapa con [inicio, fin)
+INSERTAR_SI_LIBRE = """
+    INSERT INTO citas (paciente_id, medico_id, fecha, hora, duracion, motivo, estado)
+    SELECT %s, %s, %s, %s, %s, %s, 'PENDIENTE' FROM DUAL
+    WHERE NOT EXISTS (
+        SELECT 1 FROM citas c
+        WHERE c.medico_id = %s
+        AND c.fecha = %s
+        AND c.estado IN ('PENDIENTE', 'CONFIRMADA')
+        AND c.hora < %s
+        AND ADDTIME(c.hora, SEC_TO_TIME(c.duracion * 60)) > %s
+    )
+"""
+
+
+class ConflictoHorario(Exception):
+    """El médico ya tiene una cita activa que se solapa con el horario pedido."""
+
+
+def _a_fecha(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(valor)
+
+
+def _a_hora(valor):
+    return valor if isinstance(valor, time) else time.fromisoformat(valor)
+
+
+def fin_cita(fecha, hora, duracion):
+    """Hora de término; se corta en 23:59:59 si pasaría de medianoche."""
+    fin = datetime.combine(fecha, hora) + timedelta(minutes=duracion)
+    return fin.time() if fin.date() == fecha else time(23, 59, 59)
+
+
+def agendar_cita(paciente_id, medico_id, fecha, hora, duracion=30, motivo=''):
+    """
+    FUNCIÓN: Agenda una cita de forma atómica
+
+    PARÁMETROS:
+    - fecha / hora: date/time o texto ISO ('2025-09-26', '10:00')
+    - duracion: Minutos
+
+    RETORNA: Cita con id, médico y paciente ya cargados (lista para los correos)
+
+    EXCEPCIONES:
+    - ConflictoHorario: el horario se solapa con otra cita activa del médico
+    - ValueError: datos inválidos, médico o paciente inexistente
+    """
+    paciente_id, medico_id = int(paciente_id), int(medico_id)
+    fecha, hora, duracion = _a_fecha(fecha), _a_hora(hora), int(duracion)
+    if duracion <= 0:
+        raise ValueError('La duración debe ser mayor que cero')
+    fin = fin_cita(fecha, hora, duracion)
+
+    with transaction.atomic():
+        # Bloquear médico y paciente (orden por id: evita interbloqueos)
+        usuarios = {
+            u.id: u for u in CustomUser.objects.select_for_update()
+            .filter(id__in=[medico_id, paciente_id]).order_by('id')
+        }
+        medico, paciente = usuarios.get(medico_id), usuarios.get(paciente_id)
+        if medico is None or not medico.is_medico:
+            raise ValueError('El médico seleccionado no existe')
+        if paciente is None or not paciente.is_paciente:
+            raise ValueError('El paciente seleccionado no existe')
+
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(INSERTAR_SI_LIBRE, [
+                    paciente_id, medico_id, fecha, hora, duracion, motivo or '',
+                    medico_id, fecha, fin, hora,
+                ])
+            except IntegrityError:
+                # unique_cita: misma hora de inicio (incluye citas canceladas)
+                raise ConflictoHorario('Ya existe una cita en ese horario')
+            if cursor.rowcount == 0:
+                raise ConflictoHorario('El horario se cruza con otra cita del médico')
+            cita_id = cursor.lastrowid
+
+    # Cita armada en memoria: sin Cita.objects.get() ni consultas por las FK
+    cita = Cita(
+        id=cita_id, paciente=paciente, medico=medico, fecha=fecha, hora=hora,
+        duracion=duracion, motivo=motivo or '', estado='PENDIENTE',
+    )
+    cita._state.adding = False
+    return cita
+
+
+# ========== RESERVAS EN LOTE Y SERIES RECURRENTES ==========
+
+FRECUENCIAS = {'diaria': 1, 'semanal': 7, 'mensual': None}
+
+INSERTAR_CITA = """
+    INSERT INTO citas (paciente_id, medico_id, fecha, hora, duracion, motivo, estado)
+    VALUES (%s, %s, %s, %s, %s, %s, 'PENDIENTE')
+"""
+
+
+class SolicitudCita:
+    """
+    CLASE: Una cita pedida dentro de un lote (fila de CSV o repetición de serie)
+
+    - fila: Número de fila/repetición para reportar rechazos
+    """
+
+    __slots__ = ('fila', 'paciente_id', 'medico_id', 'fecha', 'hora', 'duracion', 'motivo')
+
+    def __init__(self, fila, paciente_id, medico_id, fecha, hora, duracion=30, motivo=''):
+        self.fila = fila
+        self.paciente_id = int(paciente_id)
+        self.medico_id = int(medico_id)
+        self.fecha = _a_fecha(fecha)
+        self.hora = _a_hora(hora)
+        self.duracion = int(duracion or 30)
+        self.motivo = motivo or ''
+        if self.duracion <= 0:
+            raise ValueError('La duración debe ser mayor que cero')
+
+    @property
+    def intervalo(self):
+        inicio = self.hora.hour * 60 + self.hora.minute
+        return inicio, inicio + self.duracion
+
+
+def generar_serie(paciente_id, medico_id, fecha_inicio, hora, veces, frecuencia='semanal',
+                  intervalo=1, duracion=30, motivo=''):
+    """
+    FUNCIÓN: Expande una regla de recurrencia en solicitudes individuales
+
+    EJEMPLO: fototerapia semanal 12 semanas →
+        generar_serie(9, 6, '2025-10-06', '09:00', 12, 'semanal')
+
+    PARÁMETROS:
+    - frecuencia: 'diaria', 'semanal' o 'mensual' (mismo día del mes;
+      si no existe, el último día de ese mes)
+    - intervalo: Cada cuántas unidades (2 + 'semanal' = cada dos semanas)
+    """
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError(f"Frecuencia inválida: {frecuencia}")
+    fecha_inicio, intervalo = _a_fecha(fecha_inicio), int(intervalo)
+    solicitudes = []
+    for n in range(int(veces)):
+        if FRECUENCIAS[frecuencia]:
+            fecha = fecha_inicio + timedelta(days=FRECUENCIAS[frecuencia] * intervalo * n)
+        else:
+            meses = fecha_inicio.month - 1 + intervalo * n
+            año, mes = fecha_inicio.year + meses // 12, meses % 12 + 1
+            siguiente = date(año + (mes == 12), mes % 12 + 1, 1)
+            fecha = date(año, mes, min(fecha_inicio.day, (siguiente - timedelta(days=1)).day))
+        solicitudes.append(SolicitudCita(
+            n + 1, paciente_id, medico_id, fecha, hora, duracion, motivo))
+    return solicitudes
+
+
+def leer_csv(lineas):
+    """
+    FUNCIÓN: Lee solicitudes desde un CSV con encabezado
+
+    COLUMNAS: paciente_id, medico_id, fecha, hora [, duracion, motivo]
+
+    RETORNA: (solicitudes, rechazadas) — las filas mal formadas se rechazan
+    sin detener la lectura
+    """
+    solicitudes, rechazadas = [], []
+    for numero, fila in enumerate(csv.DictReader(lineas), start=2):  # 1 = encabezado
+        try:
+            solicitudes.append(SolicitudCita(
+                numero, fila['paciente_id'], fila['medico_id'], fila['fecha'],
+                fila['hora'], fila.get('duracion'), fila.get('motivo'),
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            rechazadas.append({'fila': numero, 'motivo': f'Fila inválida: {e}'})
+    return solicitudes, rechazadas
+
+
+class IndiceOcupacion:
+    """
+    CLASE: Intervalos ocupados por (médico, fecha) en memoria
+
+    PROPÓSITO:
+    - Validar un lote completo contra las citas existentes con UNA consulta
+    - Cada intervalo aceptado se agrega, así el lote no se solapa consigo mismo
+    - Listas ordenadas y fusionadas: cada verificación es una búsqueda binaria
+    """
+
+    __slots__ = ('_ocupados', '_inicios')
+
+    def __init__(self):
+        self._ocupados = {}   # (medico_id, fecha) -> [(inicio, fin), ...] fusionados
+        self._inicios = set()  # (medico_id, fecha, hora) de TODAS las citas (unique_cita)
+
+    @classmethod
+    def cargar(cls, medico_ids, fecha_inicio, fecha_fin):
+        indice = cls()
+        crudos = {}
+        filas = Cita.objects.filter(
+            medico_id__in=list(medico_ids), fecha__range=[fecha_inicio, fecha_fin],
+        ).values_list('medico_id', 'fecha', 'hora', 'duracion', 'estado')
+        for medico_id, fecha, hora, duracion, estado in filas:
+            inicio = a_minutos(hora)
+            indice._inicios.add((medico_id, fecha, inicio))
+            if estado in ESTADOS_ACTIVOS:
+                crudos.setdefault((medico_id, fecha), []).append((inicio, inicio + (duracion or 30)))
+        indice._ocupados = {clave: fusionar_intervalos(v) for clave, v in crudos.items()}
+        return indice
+
+    def conflicto(self, solicitud):
+        """Retorna el motivo del conflicto o None si el horario está libre."""
+        inicio, fin = solicitud.intervalo
+        if (solicitud.medico_id, solicitud.fecha, inicio) in self._inicios:
+            return 'Ya existe una cita en ese horario'
+        ocupados = self._ocupados.get((solicitud.medico_id, solicitud.fecha), ())
+        i = bisect_right(ocupados, (inicio, float('inf')))
+        if (i > 0 and ocupados[i - 1][1] > inicio) or (i < len(ocupados) and ocupados[i][0] < fin):
+            return 'El horario se cruza con otra cita del médico'
+        return None
+
+    def agregar(self, solicitud):
+        clave = (solicitud.medico_id, solicitud.fecha)
+        self._inicios.add((*clave, solicitud.intervalo[0]))
+        self._ocupados[clave] = fusionar_intervalos(
+            [*self._ocupados.get(clave, ()), solicitud.intervalo])
+
+
+def agendar_lote(solicitudes, simular=False):
+    """
+    FUNCIÓN: Valida e inserta un lote de citas en una transacción
+
+    PROCESO:
+    1. Bloquea (FOR UPDATE) médicos y pacientes involucrados, como agendar_cita()
+    2. Carga las citas existentes del rango en un IndiceOcupacion (1 consulta)
+    3. Valida cada solicitud en memoria; las válidas se insertan con executemany
+    4. Relee los IDs de las citas creadas con 1 consulta (unique_cita)
+
+    PARÁMETROS:
+    - simular: Solo validar, sin insertar
+
+    RETORNA: {'creadas': [Cita, ...], 'rechazadas': [{'fila': n, 'motivo': str}, ...]}
+    """
+    if not solicitudes:
+        return {'creadas': [], 'rechazadas': []}
+
+    medico_ids = {s.medico_id for s in solicitudes}
+    paciente_ids = {s.paciente_id for s in solicitudes}
+    rechazadas, validas = [], []
+
+    with transaction.atomic():
+        usuarios = {
+            u.id: u for u in CustomUser.objects.select_for_update()
+            .filter(id__in=medico_ids | paciente_ids).order_by('id')
+        }
+        indice = IndiceOcupacion.cargar(
+            medico_ids,
+            min(s.fecha for s in solicitudes),
+            max(s.fecha for s in solicitudes),
+        )
+
+        for solicitud in sorted(solicitudes, key=lambda s: s.fila):
+            medico = usuarios.get(solicitud.medico_id)
+            paciente = usuarios.get(solicitud.paciente_id)
+            if medico is None or not medico.is_medico:
+                motivo = 'El médico seleccionado no existe'
+            elif paciente is None or not paciente.is_paciente:
+                motivo = 'El paciente seleccionado no existe'
+            else:
+                motivo = indice.conflicto(solicitud)
+                if motivo and not simular:
+                    contar('clinica_citas_conflictos_total', origen='lote')
+            if motivo:
+                rechazadas.append({'fila': solicitud.fila, 'motivo': motivo})
+            else:
+                indice.agregar(solicitud)
+                validas.append(solicitud)
+
+        if simular or not validas:
+            return {'creadas': [], 'rechazadas': rechazadas}
+
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERTAR_CITA, [
+                [s.paciente_id, s.medico_id, s.fecha, s.hora, s.duracion, s.motivo]
+                for s in validas
+            ])
+
+        # IDs: una consulta por (médico, fecha, hora), únicos por unique_cita
+        ids = {
+            (medico_id, fecha, a_minutos(hora)): cita_id
+            for cita_id, medico_id, fecha, hora in Cita.objects.filter(
+                medico_id__in=medico_ids,
+                fecha__in={s.fecha for s in validas},
+                estado='PENDIENTE',
+            ).values_list('id', 'medico_id', 'fecha', 'hora')
+        }
+
+    creadas = []
+    for s in validas:
+        cita = Cita(
+            id=ids.get((s.medico_id, s.fecha, s.intervalo[0])),
+            paciente=usuarios[s.paciente_id], medico=usuarios[s.medico_id],
+            fecha=s.fecha, hora=s.hora, duracion=s.duracion, motivo=s.motivo,
+            estado='PENDIENTE',
+        )
+        cita._state.adding = False
+        creadas.append(cita)
+    contar('clinica_citas_creadas_total', len(creadas), origen='lote')
+    return {'creadas': creadas, 'rechazadas': rechazadas}
+
+
+def notificar_lote(citas):
+    """
+    FUNCIÓN: Un correo resumen por paciente y uno por médico (no uno por cita)
+
+    RETORNA: True si todos los correos quedaron en cola
+    """
+    por_paciente, por_medico = {}, {}
+    for cita in sorted(citas, key=lambda c: (c.fecha, c.hora)):
+        por_paciente.setdefault(cita.paciente_id, []).append(cita)
+        por_medico.setdefault(cita.medico_id, []).append(cita)
+
+    ok = True
+    for grupo in por_paciente.values():
+        paciente = grupo[0].paciente
+        lineas = '\n'.join(
+            f"    - {c.fecha.strftime('%d/%m/%Y')} {c.hora.strftime('%H:%M')} "
+            f"con Dr./Dra. {c.medico.get_full_name()} ({c.duracion} minutos)"
+            for c in grupo
+        )
+        ok &= encolar_correo('Confirmación de Citas - Clínica Valencia', f"""
+    Estimado/a {paciente.get_full_name()},
+
+    Se agendaron {len(grupo)} cita(s) a su nombre:
+
+{lineas}
+
+    Por favor, llegue 10 minutos antes de cada cita.
+
+    Atentamente,
+    Clínica Valencia.
+    """, [paciente.email])
+
+    for grupo in por_medico.values():
+        medico = grupo[0].medico
+        lineas = '\n'.join(
+            f"    - {c.fecha.strftime('%d/%m/%Y')} {c.hora.strftime('%H:%M')} "
+            f"{c.paciente.get_full_name()} ({c.duracion} minutos)"
+            for c in grupo
+        )
+        ok &= encolar_correo('Nuevas Citas Agendadas - Clínica Valencia', f"""
+    Dr./Dra. {medico.get_full_name()},
+
+    Se agendaron {len(grupo)} cita(s) nuevas:
+
+{lineas}
+
+    Atentamente,
+    Sistema de Clínica Valencia.
+    """, [medico.email])
+    return ok
@@ -1,3 +1,644 @@
-from django.test import TestCase
+# clinica_app/tests.py
 
+"""
+=== PRUEBAS DE LA LÓGICA PURA (sin MySQL) ===
 
+Todas son SimpleTestCase: no tocan la base de datos. Las tablas son
+managed=False, así que lo que consulta MySQL se prueba contra un servidor real;
+aquí el SQL directo se verifica con un cursor simulado (mock).
+
+EJECUTAR: python manage.py test clinica_app
+"""
+
+import json
+import tempfile
+import threading
+import time as reloj
+from datetime import date, datetime, time, timedelta, timezone as tz
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.core import mail
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import analitica, correos, replicas
+from .backends import _CacheUsuarios
+from .calendario import codificar_token, decodificar_token
+from .conexiones import PoolAgotado, PoolConexiones
+from .disponibilidad import (
+    HorarioMedico, buscar_primeros_huecos, construir_mapas, generar_slots,
+    mascara_bloques, mascara_grilla, primer_hueco, restar_intervalos,
+    validar_duracion_paso,
+)
+from .historial import codificar_cursor, decodificar_cursor
+from .metricas import BUCKETS_CORREO, contar, exponer, observar, registro
+from .reservas import IndiceOcupacion, SolicitudCita, generar_serie, leer_csv
+from .usuarios import IndicePacientes, codificar_cursor_usuario, decodificar_cursor_usuario
+from .views import metricas_view
+
+LUNES = date(2024, 6, 3)
+
+
+def cursor_simulado(modulo):
+    """Parchea modulo.connection y retorna (parche, cursor usado en 'with connection.cursor()')."""
+    parche = mock.patch(f'clinica_app.{modulo}.connection')
+    conexion = parche.start()
+    return parche, conexion.cursor.return_value.__enter__.return_value
+
+
+def serie(nombre, **etiquetas):
+    """Valor actual de un contador de metricas.registro (0 si no existe)."""
+    return registro.contadores.get((nombre, tuple(sorted(etiquetas.items()))), 0)
+
+
+@override_settings(CORREOS_BACKOFF_BASE=30, CORREOS_BACKOFF_MAX=100,
+                   CORREOS_LEASE=120, CORREOS_MAX_INTENTOS=3)
+class CorreosTests(SimpleTestCase):
+
+    def setUp(self):
+        parche, self.cursor = cursor_simulado('correos')
+        self.addCleanup(parche.stop)
+        self.cursor.rowcount = 0
+        self.cursor.fetchall.return_value = []
+
+    def test_backoff_exponencial_con_tope(self):
+        self.assertEqual(
+            [correos._segundos_backoff(n) for n in (0, 1, 2, 3)], [30, 30, 60, 100]
+        )
+
+    def test_tomar_lote_cuenta_el_intento_y_aplica_el_lease(self):
+        correos.tomar_lote(10)
+        (vencidos, parametros_vencidos), (tomar, parametros), (leer, lote) = [
+            c.args for c in self.cursor.execute.call_args_list
+        ]
+        # Primero: leases vencidos sin intentos restantes pasan a FALLIDO
+        self.assertIn("estado='FALLIDO'", vencidos)
+        self.assertEqual(parametros_vencidos, [3])
+        # Después: se toma el lote sumando el intento y con lease de CORREOS_LEASE
+        self.assertIn('intentos=intentos + 1', tomar)
+        self.assertEqual(parametros[1:], [120, 3, 10])
+        self.assertEqual(lote, [parametros[0]])
+
+    def test_marcar_error_reprograma_hasta_el_maximo(self):
+        self.assertTrue(correos._marcar_error(7, 2, 'timeout'))
+        estado, intentos, error, espera, correo_id = self.cursor.execute.call_args.args[1]
+        self.assertEqual((estado, intentos, error, espera, correo_id),
+                         ('PENDIENTE', 2, 'timeout', 60, 7))
+
+        self.assertFalse(correos._marcar_error(7, 3, 'timeout'))
+        self.assertEqual(self.cursor.execute.call_args.args[1][0], 'FALLIDO')
+
+    def test_procesar_lote_envia_por_una_conexion(self):
+        lote = [
+            (1, 'a@correo.com', 'Cita', 'Texto', 1, 5),
+            (2, 'b@correo.com,c@correo.com', 'Cita', 'Texto', 1, None),
+        ]
+        with mock.patch.object(correos, 'tomar_lote', return_value=lote), \
+                mock.patch.object(correos, '_marcar_enviados') as enviados:
+            resultado = correos.procesar_lote(backend='locmem')
+        self.assertEqual(resultado, {'enviados': 2, 'reintentos': 0, 'fallidos': 0})
+        enviados.assert_called_once_with([1, 2])
+        self.assertEqual([m.to for m in mail.outbox],
+                         [['a@correo.com'], ['b@correo.com', 'c@correo.com']])
+
+    def test_procesar_lote_sin_conexion_reprograma_todo(self):
+        lote = [(1, 'a@correo.com', 'A', '', 1, 0), (2, 'b@correo.com', 'B', '', 3, 0)]
+        smtp = mock.Mock()
+        smtp.open.side_effect = OSError('sin red')
+        with mock.patch.object(correos, 'tomar_lote', return_value=lote), \
+                mock.patch.object(correos, 'get_connection', return_value=smtp):
+            resultado = correos.procesar_lote()
+        self.assertEqual(resultado, {'enviados': 0, 'reintentos': 1, 'fallidos': 1})
+
+
+class IntervalosSlotsTests(SimpleTestCase):
+
+    def test_restar_intervalos(self):
+        self.assertEqual(restar_intervalos((480, 1020), [(540, 600)]), [(480, 540), (600, 1020)])
+        self.assertEqual(restar_intervalos((480, 1020), []), [(480, 1020)])
+        # Ocupados que salen de la ventana por ambos lados
+        self.assertEqual(restar_intervalos((480, 600), [(400, 500), (590, 700)]), [(500, 590)])
+        self.assertEqual(restar_intervalos((480, 600), [(400, 700)]), [])
+
+    def test_generar_slots_alineados_a_la_grilla(self):
+        # Libre desde 9:45: el primer slot de la grilla de 30 (origen 8:00) es 10:00
+        self.assertEqual(generar_slots([(585, 680)], 30, 30, 480), ['10:00', '10:30'])
+
+    def test_generar_slots_respeta_la_duracion(self):
+        self.assertEqual(generar_slots([(480, 540)], 45, 15, 480), ['08:00', '08:15'])
+        self.assertEqual(generar_slots([(480, 500)], 30, 30, 480), [])
+
+    def test_generar_slots_rechaza_paso_o_duracion_no_positivos(self):
+        for duracion, paso in ((30, 0), (30, -15), (0, 30), (-30, 30)):
+            with self.assertRaises(ValueError):
+                generar_slots([(480, 1020)], duracion, paso, 480)
+
+    def test_validar_duracion_paso(self):
+        self.assertEqual(validar_duracion_paso(30, 15), (30, 15))
+        for duracion, paso in ((30, 0), (30, 4), (0, 30), (241, 30), (30, 241)):
+            with self.assertRaises(ValueError):
+                validar_duracion_paso(duracion, paso)
+        self.assertEqual(validar_duracion_paso(480, 30, maximo=480), (480, 30))
+
+
+class BitmapHuecosTests(SimpleTestCase):
+
+    def setUp(self):
+        self.horario = HorarioMedico(time(8, 0), time(12, 0), 'LUN,MAR')
+
+    def test_mascara_bloques_redondea_hacia_afuera(self):
+        # 10:02-10:31 ocupa los bloques de 10:00 a 10:35 (120..126)
+        self.assertEqual(mascara_bloques(602, 631), ((1 << 7) - 1) << 120)
+        self.assertEqual(mascara_bloques(600, 600), 0)
+
+    def test_mascara_grilla(self):
+        self.assertEqual(mascara_grilla(480, 600, 30), sum(1 << b for b in (96, 102, 108, 114)))
+
+    def test_primer_hueco_dia_libre(self):
+        self.assertEqual(primer_hueco(0, self.horario, 30, 30), 480)
+
+    def test_primer_hueco_salta_citas_y_huecos_cortos(self):
+        # 8:00-8:30 y 9:00-10:00 ocupados: el hueco 8:30-9:00 no alcanza para 45 minutos
+        ocupado = mascara_bloques(480, 510) | mascara_bloques(540, 600)
+        self.assertEqual(primer_hueco(ocupado, self.horario, 30, 30), 510)
+        self.assertEqual(primer_hueco(ocupado, self.horario, 45, 30), 600)
+
+    def test_primer_hueco_desde_y_fin_del_horario(self):
+        self.assertEqual(primer_hueco(0, self.horario, 30, 30, desde=601), 630)
+        self.assertIsNone(primer_hueco(0, self.horario, 30, 30, desde=700))
+        self.assertIsNone(primer_hueco(mascara_bloques(480, 720), self.horario, 30, 30))
+
+    def test_horario_no_alineado_se_redondea_hacia_adentro(self):
+        horario = HorarioMedico(time(8, 7), time(11, 52), 'LUN')
+        # Nunca 08:05 (antes del horario): el primer slot es 08:10
+        self.assertEqual(mascara_grilla(487, 712, 30) & -mascara_grilla(487, 712, 30), 1 << 98)
+        self.assertEqual(primer_hueco(0, horario, 30, 30), 490)
+        # 11:40 + 15 minutos terminaría después de las 11:52 redondeadas a 11:50
+        self.assertIsNone(primer_hueco(0, horario, 15, 30, desde=671))
+
+    def test_buscar_primeros_huecos(self):
+        martes = LUNES + timedelta(days=1)
+        mapas = construir_mapas([
+            (1, LUNES, time(8, 0), 240),       # Médico 1: lunes lleno
+            (2, LUNES, time(8, 0), None),      # Médico 2: sin duración = 30 minutos
+        ])
+        medicos = [(1, self.horario), (2, self.horario)]
+        fechas = [LUNES, martes]
+        self.assertEqual(
+            buscar_primeros_huecos(medicos, mapas, fechas),
+            [(LUNES, 510, 2), (martes, 480, 1)],
+        )
+        self.assertEqual(
+            buscar_primeros_huecos(medicos, mapas, fechas, desde=(martes, 540)),
+            [(martes, 540, 1), (martes, 540, 2)],
+        )
+        self.assertEqual(len(buscar_primeros_huecos(medicos, mapas, fechas, limite=1)), 1)
+
+
+@override_settings(USUARIOS_CACHE_TTL=60, USUARIOS_CACHE_TTL_LOCAL=5, USUARIOS_CACHE_ALIAS=None)
+class CacheUsuariosTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = _CacheUsuarios()
+        self.cargas = []
+
+    def cargar(self, user_id):
+        self.cargas.append(user_id)
+        return SimpleNamespace(id=user_id, role=2) if user_id < 100 else None
+
+    def test_segundo_acceso_no_consulta_y_se_mide(self):
+        antes = {r: serie('clinica_usuarios_cache_total', resultado=r) for r in ('acierto', 'fallo')}
+        primero = self.cache.obtener(5, self.cargar)
+        segundo = self.cache.obtener(5, self.cargar)
+
+        self.assertEqual(self.cargas, [5])
+        self.assertIsNot(primero, segundo)  # Cada request recibe su copia
+        self.assertEqual(self.cache.estadisticas()['tasa_aciertos'], 0.5)
+        self.assertEqual(serie('clinica_usuarios_cache_total', resultado='acierto'),
+                         antes['acierto'] + 1)
+        self.assertEqual(serie('clinica_usuarios_cache_total', resultado='fallo'),
+                         antes['fallo'] + 1)
+
+    def test_invalidar_e_inexistentes(self):
+        self.cache.obtener(5, self.cargar)
+        self.cache.invalidar(5)
+        self.cache.obtener(5, self.cargar)
+        self.assertIsNone(self.cache.obtener(100, self.cargar))
+        self.assertIsNone(self.cache.obtener(100, self.cargar))  # No se cachea
+        self.assertEqual(self.cargas, [5, 5, 100, 100])
+
+
+class CursorHistorialTests(SimpleTestCase):
+
+    def test_ida_y_vuelta(self):
+        fila = SimpleNamespace(fecha=date(2024, 6, 3), hora=time(9, 30), id=42)
+        token = codificar_cursor(fila)
+        self.assertEqual(token, '2024-06-03_09:30:00_42')
+        self.assertEqual(decodificar_cursor(token), (date(2024, 6, 3), time(9, 30), 42))
+
+    def test_acepta_timedelta_de_mysql(self):
+        fila = SimpleNamespace(fecha=date(2024, 6, 3), hora=timedelta(hours=14, minutes=5), id=7)
+        self.assertEqual(codificar_cursor(fila), '2024-06-03_14:05:00_7')
+
+    def test_token_invalido(self):
+        for token in (None, '', 'basura', '2024-13-01_09:00:00_1', '2024-06-03_09:00:00_x'):
+            self.assertIsNone(decodificar_cursor(token))
+
+
+class TokenCalendarioTests(SimpleTestCase):
+
+    def test_token_con_zona(self):
+        momento = datetime(2024, 6, 3, 12, 0, 5, tzinfo=tz.utc)
+        self.assertEqual(decodificar_token(codificar_token(momento)), momento)
+
+    def test_token_sin_zona_se_rechaza(self):
+        self.assertIsNone(decodificar_token('2024-06-03T12:00:05'))
+
+    def test_token_invalido(self):
+        for token in (None, '', 'ayer', '2024-06-32T00:00:00+00:00'):
+            self.assertIsNone(decodificar_token(token))
+
+
+class SeriesYLotesTests(SimpleTestCase):
+
+    def fechas(self, *args, **kwargs):
+        return [s.fecha for s in generar_serie(9, 6, *args, **kwargs)]
+
+    def test_serie_semanal_con_intervalo(self):
+        solicitudes = generar_serie(9, 6, '2024-06-03', '09:00', 3, 'semanal', intervalo=2)
+        self.assertEqual([s.fecha for s in solicitudes],
+                         [date(2024, 6, 3), date(2024, 6, 17), date(2024, 7, 1)])
+        self.assertEqual([s.fila for s in solicitudes], [1, 2, 3])
+        self.assertEqual(solicitudes[0].hora, time(9, 0))
+
+    def test_serie_mensual_el_31_usa_el_ultimo_dia_del_mes(self):
+        self.assertEqual(
+            self.fechas('2024-01-31', '09:00', 4, 'mensual'),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+
+    def test_serie_mensual_cruza_diciembre(self):
+        self.assertEqual(
+            self.fechas('2024-11-30', '09:00', 4, 'mensual'),
+            [date(2024, 11, 30), date(2024, 12, 30), date(2025, 1, 30), date(2025, 2, 28)],
+        )
+        self.assertEqual(
+            self.fechas('2024-12-31', '09:00', 2, 'mensual', intervalo=12),
+            [date(2024, 12, 31), date(2025, 12, 31)],
+        )
+
+    def test_serie_frecuencia_invalida(self):
+        with self.assertRaises(ValueError):
+            generar_serie(9, 6, '2024-06-03', '09:00', 3, 'anual')
+
+    def test_leer_csv_rechaza_filas_sin_detenerse(self):
+        solicitudes, rechazadas = leer_csv([
+            'paciente_id,medico_id,fecha,hora,duracion,motivo',
+            '9,6,2024-06-03,09:00,,Control',
+            '9,6,2024-06-31,09:00,30,',
+            '9,x,2024-06-03,10:00,30,',
+            '9,6,2024-06-03,11:00,0,',
+            '9,6,2024-06-04,11:00,45,Piel',
+        ])
+        self.assertEqual([(s.fila, s.duracion, s.motivo) for s in solicitudes],
+                         [(2, 30, 'Control'), (6, 45, 'Piel')])
+        self.assertEqual([r['fila'] for r in rechazadas], [3, 4, 5])
+
+    def test_leer_csv_sin_columnas_obligatorias(self):
+        solicitudes, rechazadas = leer_csv(['paciente_id,fecha', '9,2024-06-03'])
+        self.assertEqual(solicitudes, [])
+        self.assertEqual(rechazadas[0]['fila'], 2)
+
+
+class IndiceOcupacionTests(SimpleTestCase):
+
+    def setUp(self):
+        with mock.patch('clinica_app.reservas.Cita') as citas:
+            citas.objects.filter.return_value.values_list.return_value = [
+                (6, LUNES, time(10, 0), 60, 'CONFIRMADA'),
+                (6, LUNES, time(10, 30), 60, 'PENDIENTE'),   # Se fusiona: 10:00-11:30
+                (6, LUNES, time(12, 0), 30, 'CANCELADA'),
+            ]
+            self.indice = IndiceOcupacion.cargar([6], LUNES, LUNES)
+
+    def conflicto(self, hora, duracion=30, medico_id=6, fecha=LUNES):
+        return self.indice.conflicto(SolicitudCita(1, 9, medico_id, fecha, hora, duracion))
+
+    def test_solapes_y_bordes(self):
+        self.assertIsNone(self.conflicto('09:30'))            # Termina justo a las 10:00
+        self.assertIsNotNone(self.conflicto('09:45'))         # Entra en 10:00-11:30
+        self.assertIsNotNone(self.conflicto('11:00', 15))     # Dentro del bloque fusionado
+        self.assertIsNone(self.conflicto('11:30'))            # Empieza cuando termina
+        self.assertIsNotNone(self.conflicto('08:00', 240))    # Lo cubre entero
+        self.assertIsNone(self.conflicto('10:00', medico_id=7))
+        self.assertIsNone(self.conflicto('10:00', fecha=LUNES + timedelta(days=1)))
+
+    def test_cancelada_solo_bloquea_la_misma_hora(self):
+        # unique_cita (medico_id, fecha, hora) incluye las canceladas
+        self.assertEqual(self.conflicto('12:00'), 'Ya existe una cita en ese horario')
+        self.assertIsNone(self.conflicto('12:05'))
+
+    def test_agregar_evita_solapes_dentro_del_lote(self):
+        self.indice.agregar(SolicitudCita(1, 9, 6, LUNES, '14:00', 45))
+        self.assertIsNotNone(self.conflicto('14:30'))
+        self.assertIsNone(self.conflicto('14:45'))
+
+
+class CursorUsuariosTests(SimpleTestCase):
+
+    def test_ida_y_vuelta(self):
+        # El apellido puede traer '_': solo se separan los dos primeros campos
+        usuario = SimpleNamespace(role=3, id=15, last_name='De_la Cruz')
+        token = codificar_cursor_usuario(usuario)
+        self.assertEqual(decodificar_cursor_usuario(token), (3, 'De_la Cruz', 15))
+
+    def test_token_invalido(self):
+        for token in (None, '', '3_15', 'x_15_Perez', '3_x_Perez'):
+            self.assertIsNone(decodificar_cursor_usuario(token))
+
+
+class IndicePacientesTests(SimpleTestCase):
+
+    FILAS = [
+        (1, 'José', 'Pérez', 'jperez@correo.com', '555-1234'),
+        (2, 'Josefina', 'Gómez', 'josefina@correo.com', '555-9876'),
+        (3, 'Ana', 'Joséfa', 'ana@correo.com', None),
+    ]
+
+    def setUp(self):
+        parche = mock.patch('clinica_app.usuarios.CustomUser')
+        usuarios = parche.start()
+        self.addCleanup(parche.stop)
+        usuarios.objects.filter.return_value.values_list.return_value = self.FILAS
+        self.indice = IndicePacientes()
+
+    def ids(self, texto, limite=10):
+        return [p['id'] for p in self.indice.buscar(texto, limite)]
+
+    def test_prefijo_sin_acentos_ni_mayusculas(self):
+        # 'jose' (José) es más exacta que 'josefa' y 'josefina'
+        self.assertEqual(self.ids('JOSE'), [1, 3, 2])
+        self.assertEqual(self.ids('pérez j'), [1])
+
+    def test_email_y_telefono(self):
+        self.assertEqual(self.ids('ana@'), [3])
+        self.assertEqual(self.ids('555-98'), [2])
+
+    def test_limite_y_texto_vacio(self):
+        self.assertEqual(len(self.ids('jose', limite=2)), 2)
+        self.assertEqual(self.ids('   '), [])
+        self.assertEqual(self.ids('zz'), [])
+
+    def test_resultado_para_mostrar(self):
+        self.assertEqual(self.indice.buscar('gomez')[0], {
+            'id': 2, 'nombre': 'Josefina Gómez',
+            'email': 'josefina@correo.com', 'telefono': '555-9876',
+        })
+
+
+class MetricasTests(SimpleTestCase):
+
+    def test_exponer_contadores_e_histogramas(self):
+        contar('clinica_login_total', resultado='prueba_exponer')
+        contar('clinica_login_total', 2, resultado='prueba_exponer')
+        observar('clinica_correo_envio_seconds', 0.07, prueba='exponer')
+        observar('clinica_correo_envio_seconds', 40, prueba='exponer')
+        texto = exponer({'clinica_prueba': ('Medidor', [({'estado': 'A"B'}, 4)])})
+
+        self.assertIn('# TYPE clinica_login_total counter', texto)
+        self.assertIn('clinica_login_total{resultado="prueba_exponer"} 3\n', texto)
+        # Buckets acumulados: 0.07 cae en le=0.1; 40 solo en +Inf
+        self.assertIn('clinica_correo_envio_seconds_bucket{prueba="exponer",le="0.05"} 0\n', texto)
+        self.assertIn('clinica_correo_envio_seconds_bucket{prueba="exponer",le="0.1"} 1\n', texto)
+        self.assertIn('clinica_correo_envio_seconds_bucket{prueba="exponer",le="30.0"} 1\n', texto)
+        self.assertIn('clinica_correo_envio_seconds_bucket{prueba="exponer",le="+Inf"} 2\n', texto)
+        self.assertIn('clinica_correo_envio_seconds_count{prueba="exponer"} 2\n', texto)
+        self.assertIn('# TYPE clinica_prueba gauge\nclinica_prueba{estado="A\\"B"} 4\n', texto)
+
+    def test_suma_los_archivos_de_todos_los_procesos(self):
+        with tempfile.TemporaryDirectory() as directorio, \
+                override_settings(METRICAS_DIR=directorio):
+            contar('clinica_login_total', resultado='prueba_procesos')
+            observar('clinica_correo_envio_seconds', 0.07, prueba='procesos')
+            # Otro worker: mismo contador e histograma, más un archivo a medio escribir
+            buckets = len(BUCKETS_CORREO) + 1
+            conteos = [0] * buckets
+            conteos[1] = 2
+            Path(directorio, '999-1.json').write_text(json.dumps({
+                'contadores': [['clinica_login_total', [['resultado', 'prueba_procesos']], 5]],
+                'histogramas': [['clinica_correo_envio_seconds', [['prueba', 'procesos']],
+                                 conteos, 0.1, 2]],
+            }))
+            Path(directorio, '998-1.json').write_text('{"contadores": [')
+            texto = exponer()
+
+        self.assertIn('clinica_login_total{resultado="prueba_procesos"} 6\n', texto)
+        self.assertIn('clinica_correo_envio_seconds_bucket{prueba="procesos",le="0.1"} 3\n', texto)
+        self.assertIn('clinica_correo_envio_seconds_count{prueba="procesos"} 3\n', texto)
+
+
+@override_settings(METRICAS_TOKEN='secreto', METRICAS_IPS=['127.0.0.1'], METRICAS_SIN_PROXY=False)
+class MetricasAccesoTests(SimpleTestCase):
+
+    def setUp(self):
+        parche = mock.patch('clinica_app.views.cursor_lectura')
+        self.addCleanup(parche.stop)
+        parche.start().return_value.__enter__.return_value.fetchall.return_value = [('PENDIENTE', 2)]
+
+    def pedir(self, **meta):
+        meta.setdefault('REMOTE_ADDR', '127.0.0.1')
+        return metricas_view(RequestFactory().get('/metrics', **meta))
+
+    def test_loopback_no_basta_detras_de_un_proxy(self):
+        self.assertEqual(self.pedir().status_code, 403)
+        self.assertEqual(self.pedir(HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+        with override_settings(METRICAS_TOKEN=''):
+            self.assertEqual(self.pedir(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_con_token(self):
+        response = self.pedir(HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'clinica_correos_en_cola{estado="PENDIENTE"} 2', response.content)
+
+    def test_por_ip_solo_sin_proxy(self):
+        with override_settings(METRICAS_SIN_PROXY=True):
+            self.assertEqual(self.pedir().status_code, 200)
+            self.assertEqual(self.pedir(REMOTE_ADDR='10.0.0.5').status_code, 403)
+
+
+@skipUnless(analitica.numpy_disponible(), 'requiere numpy')
+class AnaliticaTests(SimpleTestCase):
+
+    def datos(self, filas):
+        np = analitica.np
+        columnas = list(zip(*filas)) or [()] * 5
+        return analitica.DatosCitas(
+            LUNES, 7,
+            medico=np.array(columnas[0], dtype=np.int32),
+            dia=np.array(columnas[1], dtype=np.int32),
+            minuto=np.array(columnas[2], dtype=np.int16),
+            duracion=np.array(columnas[3], dtype=np.int16),
+            estado=np.array(columnas[4], dtype=np.int8),
+        )
+
+    def test_calcular(self):
+        datos = self.datos([
+            (1, 0, 540, 90, analitica.CONFIRMADA),   # Lunes 9:00-10:30, sin cerrar
+            (1, 1, 600, 30, analitica.CANCELADA),    # No suma minutos
+            (1, 2, 480, 30, analitica.COMPLETADA),   # Miércoles = hoy: no es pasada
+        ])
+        # Médico 1: lunes a viernes 8:00-17:00 = 5 × 540 minutos en la semana
+        calculo = analitica.calcular(datos, {1: HorarioMedico()}, LUNES + timedelta(days=2))
+
+        self.assertEqual(list(calculo['medico_ids']), [1])
+        self.assertEqual(calculo['agendados'][0, 0, 9], 60)
+        self.assertEqual(calculo['agendados'][0, 0, 10], 30)
+        self.assertEqual(calculo['agendados'][0, 2, 8], 30)
+
+        medico = analitica.resumen(calculo, {1: 'Dra. Ruiz'})['medicos'][0]
+        self.assertEqual(medico['nombre'], 'Dra. Ruiz')
+        self.assertEqual((medico['citas'], medico['canceladas'], medico['completadas']), (3, 1, 1))
+        self.assertEqual(medico['inasistencias'], 1)
+        # La pasada cancelada no entra al denominador: 1 de 1
+        self.assertEqual(medico['tasa_inasistencia'], 1.0)
+        self.assertEqual(medico['minutos_agendados'], 120)
+        self.assertEqual(medico['minutos_disponibles'], 2700)
+        self.assertIsNone(medico['mapa_utilizacion'][5][10])  # Sábado: no atiende
+
+    def test_calcular_sin_citas(self):
+        calculo = analitica.calcular(self.datos([]), {}, LUNES)
+        resultado = analitica.resumen(calculo, {})
+        self.assertEqual(resultado['medicos'], [])
+        self.assertEqual(resultado['global']['citas'], 0)
+        self.assertIsNone(resultado['global']['utilizacion'])
+
+
+@override_settings(REPLICA_COOKIE='clinica_primario', REPLICA_PEGAJOSO=15)
+class ReplicasTests(SimpleTestCase):
+
+    def setUp(self):
+        parche = mock.patch.object(replicas, 'alias_replica', return_value='replica')
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.router = replicas.RouterReplica()
+
+    def test_fuera_de_un_request_lee_del_primario(self):
+        self.assertEqual(replicas.alias_lectura(), 'default')
+        self.assertEqual(self.router.db_for_read(None), 'default')
+
+    def test_escritura_vuelve_al_primario(self):
+        with replicas.usar_replica():
+            self.assertEqual(self.router.db_for_read(None), 'replica')
+            self.assertEqual(self.router.db_for_write(None), 'default')
+            self.assertEqual(self.router.db_for_read(None), 'default')
+
+    def test_bloque_atomico_lee_del_primario(self):
+        with replicas.usar_replica(), \
+                mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(replicas.alias_lectura(), 'default')
+
+    def test_usar_primario_conserva_la_escritura(self):
+        with replicas.usar_replica():
+            with replicas.usar_primario():
+                self.assertEqual(replicas.alias_lectura(), 'default')
+            self.assertEqual(replicas.alias_lectura(), 'replica')
+            with replicas.usar_primario():
+                replicas.marcar_escritura()
+            self.assertEqual(replicas.alias_lectura(), 'default')
+
+    def test_sin_replica_configurada(self):
+        with mock.patch.object(replicas, 'alias_replica', return_value=None), \
+                replicas.usar_replica():
+            self.assertEqual(replicas.alias_lectura(), 'default')
+
+    def pedir(self, metodo='get', cookies=None, escribir=False):
+        vistos = []
+
+        def vista(request):
+            vistos.append(replicas.alias_lectura())
+            if escribir:
+                replicas.marcar_escritura()
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), metodo)('/')
+        request.COOKIES.update(cookies or {})
+        response = replicas.ReplicaMiddleware(vista)(request)
+        return vistos[0], response.cookies.get('clinica_primario')
+
+    def test_middleware(self):
+        self.assertEqual(self.pedir(), ('replica', None))
+        alias, cookie = self.pedir(escribir=True)
+        self.assertEqual((alias, cookie['max-age']), ('replica', 15))
+        # Con la cookie (escribió hace poco) lee del primario
+        self.assertEqual(self.pedir(cookies={'clinica_primario': '1'}), ('default', None))
+        alias, cookie = self.pedir('post')
+        self.assertEqual(alias, 'default')
+        self.assertIsNotNone(cookie)
+
+
+class ConexionFalsa:
+
+    def __init__(self, ping_falla=False):
+        self.ping_falla = ping_falla
+        self.cerrada = False
+
+    def ping(self):
+        if self.ping_falla:
+            raise OSError('MySQL server has gone away')
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.cerrada = True
+
+
+class PoolConexionesTests(SimpleTestCase):
+
+    def pool(self, **opciones):
+        return PoolConexiones('test', **{
+            'tamano': 1, 'espera': 0.2, 'verificar': 5, 'vida': 600, **opciones,
+        })
+
+    def test_reutiliza_la_conexion_devuelta(self):
+        pool = self.pool()
+        conexion = pool.tomar(ConexionFalsa)
+        pool.devolver(conexion)
+        self.assertIs(pool.tomar(ConexionFalsa), conexion)
+
+    def test_agotado_tras_la_espera(self):
+        pool = self.pool(espera=0.05)
+        pool.tomar(ConexionFalsa)
+        inicio = reloj.monotonic()
+        with self.assertRaises(PoolAgotado):
+            pool.tomar(ConexionFalsa)
+        self.assertGreaterEqual(reloj.monotonic() - inicio, 0.05)
+
+    def test_espera_hasta_que_otro_hilo_devuelve(self):
+        pool = self.pool(espera=2)
+        conexion = pool.tomar(ConexionFalsa)
+        hilo = threading.Timer(0.05, pool.devolver, [conexion])
+        hilo.start()
+        self.assertIs(pool.tomar(ConexionFalsa), conexion)
+        hilo.join()
+
+    def test_reemplaza_conexion_rota(self):
+        pool = self.pool(verificar=0)
+        rota = pool.tomar(lambda: ConexionFalsa(ping_falla=True))
+        pool.devolver(rota)
+        nueva = pool.tomar(ConexionFalsa)
+        self.assertIsNot(nueva, rota)
+        self.assertTrue(rota.cerrada)
+
+    def test_error_al_crear_libera_el_cupo(self):
+        pool = self.pool()
+
+        def falla():
+            raise OSError('sin red')
+
+        with self.assertRaises(OSError):
+            pool.tomar(falla)
+        self.assertIsInstance(pool.tomar(ConexionFalsa), ConexionFalsa)
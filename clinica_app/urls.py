@@ -15,6 +15,8 @@ urlpatterns = [
     path('calendario/', views.calendario_view, name='calendario'),
     path('agendar-cita/', views.agendar_cita_view, name='agendar_cita'),
     path('historial-citas/', views.historial_citas_view, name='historial_citas'),
+    path('historial-citas/exportar/', views.exportar_citas_view, name='exportar_citas'),
+    path('reportes/', views.reportes_view, name='reportes'),
     
     # Gestión de usuarios (solo admin)
     path('gestionar-usuarios/', views.gestionar_usuarios_view, name='gestionar_usuarios'),
@@ -25,6 +27,14 @@ urlpatterns = [
     path('actualizar-estado-cita/<int:cita_id>/', views.actualizar_estado_cita, name='actualizar_estado_cita'),  
     # APIs
     path('api/citas-disponibles/', views.api_citas_disponibles, name='api_citas_disponibles'),
+    path('api/primeros-disponibles/', views.api_primeros_disponibles, name='api_primeros_disponibles'),
+    path('api/agendar-lote/', views.api_agendar_lote, name='api_agendar_lote'),
+    path('api/pacientes/buscar/', views.api_buscar_pacientes, name='api_buscar_pacientes'),
+    path('api/calendario/', views.api_calendario, name='api_calendario'),
+    path('api/analitica/', views.api_analitica, name='api_analitica'),
+    path('api/eventos-citas/', views.eventos_citas_view, name='eventos_citas'),
+    # Prometheus
+    path('metrics/', views.metricas_view, name='metricas'),
     # Agregar estas líneas a tu clinica_app/urls.py
 
     
@@ -0,0 +1,255 @@
+# clinica_app/usuarios.py
+
+"""
+=== DIRECTORIO DE USUARIOS (BÚSQUEDA, FILTRO POR ROL Y PAGINACIÓN) ===
+
+PROPÓSITO PRINCIPAL:
+- Buscar en el servidor por prefijo de nombre, apellido, usuario, email o teléfono
+- Filtrar por rol y paginar por clave (role, last_name, id) como historial.py
+- Contar usuarios por rol con UN solo GROUP BY
+- Traer solo las columnas que muestran las tarjetas de gestionar_usuarios.html
+- Índice en memoria de pacientes para la búsqueda mientras se escribe
+
+PROBLEMA QUE RESUELVE:
+- gestionar_usuarios_view cargaba TODOS los usuarios (3 querysets) y el
+  template filtraba/contaba en JavaScript: con decenas de miles de pacientes
+  la página pesaba megas
+
+BÚSQUEDA POR PREFIJO:
+- Cada palabra debe ser prefijo de alguna columna: "ana lóp" encuentra a
+  Ana López. LIKE 'texto%' usa los índices del Script 8 (un '%texto%' no)
+"""
+
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from .models import CustomUser
+from .replicas import usar_primario
+
+# Columnas que usan las tarjetas del directorio (el resto no se trae)
+COLUMNAS_DIRECTORIO = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'phone', 'role', 'is_active',
+)
+
+CAMPOS_BUSQUEDA = ('first_name', 'last_name', 'username', 'email', 'phone')
+
+ROLES = {1: 'Administradores', 2: 'Médicos', 3: 'Pacientes'}
+
+
+def leer_filtros_usuarios(params):
+    """
+    FUNCIÓN: Extrae y valida los filtros del querystring
+
+    PARÁMETROS GET:
+    - q: Texto a buscar (prefijos)
+    - rol: 1 / 2 / 3
+
+    RETORNA: dict solo con los filtros válidos
+    """
+    filtros = {}
+    q = ' '.join(str(params.get('q', '')).split())[:100]
+    if q:
+        filtros['q'] = q
+    if str(params.get('rol', '')).isdigit() and int(params['rol']) in ROLES:
+        filtros['rol'] = int(params['rol'])
+    return filtros
+
+
+def condicion_prefijo(texto, campos=CAMPOS_BUSQUEDA):
+    """Q donde cada palabra de 'texto' es prefijo de alguno de los campos."""
+    condicion = Q()
+    for palabra in texto.split():
+        alguna = Q()
+        for campo in campos:
+            alguna |= Q(**{f'{campo}__istartswith': palabra})
+        condicion &= alguna
+    return condicion
+
+
+def buscar_usuarios(filtros):
+    """Queryset liviano (solo COLUMNAS_DIRECTORIO) con los filtros aplicados."""
+    usuarios = CustomUser.objects.only(*COLUMNAS_DIRECTORIO)
+    if 'rol' in filtros:
+        usuarios = usuarios.filter(role=filtros['rol'])
+    if 'q' in filtros:
+        usuarios = usuarios.filter(condicion_prefijo(filtros['q']))
+    return usuarios
+
+
+def conteos_por_rol():
+    """
+    FUNCIÓN: Usuarios por rol con un solo SELECT role, COUNT(*) ... GROUP BY role
+
+    RETORNA: {'total': n, 1: n_admin, 2: n_medicos, 3: n_pacientes}
+    """
+    conteos = {rol: 0 for rol in ROLES}
+    for fila in CustomUser.objects.order_by().values('role').annotate(n=Count('id')):
+        conteos[fila['role']] = fila['n']
+    conteos['total'] = sum(conteos.values())
+    return conteos
+
+
+def codificar_cursor_usuario(usuario):
+    """Token del último usuario visto: 'role_id_apellido'."""
+    return f"{usuario.role}_{usuario.id}_{usuario.last_name}"
+
+
+def decodificar_cursor_usuario(token):
+    """Inverso de codificar_cursor_usuario(); retorna None si el token es inválido."""
+    try:
+        rol, user_id, apellido = token.split('_', 2)
+        return int(rol), apellido, int(user_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def pagina_usuarios(filtros, despues=None, por_pagina=50):
+    """
+    FUNCIÓN: Una página del directorio ordenada por (role, last_name, id)
+
+    PARÁMETROS:
+    - despues: (role, last_name, id) del último usuario visto, o None
+
+    RETORNA: (lista de usuarios, token de la página siguiente o None)
+    """
+    usuarios = buscar_usuarios(filtros)
+    if despues:
+        rol, apellido, user_id = despues
+        usuarios = usuarios.filter(
+            Q(role__gt=rol)
+            | Q(role=rol, last_name__gt=apellido)
+            | Q(role=rol, last_name=apellido, id__gt=user_id)
+        )
+    pagina = list(usuarios.order_by('role', 'last_name', 'id')[:por_pagina + 1])
+
+    siguiente = None
+    if len(pagina) > por_pagina:
+        pagina = pagina[:por_pagina]
+        siguiente = codificar_cursor_usuario(pagina[-1])
+    return pagina, siguiente
+
+
+# ========== ÍNDICE DE PACIENTES EN MEMORIA (BÚSQUEDA MIENTRAS SE ESCRIBE) ==========
+#
+# agendar_cita.html mandaba TODOS los pacientes en un <select>. Ahora el
+# formulario consulta api_buscar_pacientes a cada tecla y este índice responde
+# con búsqueda binaria sobre un arreglo ordenado de claves normalizadas
+# (nombre, apellido, "nombre apellido", "apellido nombre", email, teléfono).
+#
+# REFRESCO:
+# - registro/edición/eliminación de usuarios llaman invalidar_indice_pacientes(),
+#   que incrementa una versión en la caché de Django (compartida si
+#   PACIENTES_INDICE_ALIAS apunta a Redis/Memcached)
+# - Además se reconstruye cada PACIENTES_INDICE_TTL segundos (cambios hechos
+#   directamente en la BD)
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Pérez' → 'perez'."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower().strip()
+
+
+class IndicePacientes:
+    """
+    CLASE: Arreglo ordenado de (clave, paciente_id) + datos para mostrar
+
+    - buscar(): bisect al primer candidato y recorrido hasta que la clave deja
+      de empezar con el prefijo: O(log n + resultados)
+    """
+
+    VERSION_CLAVE = 'clinica:pacientes:version'
+
+    def __init__(self):
+        # ([(clave normalizada, paciente_id), ...] ordenado, {paciente_id: dict})
+        # Se reemplaza entero: una búsqueda nunca ve claves y datos mezclados
+        self._indice = ([], {})
+        self._version = None
+        self._expira = 0
+        self._lock = threading.Lock()
+
+    def _cache(self):
+        return caches[getattr(settings, 'PACIENTES_INDICE_ALIAS', 'default')]
+
+    def construir(self):
+        """Carga los pacientes activos (solo las columnas necesarias)."""
+        claves, datos = [], {}
+        filas = CustomUser.objects.filter(role=3, is_active=True).values_list(
+            'id', 'first_name', 'last_name', 'email', 'phone'
+        )
+        for user_id, nombre, apellido, email, telefono in filas:
+            completo = f"{nombre} {apellido}".strip()
+            datos[user_id] = {
+                'id': user_id, 'nombre': completo, 'email': email, 'telefono': telefono,
+            }
+            variantes = {
+                normalizar(nombre), normalizar(apellido), normalizar(completo),
+                normalizar(f"{apellido} {nombre}"), normalizar(email),
+                ''.join(c for c in telefono or '' if c.isdigit()),
+            }
+            claves.extend((clave, user_id) for clave in variantes if clave)
+        claves.sort()
+        self._indice = (claves, datos)
+
+    def _vigente(self):
+        """Reconstruye si cambió la versión compartida o venció el TTL."""
+        version = self._cache().get(self.VERSION_CLAVE, 0)
+        if version == self._version and time.monotonic() < self._expira:
+            return
+        with self._lock:
+            if version != self._version or time.monotonic() >= self._expira:
+                # La versión sube antes de que la réplica se ponga al día
+                with usar_primario():
+                    self.construir()
+                self._version = version
+                self._expira = time.monotonic() + getattr(settings, 'PACIENTES_INDICE_TTL', 300)
+
+    def buscar(self, texto, limite=10):
+        """
+        FUNCIÓN: Pacientes cuyo nombre, apellido, email o teléfono empieza con 'texto'
+
+        RETORNA: Lista de dicts {id, nombre, email, telefono} (máximo 'limite'),
+        primero las coincidencias más cortas (las más exactas)
+        """
+        self._vigente()
+        prefijo = normalizar(texto)
+        if prefijo.replace(' ', '').replace('-', '').isdigit():
+            prefijo = ''.join(c for c in prefijo if c.isdigit())  # Teléfono con guiones
+        if not prefijo:
+            return []
+
+        claves, datos = self._indice
+        encontrados = {}
+        i = bisect_left(claves, (prefijo,))
+        while i < len(claves) and claves[i][0].startswith(prefijo):
+            clave, user_id = claves[i]
+            if user_id not in encontrados or len(clave) < encontrados[user_id]:
+                encontrados[user_id] = len(clave)
+            i += 1
+            if len(encontrados) >= limite * 5:  # Suficientes candidatos para ordenar
+                break
+
+        mejores = sorted(encontrados, key=lambda uid: (encontrados[uid], datos[uid]['nombre']))
+        return [datos[uid] for uid in mejores[:limite]]
+
+    def invalidar(self):
+        cache = self._cache()
+        try:
+            cache.incr(self.VERSION_CLAVE)
+        except ValueError:
+            cache.set(self.VERSION_CLAVE, 1, None)
+        self._expira = 0  # Este proceso reconstruye en la próxima búsqueda
+
+
+indice_pacientes = IndicePacientes()
+
+
+def invalidar_indice_pacientes():
+    """Llamar al crear, editar o eliminar usuarios."""
+    indice_pacientes.invalidar()
@@ -6,14 +6,42 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import connection
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
 from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from datetime import datetime, timedelta, date
+import asyncio
+import hashlib
+import hmac
 import json
 from .models import CustomUser, Cita, Medico, Paciente, Especialidad
 from .forms import LoginForm, RegistroForm, CitaForm
+from .backends import invalidar_usuario
+from .cache_calendario import invalidar_cita, obtener_mes
+from .calendario import citas_mes, decodificar_token
+from .analitica import analizar, csv_mapa, csv_medicos, leer_rango, numpy_disponible
+from .correos import encolar_correo
+from .dashboard import datos_dashboard
+from .eventos import canales_usuario, obtener_broker, publicar_cita
+from .exportacion import FORMATOS, filas_historial
+from .metricas import contar, exponer
+from .historial import decodificar_cursor, leer_filtros, pagina_historial
+from .replicas import alias_lectura, cursor_lectura
+from .reportes import AGRUPACIONES, leer_filtros_reporte, marca_resumen, reporte_citas
+from .reservas import (
+    ConflictoHorario, SolicitudCita, agendar_cita, agendar_lote, generar_serie, notificar_lote,
+)
+from .usuarios import (
+    ROLES, conteos_por_rol, decodificar_cursor_usuario, indice_pacientes,
+    invalidar_indice_pacientes, leer_filtros_usuarios, pagina_usuarios,
+)
+from .disponibilidad import (
+    calcular_disponibilidad, parsear_fecha, primeros_disponibles, rango_fechas,
+    validar_duracion_paso,
+)
 
 def enviar_correo_registro(user, password_temp):
     """
@@ -23,7 +51,7 @@ def enviar_correo_registro(user, password_temp):
     - password_temp: Contraseña temporal para incluir en el correo
     
     PROPÓSITO: Notificar al usuario sus credenciales de acceso por email
-    RETORNA: True si el correo se envió exitosamente, False si hubo error
+    RETORNA: True si el correo quedó en cola, False si hubo error
     """
     subject = 'Bienvenido a la Clínica Dermatológica'
     # Mensaje personalizado con datos del usuario
@@ -45,20 +73,8 @@ def enviar_correo_registro(user, password_temp):
     Clínica Valencia
     """
     
-    try:
-        # Intenta enviar el correo usando configuración de Django
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,  # Email del remitente configurado
-            [user.email],              # Lista de destinatarios
-            fail_silently=False,       # Lanza excepción si hay error
-        )
-        return True
-    except Exception as e:
-        # Si falla, imprime error y retorna False
-        print(f"Error enviando email: {e}")
-        return False
+    # Encolar: el worker 'procesar_correos' hace el envío SMTP
+    return encolar_correo(subject, message, [user.email])
 
 def enviar_correo_cita(cita):
     """
@@ -67,7 +83,7 @@ def enviar_correo_cita(cita):
     - cita: Objeto de la cita recién creada
     
     PROPÓSITO: Notificar tanto al paciente como al médico sobre la nueva cita
-    RETORNA: True si ambos correos se enviaron, False si hubo error
+    RETORNA: True si ambos correos quedaron en cola, False si hubo error
     """
     
     # CORREO PARA EL PACIENTE
@@ -107,28 +123,10 @@ def enviar_correo_cita(cita):
     Sistema de Clínica Valencia.
     """
     
-    try:
-        # Enviar correo al paciente
-        send_mail(
-            subject_paciente,
-            message_paciente,
-            settings.EMAIL_HOST_USER,
-            [cita.paciente.email],
-            fail_silently=False,
-        )
-        
-        # Enviar correo al médico
-        send_mail(
-            subject_medico,
-            message_medico,
-            settings.EMAIL_HOST_USER,
-            [cita.medico.email],
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        print(f"Error enviando emails de cita: {e}")
-        return False
+    # Encolar ambos correos (paciente y médico): no se espera al servidor SMTP
+    ok_paciente = encolar_correo(subject_paciente, message_paciente, [cita.paciente.email])
+    ok_medico = encolar_correo(subject_medico, message_medico, [cita.medico.email])
+    return ok_paciente and ok_medico
 
 def login_view(request):
     """
@@ -251,6 +249,8 @@ def registro_view(request):
                 
                 # Obtener el usuario creado para enviar email
                 new_user = CustomUser.objects.get(id=user_id)
+                if role == 3:
+                    invalidar_indice_pacientes()  # Aparece en la búsqueda al agendar
                 
                 # ENVIAR CORREO DE BIENVENIDA
                 if enviar_correo_registro(new_user, password):
@@ -287,7 +287,7 @@ def home_view(request):
     - Mostrar dashboard personalizado según el rol del usuario
     - Médicos: ven sus citas del día
     - Pacientes: ven sus próximas citas
-    - Admin: vista general del sistema
+    - Admin: totales de hoy por estado y carga por médico
     """
     
     # Contexto base para todos los usuarios
@@ -298,24 +298,9 @@ def home_view(request):
         'es_paciente': request.user.is_paciente,
     }
     
-    # DASHBOARD PARA MÉDICOS: Citas del día actual
-    if request.user.is_medico:
-        hoy = date.today()
-        citas_hoy = Cita.objects.filter(
-            medico=request.user,  # Solo citas de este médico
-            fecha=hoy,           # Solo de hoy
-            estado__in=['PENDIENTE', 'CONFIRMADA']  # Solo activas
-        ).order_by('hora')
-        context['citas_hoy'] = citas_hoy
-    
-    # DASHBOARD PARA PACIENTES: Próximas 5 citas
-    elif request.user.is_paciente:
-        citas_proximas = Cita.objects.filter(
-            paciente=request.user,        # Solo citas de este paciente
-            fecha__gte=date.today(),      # Desde hoy en adelante
-            estado__in=['PENDIENTE', 'CONFIRMADA']  # Solo activas
-        ).order_by('fecha', 'hora')[:5]   # Las 5 más próximas
-        context['citas_proximas'] = citas_proximas
+    # DASHBOARD POR ROL (dashboard.py): una consulta con JOIN por widget, en caché
+    # - Médicos: citas_hoy | Pacientes: citas_proximas | Admin: kpis de hoy
+    context.update(datos_dashboard(request.user))
     
     return render(request, 'home.html', context)
 
@@ -329,69 +314,57 @@ def calendario_view(request):
     - Filtrar según el rol: pacientes ven solo las suyas, médicos las suyas, admin todas
     - Permitir navegación entre meses
     - Preparar datos para visualización en JavaScript
+    
+    CACHÉ:
+    - El JSON del mes se guarda por (rol, usuario, año, mes) en cache_calendario
+    - ETag/Last-Modified: si el mes no cambió el navegador recibe 304 sin cuerpo
     """
     
     # Obtener mes y año de los parámetros GET (por defecto: mes actual)
-    mes = int(request.GET.get('mes', datetime.now().month))
-    año = int(request.GET.get('año', datetime.now().year))
+    try:
+        mes = int(request.GET.get('mes', datetime.now().month))
+        año = int(request.GET.get('año', datetime.now().year))
+        date(año, mes, 1)  # Misma validación que api_calendario
+    except ValueError:
+        messages.error(request, 'Mes o año inválido')
+        return redirect('calendario')
     
-    # Calcular rango de fechas del mes
-    fecha_inicio = date(año, mes, 1)  # Primer día del mes
-    if mes == 12:
-        fecha_fin = date(año + 1, 1, 1) - timedelta(days=1)  # Último día de diciembre
-    else:
-        fecha_fin = date(año, mes + 1, 1) - timedelta(days=1)  # Último día del mes
-    
-    # FILTRAR CITAS SEGÚN EL ROL DEL USUARIO
-    if request.user.is_paciente:
-        # Pacientes: solo sus propias citas
-        citas = Cita.objects.filter(
-            paciente=request.user,
-            fecha__range=[fecha_inicio, fecha_fin],
-            estado__in=['PENDIENTE', 'CONFIRMADA']
-        ).select_related('medico', 'paciente')  # Optimización: join con tablas relacionadas
-        
-    elif request.user.is_medico:
-        # Médicos: solo sus propias citas
-        citas = Cita.objects.filter(
-            medico=request.user,
-            fecha__range=[fecha_inicio, fecha_fin],
-            estado__in=['PENDIENTE', 'CONFIRMADA']
-        ).select_related('medico', 'paciente')
-        
-    else:
-        # Administradores: todas las citas
-        citas = Cita.objects.filter(
-            fecha__range=[fecha_inicio, fecha_fin],
-            estado__in=['PENDIENTE', 'CONFIRMADA']
-        ).select_related('medico', 'paciente')
-    
-    # CONVERTIR CITAS A FORMATO JSON para JavaScript
-    citas_json = []
-    for cita in citas:
-        citas_json.append({
-            'id': cita.id,
-            'fecha': str(cita.fecha),
-            'hora': str(cita.hora),
-            'duracion': cita.duracion,
-            'estado': cita.estado,
-            'motivo': cita.motivo,
-            'paciente_nombre': cita.paciente.get_full_name(),
-            'medico_nombre': cita.medico.get_full_name(),
-        })
-    
-    # Obtener lista de médicos activos para el formulario de agendar
-    medicos = CustomUser.objects.filter(role=2, is_active=True)
+    def construir_citas():
+        """Consulta del mes según el rol (solo se ejecuta si no está en caché)"""
+        citas, _, token = citas_mes(request.user, año, mes)
+        return citas, token
+    
+    # JSON del mes desde caché (se invalida al agendar/cancelar/cambiar estado)
+    payload = obtener_mes(request.user, año, mes, construir_citas)
+    puede_agendar = request.user.is_admin or request.user.is_medico
+    
+    # CACHÉ DEL NAVEGADOR: ETag del contenido + lo que cambia el HTML por usuario
+    etag = '"%s"' % hashlib.md5(
+        f"{payload['etag']}:{request.user.id}:{puede_agendar}".encode('utf-8')
+    ).hexdigest()
+    modificado = payload['modificado']
+    
+    # Con mensajes pendientes (ej: "Cita agendada") hay que renderizar de nuevo
+    if not len(messages.get_messages(request)):
+        no_modificado = get_conditional_response(request, etag=etag, last_modified=modificado)
+        if no_modificado is not None:
+            return no_modificado
     
     context = {
         'mes': mes,
         'año': año,
-        'citas': json.dumps(citas_json),  # Convertir a JSON para JavaScript
-        'medicos': medicos,
-        'puede_agendar': request.user.is_admin or request.user.is_medico,
+        'citas': payload['citas'],  # JSON ya serializado para JavaScript
+        'token': payload['token'] or '',  # Punto de partida de api_calendario
+        'puede_agendar': puede_agendar,
+        'intervalo_sync': getattr(settings, 'CALENDARIO_FEED_INTERVALO', 30),
     }
     
-    return render(request, 'calendar.html', context)
+    response = render(request, 'calendar.html', context)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modificado)
+    # private: contiene datos del usuario; no-cache: revalidar siempre (304 si no cambió)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 @login_required
 def agendar_cita_view(request):
@@ -424,29 +397,19 @@ def agendar_cita_view(request):
             if request.user.is_medico:
                 medico_id = request.user.id
             
-            # VERIFICAR DISPONIBILIDAD DEL HORARIO
-            cita_existente = Cita.objects.filter(
-                medico_id=medico_id,
-                fecha=fecha,
-                hora=hora,
-                estado__in=['PENDIENTE', 'CONFIRMADA']  # Solo citas activas
-            ).exists()
-            
-            if cita_existente:
-                messages.error(request, 'Ya existe una cita en ese horario')
+            # VERIFICAR DISPONIBILIDAD Y CREAR LA CITA en una sola transacción
+            # (bloquea al médico: dos reservas simultáneas no pueden solaparse)
+            try:
+                cita = agendar_cita(paciente_id, medico_id, fecha, hora, duracion, motivo)
+            except ConflictoHorario as e:
+                contar('clinica_citas_conflictos_total', origen='agendar')
+                messages.error(request, str(e))
                 return redirect('agendar_cita')
+            contar('clinica_citas_creadas_total', origen='agendar')
             
-            # CREAR LA CITA usando SQL directo
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO citas (paciente_id, medico_id, fecha, hora, duracion, motivo, estado)
-                    VALUES (%s, %s, %s, %s, %s, %s, 'PENDIENTE')
-                """, [paciente_id, medico_id, fecha, hora, duracion, motivo])
-                
-                cita_id = cursor.lastrowid  # Obtener ID de la cita creada
-            
-            # Obtener la cita completa para enviar emails
-            cita = Cita.objects.get(id=cita_id)
+            # Solo el mes de la cita queda desactualizado en el calendario
+            invalidar_cita(cita.medico_id, cita.paciente_id, cita.fecha)
+            publicar_cita('creada', cita)
             
             # ENVIAR NOTIFICACIONES POR CORREO
             if enviar_correo_cita(cita):
@@ -468,15 +431,11 @@ def agendar_cita_view(request):
     else:
         medicos = [request.user]  # Solo el médico actual
     
-    # Lista de todos los pacientes activos
-    pacientes = CustomUser.objects.filter(role=3, is_active=True)
-    
     # Si viene con fecha preseleccionada desde el calendario
     fecha_preseleccionada = request.GET.get('fecha', '')
     
     return render(request, 'agendar_cita.html', {
-        'medicos': medicos,
-        'pacientes': pacientes,
+        'medicos': medicos,  # Los pacientes se buscan con api_buscar_pacientes
         'fecha_preseleccionada': fecha_preseleccionada,
     })
 
@@ -505,6 +464,9 @@ def eliminar_usuario_view(request, user_id):
         with connection.cursor() as cursor:
             cursor.callproc('sp_eliminar_usuario', [user_id])
             result = cursor.fetchone()
+        
+        invalidar_usuario(user_id)  # Sacar de la caché de request.user
+        invalidar_indice_pacientes()
             
         messages.success(request, 'Usuario eliminado exitosamente')
     except Exception as e:
@@ -515,71 +477,109 @@ def eliminar_usuario_view(request, user_id):
 @login_required
 def historial_citas_view(request):
     """
-    VISTA: Muestra el historial completo de citas según el rol
+    VISTA: Muestra el historial de citas según el rol, paginado y filtrado
     
     PROPÓSITO:
     - Pacientes: ven solo su historial personal
     - Médicos: ven historial de sus pacientes
     - Admin: ve todo el historial del sistema
-    - Usar consultas SQL optimizadas con JOIN
-    """
-    
-    citas = []
-    
-    with connection.cursor() as cursor:
-        if request.user.is_paciente:
-            # PACIENTES: Solo sus propias citas con datos del médico
-            cursor.execute("""
-                SELECT 
-                    c.id, c.fecha, c.hora, c.duracion, c.estado, c.motivo,
-                    c.medico_id,
-                    CONCAT(um.first_name, ' ', um.last_name) AS medico_nombre,
-                    e.nombre AS especialidad
-                FROM citas c
-                INNER JOIN auth_user_custom um ON c.medico_id = um.id
-                LEFT JOIN medicos m ON um.id = m.user_id
-                LEFT JOIN especialidades e ON m.especialidad_id = e.id
-                WHERE c.paciente_id = %s
-                ORDER BY c.fecha DESC, c.hora DESC
-            """, [request.user.id])
-            
-        elif request.user.is_medico:
-            # MÉDICOS: Sus citas con datos del paciente
-            cursor.execute("""
-                SELECT 
-                    c.id, c.fecha, c.hora, c.duracion, c.estado, c.motivo,
-                    c.medico_id,
-                    CONCAT(up.first_name, ' ', up.last_name) AS paciente_nombre,
-                    up.phone AS paciente_telefono
-                FROM citas c
-                INNER JOIN auth_user_custom up ON c.paciente_id = up.id
-                WHERE c.medico_id = %s
-                ORDER BY c.fecha DESC, c.hora DESC
-            """, [request.user.id])
-            
-        else:  # ADMIN: Todas las citas
-            cursor.execute("""
-                SELECT 
-                    c.id, c.fecha, c.hora, c.duracion, c.estado, c.motivo,
-                    c.medico_id, c.paciente_id,
-                    CONCAT(up.first_name, ' ', up.last_name) AS paciente_nombre,
-                    CONCAT(um.first_name, ' ', um.last_name) AS medico_nombre
-                FROM citas c
-                INNER JOIN auth_user_custom up ON c.paciente_id = up.id
-                INNER JOIN auth_user_custom um ON c.medico_id = um.id
-                ORDER BY c.fecha DESC, c.hora DESC
-            """)
-        
-        # Convertir resultado a lista de diccionarios
-        columns = [col[0] for col in cursor.description]  # Nombres de columnas
-        for row in cursor.fetchall():
-            citas.append(dict(zip(columns, row)))  # Combinar nombres con valores
+    - Usar consultas SQL optimizadas con JOIN (historial.py)
+    - Paginación por clave (fecha, hora, id): nunca carga todo el historial
+    - Filtros en el servidor: ?estado=&medico=&desde=&hasta=
+    """
+    
+    filtros = leer_filtros(request.GET)
+    despues = decodificar_cursor(request.GET.get('despues'))
+    por_pagina = getattr(settings, 'HISTORIAL_POR_PAGINA', 50)
+    
+    # Réplica en GET (salvo que el usuario acabe de escribir, ver replicas.py)
+    with cursor_lectura() as cursor:
+        citas, siguiente = pagina_historial(
+            cursor, request.user, filtros, despues, por_pagina
+        )
+    
+    # Querystring de filtros para conservarlos al cambiar de página
+    params_filtros = request.GET.copy()
+    params_filtros.pop('despues', None)
+    
+    # Médicos para el filtro (el médico solo ve sus propias citas)
+    medicos = []
+    if not request.user.is_medico:
+        medicos = CustomUser.objects.filter(role=2, is_active=True).only(
+            'id', 'first_name', 'last_name'
+        ).order_by('last_name', 'first_name')
     
     return render(request, 'historial_citas.html', {
         'citas': citas,
         'es_admin': request.user.is_admin,
         'es_medico': request.user.is_medico,
         'es_paciente': request.user.is_paciente,
+        'filtros': filtros,
+        'medicos': medicos,
+        'estados': Cita.ESTADOS,
+        'siguiente': siguiente,
+        'es_primera_pagina': despues is None,
+        'query_filtros': params_filtros.urlencode(),
+    })
+
+@login_required
+def exportar_citas_view(request):
+    """
+    VISTA: Exporta el historial completo de citas en CSV o JSONL (solo admin)
+    
+    PROPÓSITO:
+    - Entregar a auditoría todas las citas con nombres de paciente y médico
+    - Transmitir las filas en streaming desde un cursor del servidor:
+      la memoria no crece con el número de citas
+    - Acepta los mismos filtros que el historial: ?estado=&medico=&desde=&hasta=
+    - ?formato=csv (por defecto) o ?formato=jsonl
+    """
+    
+    # VERIFICAR PERMISOS
+    if not request.user.is_admin:
+        return HttpResponseForbidden("No tiene permisos para exportar citas")
+    
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return JsonResponse({'error': 'Formato no soportado'}, status=400)
+    
+    generador, content_type = FORMATOS[formato]
+    # El alias se resuelve ahora: el cuerpo se genera después del middleware
+    lotes = filas_historial(request.user, leer_filtros(request.GET), alias=alias_lectura())
+    
+    response = StreamingHttpResponse(generador(lotes), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="citas.{formato}"'
+    return response
+
+@login_required
+def reportes_view(request):
+    """
+    VISTA: Reporte de citas por médico, especialidad, día o mes (solo admin)
+    
+    PROPÓSITO:
+    - Contar citas por estado y minutos agendados en cualquier rango de fechas
+    - Leer SOLO citas_resumen_diario (reportes.py): 3 años de datos son
+      miles de filas de resumen, no millones de citas
+    - El resumen lo mantiene al día el comando actualizar_resumen
+    """
+    
+    if not request.user.is_admin:
+        messages.error(request, 'No tiene permisos para ver reportes')
+        return redirect('home')
+    
+    filtros = leer_filtros_reporte(request.GET)
+    filas, totales = reporte_citas(filtros)
+    
+    return render(request, 'reportes.html', {
+        'filas': filas,
+        'totales': totales,
+        'filtros': filtros,
+        'agrupaciones': AGRUPACIONES,
+        'marca': marca_resumen(),
+        'medicos': CustomUser.objects.filter(role=2).only(
+            'id', 'first_name', 'last_name'
+        ).order_by('last_name', 'first_name'),
+        'especialidades': Especialidad.objects.only('id', 'nombre').order_by('nombre'),
     })
 
 @login_required
@@ -588,8 +588,8 @@ def gestionar_usuarios_view(request):
     VISTA: Panel de administración de usuarios (solo admin)
     
     PROPÓSITO:
-    - Mostrar lista completa de usuarios del sistema
-    - Separar por roles para mejor organización
+    - Mostrar el directorio de usuarios paginado por clave
+    - Buscar por prefijo de nombre/email/teléfono y filtrar por rol en el servidor
     - Punto de acceso para editar/eliminar usuarios
     """
     
@@ -598,17 +598,25 @@ def gestionar_usuarios_view(request):
         messages.error(request, 'No tiene permisos para gestionar usuarios')
         return redirect('home')
     
-    # Obtener todos los usuarios ordenados por rol y apellido
-    usuarios = CustomUser.objects.all().order_by('role', 'last_name')
+    # Búsqueda y filtro por rol en el servidor (usuarios.py)
+    filtros = leer_filtros_usuarios(request.GET)
+    despues = decodificar_cursor_usuario(request.GET.get('despues'))
+    usuarios, siguiente = pagina_usuarios(
+        filtros, despues, getattr(settings, 'USUARIOS_POR_PAGINA', 50)
+    )
     
-    # Separar por roles para la vista
-    medicos = usuarios.filter(role=2)    # role=2 son médicos
-    pacientes = usuarios.filter(role=3)  # role=3 son pacientes
+    # Querystring de filtros para conservarlos al cambiar de página
+    params_filtros = request.GET.copy()
+    params_filtros.pop('despues', None)
     
     return render(request, 'gestionar_usuarios.html', {
         'usuarios': usuarios,
-        'medicos': medicos,
-        'pacientes': pacientes,
+        'conteos': conteos_por_rol(),  # Un solo GROUP BY role
+        'roles': ROLES,
+        'filtros': filtros,
+        'siguiente': siguiente,
+        'es_primera_pagina': despues is None,
+        'query_filtros': params_filtros.urlencode(),
     })
 
 @login_required
@@ -635,6 +643,9 @@ def cancelar_cita_view(request, cita_id):
         # CANCELAR USANDO STORED PROCEDURE
         with connection.cursor() as cursor:
             cursor.callproc('sp_cancelar_cita', [cita_id])
+        invalidar_cita(cita.medico_id, cita.paciente_id, cita.fecha)
+        cita.estado = 'CANCELADA'
+        publicar_cita('cancelada', cita)
         
         messages.success(request, 'Cita cancelada exitosamente')
     except Exception as e:
@@ -646,44 +657,413 @@ def cancelar_cita_view(request, cita_id):
 @login_required
 def api_citas_disponibles(request):
     """
-    API: Devuelve horarios disponibles de un médico en una fecha específica
+    API: Devuelve horarios disponibles de uno o varios médicos en una o varias fechas
     
     PROPÓSITO:
     - Endpoint para AJAX desde el frontend
-    - Calcular horarios libres basado en citas existentes
-    - Generar slots de 30 minutos entre 8:00 y 17:00
+    - Calcular horarios libres con el motor de disponibilidad (disponibilidad.py)
+    - Respetar horario y días laborales del médico y la duración de cada cita
+    
+    FORMATOS DE PETICIÓN (JSON):
+    - Simple:  {"medico_id": 6, "fecha": "2025-09-26", "duracion": 30}
+               → {"horarios": ["08:00", ...]}
+    - Masivo:  {"medico_ids": [6, 7], "fecha_inicio": "2025-09-26", "dias": 7,
+                "duracion": 30}   (o "fechas": [...])
+               → {"disponibilidad": {"6": {"2025-09-26": ["08:00", ...]}, ...}}
     """
     
     if request.method == 'POST':
-        # Decodificar JSON del request
-        data = json.loads(request.body)
-        medico_id = data.get('medico_id')
-        fecha = data.get('fecha')
-        
-        # OBTENER HORARIOS YA OCUPADOS
-        citas_ocupadas = Cita.objects.filter(
-            medico_id=medico_id,
-            fecha=fecha,
-            estado__in=['PENDIENTE', 'CONFIRMADA']
-        ).values_list('hora', flat=True)  # Solo obtener las horas
-        
-        # GENERAR HORARIOS DISPONIBLES
-        # Slots cada 30 minutos desde 8:00 hasta 17:00
-        horarios_disponibles = []
-        hora_actual = datetime.strptime('08:00', '%H:%M')
-        hora_fin = datetime.strptime('17:00', '%H:%M')
-        
-        while hora_actual < hora_fin:
-            hora_str = hora_actual.strftime('%H:%M')
-            # Si el horario no está ocupado, agregarlo como disponible
-            if hora_str not in [h.strftime('%H:%M') for h in citas_ocupadas]:
-                horarios_disponibles.append(hora_str)
-            hora_actual += timedelta(minutes=30)  # Incrementar 30 minutos
+        try:
+            # Decodificar JSON del request
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError('se esperaba un objeto JSON')
+            duracion, paso = validar_duracion_paso(
+                int(data.get('duracion') or 30),
+                int(data.get('paso') or getattr(settings, 'DISPONIBILIDAD_PASO', 30)),
+                getattr(settings, 'DISPONIBILIDAD_MINUTOS_MAX', 240),
+            )
+            
+            # CONSULTA MASIVA: varios médicos y/o varios días en una sola llamada
+            if 'medico_ids' in data:
+                medico_ids = [int(m) for m in data.get('medico_ids') or []]
+                if data.get('fechas'):
+                    fechas = [parsear_fecha(f) for f in data['fechas']]
+                else:
+                    fechas = rango_fechas(
+                        parsear_fecha(data.get('fecha_inicio')),
+                        int(data.get('dias', 7)),
+                    )
+                
+                max_dias = getattr(settings, 'DISPONIBILIDAD_MAX_DIAS', 62)
+                if len(fechas) > max_dias:
+                    return JsonResponse({'error': f'Máximo {max_dias} días por consulta'}, status=400)
+                
+                disponibilidad = calcular_disponibilidad(medico_ids, fechas, duracion, paso)
+                return JsonResponse({
+                    'disponibilidad': {str(m): dias for m, dias in disponibilidad.items()}
+                })
+            
+            # CONSULTA SIMPLE: un médico en una fecha (formato original)
+            medico_id = int(data.get('medico_id'))
+            fecha = parsear_fecha(data.get('fecha'))
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'error': f'Parámetros inválidos: {e}'}, status=400)
         
-        return JsonResponse({'horarios': horarios_disponibles})
+        disponibilidad = calcular_disponibilidad([medico_id], [fecha], duracion, paso)
+        return JsonResponse({'horarios': disponibilidad[medico_id][fecha.isoformat()]})
     
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
+@login_required
+def api_primeros_disponibles(request):
+    """
+    API: Primeros horarios libres de todos los médicos en un rango de fechas
+    
+    PROPÓSITO:
+    - Responder "primer horario libre de cualquier dermatólogo en 14 días"
+      con UNA llamada en lugar de cientos a api_citas_disponibles
+    - Cargar todas las citas activas del rango en una sola consulta
+    - Usar bitmaps de ocupación por médico/día (disponibilidad.py)
+    
+    PARÁMETROS GET:
+    - fecha_inicio: YYYY-MM-DD (por defecto hoy)
+    - dias: Días a revisar (por defecto 14) o fecha_fin: YYYY-MM-DD
+    - especialidad: ID o nombre de especialidad (opcional)
+    - duracion: Minutos de la cita (por defecto 30)
+    - limite: Máximo de resultados (por defecto 10)
+    """
+    
+    # VERIFICAR PERMISOS: Solo quienes pueden agendar
+    if not (request.user.is_admin or request.user.is_medico):
+        return JsonResponse({'error': 'No tiene permisos'}, status=403)
+    
+    try:
+        hoy = date.today()
+        fecha_inicio = parsear_fecha(request.GET.get('fecha_inicio') or hoy)
+        if request.GET.get('fecha_fin'):
+            fecha_fin = parsear_fecha(request.GET['fecha_fin'])
+        else:
+            fecha_fin = fecha_inicio + timedelta(days=int(request.GET.get('dias', 14)) - 1)
+        duracion, paso = validar_duracion_paso(
+            int(request.GET.get('duracion', 30)),
+            getattr(settings, 'DISPONIBILIDAD_PASO', 30),
+            getattr(settings, 'DISPONIBILIDAD_MINUTOS_MAX', 240),
+        )
+        limite = int(request.GET.get('limite', 10))
+        if not 1 <= limite <= 100:
+            raise ValueError('limite debe estar entre 1 y 100')
+    except ValueError as e:
+        return JsonResponse({'error': f'Parámetros inválidos: {e}'}, status=400)
+    
+    max_dias = getattr(settings, 'DISPONIBILIDAD_MAX_DIAS', 62)
+    if fecha_fin < fecha_inicio or (fecha_fin - fecha_inicio).days + 1 > max_dias:
+        return JsonResponse({'error': f'Rango inválido (máximo {max_dias} días)'}, status=400)
+    
+    # No ofrecer horarios de hoy que ya pasaron
+    ahora = datetime.now()
+    resultados = primeros_disponibles(
+        fecha_inicio,
+        fecha_fin,
+        especialidad=request.GET.get('especialidad'),
+        duracion=duracion,
+        paso=paso,
+        limite=limite,
+        desde=(hoy, ahora.hour * 60 + ahora.minute),
+    )
+    
+    return JsonResponse({'resultados': resultados})
+
+@login_required
+def api_agendar_lote(request):
+    """
+    API: Agenda varias citas de una vez (serie recurrente o lista)
+
+    PROPÓSITO:
+    - Planes de tratamiento (ej: fototerapia semanal por 12 semanas) en una
+      sola petición en lugar de 12 envíos de agendar_cita_view
+    - Validar todo el lote contra las citas existentes con una consulta e
+      insertar las válidas con executemany (reservas.agendar_lote)
+    - Un correo resumen por paciente y por médico
+
+    FORMATOS DE PETICIÓN (JSON, POST):
+    - Serie: {"serie": {"paciente_id": 9, "medico_id": 6, "fecha_inicio": "2025-10-06",
+              "hora": "09:00", "veces": 12, "frecuencia": "semanal", "intervalo": 1,
+              "duracion": 30, "motivo": "Fototerapia"}}
+    - Lista: {"citas": [{"paciente_id": 9, "medico_id": 6, "fecha": "2025-10-06",
+              "hora": "09:00", "duracion": 30, "motivo": "..."}, ...]}
+    - Opcional: "simular": true → solo validar
+
+    RESPUESTA: {"creadas": [{id, fecha, hora, ...}], "rechazadas": [{fila, motivo}]}
+    """
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    if not (request.user.is_admin or request.user.is_medico):
+        return JsonResponse({'error': 'No tiene permisos'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        # RESTRICCIÓN: Un médico solo agenda sus propias citas
+        forzar_medico = {'medico_id': request.user.id} if request.user.is_medico else {}
+        if 'serie' in data:
+            solicitudes = generar_serie(**{**data['serie'], **forzar_medico})
+        else:
+            solicitudes = [
+                SolicitudCita(n, **{**cita, **forzar_medico})
+                for n, cita in enumerate(data['citas'], start=1)
+            ]
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'error': f'Datos inválidos: {e}'}, status=400)
+
+    maximo = getattr(settings, 'CITAS_LOTE_MAX', 200)
+    if len(solicitudes) > maximo:
+        return JsonResponse({'error': f'Máximo {maximo} citas por lote'}, status=400)
+
+    resultado = agendar_lote(solicitudes, simular=bool(data.get('simular')))
+    creadas = resultado['creadas']
+    if creadas:
+        notificar_lote(creadas)
+        # Un mes del calendario por (médico, paciente, mes), sin repetir
+        for medico_id, paciente_id, fecha in {
+            (c.medico_id, c.paciente_id, c.fecha.replace(day=1)) for c in creadas
+        }:
+            invalidar_cita(medico_id, paciente_id, fecha)
+        for cita in creadas:
+            publicar_cita('creada', cita)
+
+    return JsonResponse({
+        'creadas': [{
+            'id': c.id,
+            'fecha': str(c.fecha),
+            'hora': c.hora.strftime('%H:%M'),
+            'duracion': c.duracion,
+            'medico_id': c.medico_id,
+            'paciente_id': c.paciente_id,
+        } for c in creadas],
+        'rechazadas': resultado['rechazadas'],
+    })
+
+@login_required
+def api_buscar_pacientes(request):
+    """
+    API: Búsqueda de pacientes mientras se escribe (agendar_cita.html)
+
+    PROPÓSITO:
+    - Reemplazar el <select> con TODOS los pacientes activos
+    - Responder en milisegundos desde el índice en memoria (usuarios.py)
+
+    PARÁMETROS GET:
+    - q: Prefijo de nombre, apellido, email o teléfono
+    - limite: Máximo de resultados (por defecto 10, máximo 50)
+    """
+
+    if not (request.user.is_admin or request.user.is_medico):
+        return JsonResponse({'error': 'No tiene permisos'}, status=403)
+
+    try:
+        limite = min(int(request.GET.get('limite', 10)), 50)
+    except ValueError:
+        return JsonResponse({'error': 'Límite inválido'}, status=400)
+
+    return JsonResponse({
+        'resultados': indice_pacientes.buscar(request.GET.get('q', ''), limite),
+    })
+
+@login_required
+def api_calendario(request):
+    """
+    API: Citas del calendario en JSON, completas o solo los cambios
+
+    PROPÓSITO:
+    - Cambiar de mes sin recargar calendar.html
+    - Sincronizar el calendario abierto pidiendo solo lo que cambió
+      desde el último token (citas.updated_at)
+
+    PARÁMETROS GET:
+    - mes, año: Mes a consultar (por defecto el actual)
+    - since: Token recibido en la respuesta anterior (opcional)
+
+    RESPUESTA:
+    - completo: True si 'citas' es el mes entero (sin 'since')
+    - citas: Citas activas nuevas o modificadas (reemplazar por id)
+    - eliminadas: IDs canceladas/completadas que hay que quitar
+    - token: Enviar como 'since' en la próxima consulta
+    """
+
+    try:
+        mes = int(request.GET.get('mes', datetime.now().month))
+        año = int(request.GET.get('año', datetime.now().year))
+        date(año, mes, 1)
+    except ValueError as e:
+        return JsonResponse({'error': f'Parámetros inválidos: {e}'}, status=400)
+
+    since = request.GET.get('since')
+    if not since:
+        # MES COMPLETO: mismo JSON cacheado que usa calendario_view
+        def construir_citas():
+            citas, _, token = citas_mes(request.user, año, mes)
+            return citas, token
+
+        payload = obtener_mes(request.user, año, mes, construir_citas)
+        contenido = '{"completo": true, "token": %s, "eliminadas": [], "citas": %s}' % (
+            json.dumps(payload['token']), payload['citas'])
+        return HttpResponse(contenido, content_type='application/json')
+
+    desde = decodificar_token(since)
+    if desde is None:
+        return JsonResponse({'error': 'Token since inválido'}, status=400)
+
+    # CAMBIOS: solo citas del mes con updated_at posterior al token
+    citas, eliminadas, token = citas_mes(request.user, año, mes, desde=desde)
+    return JsonResponse({
+        'completo': False,
+        'token': token,
+        'citas': citas,
+        'eliminadas': eliminadas,
+    })
+
+@login_required
+def api_analitica(request):
+    """
+    API: Utilización de médicos, cancelaciones, inasistencias y horas pico (solo admin)
+
+    PROPÓSITO:
+    - Mapa de calor de utilización (minutos agendados / minutos de horario)
+      por médico × día de semana × hora
+    - Calculado con NumPy sobre UNA consulta en streaming (analitica.py)
+
+    PARÁMETROS GET:
+    - desde, hasta: YYYY-MM-DD (por defecto los últimos 90 días)
+    - medico: ID opcional para analizar un solo médico
+    - formato: json (por defecto) o csv
+    - tipo (solo csv): medicos (resumen por médico) o mapa (médico × día × hora)
+    """
+
+    if not request.user.is_admin:
+        return JsonResponse({'error': 'No tiene permisos'}, status=403)
+    if not numpy_disponible():
+        return JsonResponse({'error': 'Analítica no disponible: instale numpy'}, status=503)
+
+    try:
+        desde, hasta = leer_rango(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    max_dias = getattr(settings, 'ANALITICA_MAX_DIAS', 1100)
+    if (hasta - desde).days + 1 > max_dias:
+        return JsonResponse({'error': f'El rango no puede superar {max_dias} días'}, status=400)
+
+    medico = request.GET.get('medico', '')
+    resultado = analizar(desde, hasta, [int(medico)] if medico.isdigit() else None)
+
+    if request.GET.get('formato') == 'csv':
+        tipo = request.GET.get('tipo', 'medicos')
+        contenido = csv_mapa(resultado) if tipo == 'mapa' else csv_medicos(resultado)
+        response = HttpResponse(contenido, content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="analitica_{tipo}.csv"'
+        return response
+    return JsonResponse(resultado)
+
+async def eventos_citas_view(request):
+    """
+    VISTA ASÍNCRONA: Flujo Server-Sent Events con los cambios de citas
+
+    PROPÓSITO:
+    - Avisar al instante a médicos (sus citas) y admins (todas) cuando se
+      agenda, cancela o cambia de estado una cita (eventos.py)
+    - calendar.html y home.html reaccionan sin recargar a mano
+
+    IMPORTANTE:
+    - Requiere servidor ASGI (uvicorn/daphne con clinica_project.asgi);
+      bajo WSGI cada conexión ocuparía un worker completo
+    - Envía un comentario cada EVENTOS_KEEPALIVE segundos para que proxies
+      y navegadores no cierren la conexión
+    - Cierra el flujo a los EVENTOS_DURACION_MAX segundos: Django 4.2 no
+      detecta la desconexión del cliente, así una pestaña cerrada no deja
+      un suscriptor vivo para siempre (EventSource reconecta solo)
+    """
+
+    # request.user consulta sesión/BD: evaluarlo fuera del event loop
+    usuario = await sync_to_async(
+        lambda: request.user if request.user.is_authenticated else None
+    )()
+    if usuario is None:
+        return JsonResponse({'error': 'No autenticado'}, status=401)
+
+    canales = canales_usuario(usuario)
+    if not canales:
+        return JsonResponse({'error': 'No tiene permisos'}, status=403)
+
+    espera = getattr(settings, 'EVENTOS_KEEPALIVE', 15)
+    duracion_max = getattr(settings, 'EVENTOS_DURACION_MAX', 300)
+
+    async def flujo():
+        eventos = obtener_broker().escuchar(canales)
+        siguiente = None
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + duracion_max
+        try:
+            yield 'retry: 5000\n\n'
+            while loop.time() < limite:
+                # La misma tarea sigue esperando entre keepalives (no se cancela)
+                if siguiente is None:
+                    siguiente = asyncio.ensure_future(eventos.__anext__())
+                listos, _ = await asyncio.wait({siguiente}, timeout=espera)
+                if not listos:
+                    yield ': keepalive\n\n'
+                    continue
+                evento, siguiente = siguiente.result(), None
+                yield f"event: cita\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            if siguiente is not None:
+                siguiente.cancel()
+                # Esperar a que la tarea termine de desenrollarse: mientras siga
+                # dentro de __anext__ el generador está "corriendo" y aclose() falla
+                await asyncio.gather(siguiente, return_exceptions=True)
+            await eventos.aclose()
+
+    response = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: no acumular el flujo
+    return response
+
+def metricas_view(request):
+    """
+    VISTA: Métricas en formato de texto de Prometheus (metricas.py)
+
+    ACCESO (sin login, para el scraper):
+    - Header "Authorization: Bearer <METRICAS_TOKEN>" si está configurado
+    - IPs en METRICAS_IPS solo con METRICAS_SIN_PROXY = True: detrás de nginx
+      REMOTE_ADDR es siempre la IP del proxy (127.0.0.1)
+    """
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    autorizacion = request.META.get('HTTP_AUTHORIZATION', '')
+    permitido = bool(token) and hmac.compare_digest(
+        autorizacion.encode(), f'Bearer {token}'.encode()
+    )
+    if not permitido and getattr(settings, 'METRICAS_SIN_PROXY', False):
+        permitido = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICAS_IPS', [])
+    if not permitido:
+        return HttpResponseForbidden('No autorizado')
+
+    # Profundidad de la cola de correos: se consulta al momento del scrape
+    # (en la réplica si hay una; unos segundos de atraso no importan aquí)
+    with cursor_lectura() as cursor:
+        cursor.execute("""
+            SELECT estado, COUNT(*) FROM correos_pendientes
+            WHERE estado IN ('PENDIENTE', 'ENVIANDO')
+            GROUP BY estado
+        """)
+        cola = dict(cursor.fetchall())
+
+    texto = exponer({
+        'clinica_correos_en_cola': (
+            'Correos pendientes o en envío en correos_pendientes',
+            [({'estado': estado}, cola.get(estado, 0)) for estado in ('PENDIENTE', 'ENVIANDO')],
+        ),
+    })
+    return HttpResponse(texto, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def actualizar_estado_cita(request, cita_id):
     """
@@ -710,6 +1090,9 @@ def actualizar_estado_cita(request, cita_id):
             # ACTUALIZAR ESTADO usando stored procedure
             with connection.cursor() as cursor:
                 cursor.callproc('sp_actualizar_estado_cita', [cita_id, nuevo_estado])
+            invalidar_cita(cita.medico_id, cita.paciente_id, cita.fecha)
+            cita.estado = nuevo_estado
+            publicar_cita('estado', cita)
             
             messages.success(request, f'Cita marcada como {nuevo_estado}')
         except Exception as e:
@@ -755,30 +1138,23 @@ def editar_usuario_view(request, user_id):
             # Guardar nueva contraseña (el backend la hasheará automáticamente)
             usuario.password = nueva_password
             
-            # ENVIAR CORREO CON NUEVA CONTRASEÑA
-            try:
-                subject = 'Cambio de Contraseña - Clínica Dermatológica'
-                message = f"""
-                Estimado/a {usuario.get_full_name()},
-                
-                Su contraseña ha sido actualizada por el administrador.
-                
-                Nueva contraseña: {nueva_password}
-                
-                Por favor, guarde esta información de forma segura.
-                
-                Atentamente,
-                Clínica Dermatológica
-                """
-                send_mail(
-                    subject,
-                    message,
-                    settings.EMAIL_HOST_USER,
-                    [usuario.email],
-                    fail_silently=False,
-                )
+            # ENCOLAR CORREO CON NUEVA CONTRASEÑA
+            subject = 'Cambio de Contraseña - Clínica Dermatológica'
+            message = f"""
+            Estimado/a {usuario.get_full_name()},
+            
+            Su contraseña ha sido actualizada por el administrador.
+            
+            Nueva contraseña: {nueva_password}
+            
+            Por favor, guarde esta información de forma segura.
+            
+            Atentamente,
+            Clínica Dermatológica
+            """
+            if encolar_correo(subject, message, [usuario.email]):
                 messages.success(request, 'Contraseña actualizada y correo enviado')
-            except:
+            else:
                 messages.warning(request, 'Contraseña actualizada pero no se pudo enviar el correo')
         
         # GUARDAR CAMBIOS DIRECTAMENTE EN LA BASE DE DATOS
@@ -806,6 +1182,10 @@ def editar_usuario_view(request, user_id):
                     usuario.phone, usuario.address, user_id
                 ])
         
+        invalidar_usuario(user_id)  # La próxima carga de request.user lee la BD
+        if usuario.role == 3:
+            invalidar_indice_pacientes()  # Nombre/email/teléfono de la búsqueda
+        
         messages.success(request, 'Usuario actualizado exitosamente')
         return redirect('gestionar_usuarios')
     
@@ -845,7 +1225,7 @@ def logout_view(request):
 """
 === RESUMEN GENERAL DEL ARCHIVO views.py ===
 
-FUNCIONES DE CORREO:
+FUNCIONES DE CORREO (encolan en correos_pendientes, ver correos.py):
 - enviar_correo_registro(): Envía credenciales a nuevos usuarios
 - enviar_correo_cita(): Notifica cita nueva a paciente y médico
 
@@ -855,22 +1235,31 @@ VISTAS DE AUTENTICACIÓN:
 - registro_view(): Solo admin puede crear usuarios
 
 VISTAS PRINCIPALES:
-- home_view(): Dashboard personalizado por rol
+- home_view(): Dashboard por rol sin N+1 y en caché (dashboard.py)
 - calendario_view(): Vista de calendario con filtros por rol
 - agendar_cita_view(): Crear nuevas citas (admin/médicos)
 
 GESTIÓN DE USUARIOS (solo admin):
-- gestionar_usuarios_view(): Lista todos los usuarios
+- gestionar_usuarios_view(): Directorio con búsqueda, filtro por rol y paginación (usuarios.py)
 - editar_usuario_view(): Modificar datos de usuarios
 - eliminar_usuario_view(): Eliminar usuarios del sistema
 
 GESTIÓN DE CITAS:
-- historial_citas_view(): Historial filtrado por rol
+- historial_citas_view(): Historial filtrado por rol, paginado por clave (historial.py)
+- exportar_citas_view(): Exportación CSV/JSONL en streaming (exportacion.py)
 - cancelar_cita_view(): Cancelar citas existentes
+- reportes_view(): Citas por médico/especialidad/día/mes desde el resumen (reportes.py)
 - actualizar_estado_cita(): Cambiar estado de citas
 
 API/AJAX:
-- api_citas_disponibles(): Endpoint para obtener horarios libres
+- api_citas_disponibles(): Horarios libres de varios médicos × días (disponibilidad.py)
+- api_primeros_disponibles(): Primeros huecos por especialidad en un rango de fechas
+- api_agendar_lote(): Series recurrentes o listas de citas en una transacción (reservas.py)
+- api_buscar_pacientes(): Pacientes por prefijo para el formulario de citas (usuarios.py)
+- api_calendario(): JSON del calendario, mes completo o cambios desde un token
+- api_analitica(): Utilización, cancelaciones e inasistencias con NumPy (analitica.py)
+- eventos_citas_view(): Server-Sent Events de citas para médicos/admin (ASGI)
+- metricas_view(): Texto para Prometheus (latencias, logins, correos, conflictos)
 
 CARACTERÍSTICAS IMPORTANTES:
 1. Seguridad: Verificación de permisos en cada vista
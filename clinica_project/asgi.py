@@ -5,12 +5,32 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Requerido por los eventos en vivo (/api/eventos-citas/, Server-Sent Events):
+    CLINICA_DB_POOL=10 uvicorn clinica_project.asgi:application --workers 1
+Con más de un worker usar EVENTOS_BROKER = BrokerRedis (ver settings.py).
+
+CONEXIONES A MYSQL: Con ASGI el código síncrono corre en hilos distintos por
+request y las conexiones persistentes (CONN_MAX_AGE > 0) se acumulan una por
+hilo. Usar el pool (CLINICA_DB_POOL, clinica_app/conexiones.py); aquí se
+rechaza una configuración con conexiones persistentes.
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinica_project.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402 (después de configurar Django)
+
+for _alias, _bd in settings.DATABASES.items():
+    if _bd.get('CONN_MAX_AGE'):
+        raise ImproperlyConfigured(
+            f"DATABASES['{_alias}'] tiene CONN_MAX_AGE={_bd['CONN_MAX_AGE']}: con ASGI las "
+            "conexiones persistentes se acumulan por hilo. Quitar CLINICA_DB_CONN_MAX_AGE "
+            "y usar CLINICA_DB_POOL"
+        )
@@ -14,6 +14,7 @@ PROPÓSITO:
 IMPORTANTE: Este archivo contiene configuraciones críticas del sistema
 """
 
+import importlib.util
 import os
 from pathlib import Path
 
@@ -67,6 +68,16 @@ NOTA IMPORTANTE sobre django.contrib.admin:
 # ========== MIDDLEWARE (Procesamientos intermedios) ==========
 
 MIDDLEWARE = [
+    # INSTRUMENTACIÓN: Consultas SQL y tiempos por request (solo si INSTRUMENTACION_ACTIVA)
+    # Va primero para medir también sesión, autenticación y el resto de middlewares
+    'clinica_app.instrumentacion.InstrumentacionMiddleware',
+    
+    # MÉTRICAS: Latencia y consultas por nombre de URL para /metrics (siempre activo)
+    'clinica_app.metricas.MetricasMiddleware',
+    
+    # RÉPLICA: Lecturas de GET a REPLICA_ALIAS salvo tras una escritura (solo si está en DATABASES)
+    'clinica_app.replicas.ReplicaMiddleware',
+    
     # SEGURIDAD: Añade headers de seguridad HTTP
     'django.middleware.security.SecurityMiddleware',
     
@@ -143,7 +154,16 @@ DATABASES = {
         'OPTIONS': {
             'charset': 'utf8mb4',               # Soporte completo UTF-8 (emojis, acentos)
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",  # Modo estricto SQL
-        }
+        },
+        
+        # CONEXIONES PERSISTENTES (opcional, SOLO con WSGI síncrono): con
+        # CLINICA_DB_CONN_MAX_AGE=300 cada worker reutiliza su conexión hasta
+        # esos segundos; un ping al primer uso de cada request detecta
+        # conexiones cortadas por MySQL (wait_timeout) y reconecta.
+        # Por defecto 0: con ASGI (asgi.py) cada request puede correr en otro
+        # hilo y las conexiones por hilo se acumulan; ahí se usa CLINICA_DB_POOL
+        'CONN_MAX_AGE': int(os.environ.get('CLINICA_DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -155,6 +175,55 @@ IMPORTANTE sobre la base de datos:
 - Django solo lee/escribe, no modifica estructura
 """
 
+# ========== RÉPLICA DE LECTURA (clinica_app/replicas.py) ==========
+
+# RÉPLICA OPCIONAL: Se activa definiendo CLINICA_DB_REPLICA_HOST (misma base,
+# usuario y opciones que 'default'). Sin ella todo va al primario.
+# MIRROR: en los tests de Django la réplica es la misma base que 'default'
+if os.environ.get('CLINICA_DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['CLINICA_DB_REPLICA_HOST'],
+        'PORT': os.environ.get('CLINICA_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['clinica_app.replicas.RouterReplica']
+
+# ALIAS: Nombre en DATABASES de la réplica
+REPLICA_ALIAS = 'replica'
+
+# PEGAJOSO: Segundos que un navegador lee del primario después de escribir
+# (debe superar el retraso típico de replicación)
+REPLICA_PEGAJOSO = 15
+
+# COOKIE: Marca "escribió hace poco" (sin datos; expira sola)
+REPLICA_COOKIE = 'clinica_primario'
+
+# ========== POOL DE CONEXIONES (clinica_app/conexiones.py) ==========
+
+# TAMAÑO: Conexiones MySQL máximas por proceso. 0 = sin pool (una conexión por
+# request, o persistente por hilo con CLINICA_DB_CONN_MAX_AGE en WSGI síncrono).
+# Con ASGI (uvicorn, requerido por los eventos en vivo) o workers con hilos
+# usar CLINICA_DB_POOL=<hilos por proceso>; el total en MySQL es
+# TAMAÑO × procesos (× 2 con réplica)
+DB_POOL_TAMANO = int(os.environ.get('CLINICA_DB_POOL', '0'))
+
+# ESPERA: Segundos que un request espera una conexión libre antes de fallar
+DB_POOL_ESPERA = 10
+
+# VERIFICAR: Hacer ping a una conexión que estuvo libre más de estos segundos
+DB_POOL_VERIFICAR = 5
+
+# VIDA: Segundos tras los que una conexión se cierra y se abre otra
+DB_POOL_VIDA = 600
+
+if DB_POOL_TAMANO:
+    for _bd in DATABASES.values():
+        # Django "cierra" al final de cada request = devolver al pool
+        _bd['ENGINE'] = 'clinica_app.pool_mysql'
+        _bd['CONN_MAX_AGE'] = 0
+
 # ========== SISTEMA DE AUTENTICACIÓN PERSONALIZADO ==========
 
 AUTHENTICATION_BACKENDS = [
@@ -170,6 +239,33 @@ EXPLICACIÓN del backend personalizado:
 - Maneja el sistema de roles personalizado (1=admin, 2=médico, 3=paciente)
 """
 
+# ========== CACHÉ DE request.user (clinica_app/backends.py) ==========
+
+# TTL: Segundos que un usuario cargado se reutiliza sin consultar la BD (0 = sin caché)
+USUARIOS_CACHE_TTL = 60
+
+# TAMAÑO: Máximo de usuarios en memoria por proceso (LRU)
+USUARIOS_CACHE_MAX = 1000
+
+# TTL LOCAL: Tope del TTL sin caché compartida. Cada worker tiene su copia y
+# no se entera de las invalidaciones de los otros: un usuario desactivado o
+# con otro rol sigue vigente en otros procesos hasta estos segundos
+USUARIOS_CACHE_TTL_LOCAL = 5
+
+# CACHÉ COMPARTIDA: Alias de CACHES (Redis/Memcached) compartida entre workers.
+# Con alias se usa SOLO esa caché (invalidación inmediata en todos los procesos)
+# None = solo caché local por proceso con USUARIOS_CACHE_TTL_LOCAL
+USUARIOS_CACHE_ALIAS = None
+
+# ========== ESCRITURA DE last_login EN EL LOGIN ==========
+
+# EXACTO: True = UPDATE inmediato en cada login
+#         False = acumular y escribir en bloque (menos escrituras en horas pico)
+LAST_LOGIN_EXACTO = True
+
+# INTERVALO: Segundos entre escrituras en bloque cuando LAST_LOGIN_EXACTO = False
+LAST_LOGIN_FLUSH = 30
+
 # ========== VALIDADORES DE CONTRASEÑA ==========
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -197,6 +293,35 @@ Como usamos SP para login, no afectan la autenticación actual
 Útiles si implementas cambio de contraseña desde la interfaz
 """
 
+# ========== HASH DE CONTRASEÑAS (clinica_app/hashers.py) ==========
+
+# POLÍTICA: 'pbkdf2', 'scrypt', 'argon2' o 'auto' (argon2 si argon2-cffi está instalado)
+HASH_POLITICA = os.environ.get('CLINICA_HASH_POLITICA', 'auto')
+
+# COSTO DE CADA ALGORITMO: subirlo = más seguro pero más CPU por login
+# Medir con: python manage.py bench_hash
+HASH_PBKDF2_ITERACIONES = 600000   # Default de Django 4.2
+HASH_SCRYPT_N = 2 ** 14            # Potencia de 2
+HASH_ARGON2_TIEMPO = 2
+HASH_ARGON2_MEMORIA_KB = 102400
+HASH_ARGON2_PARALELISMO = 8
+
+HASHERS_POR_POLITICA = {
+    'argon2': 'clinica_app.hashers.ClinicaArgon2Hasher',
+    'scrypt': 'clinica_app.hashers.ClinicaScryptHasher',
+    'pbkdf2': 'clinica_app.hashers.ClinicaPBKDF2Hasher',
+}
+
+if HASH_POLITICA == 'auto':
+    HASH_POLITICA = 'argon2' if importlib.util.find_spec('argon2') else 'pbkdf2'
+
+# El primero genera los hashes nuevos; los demás solo verifican hashes existentes
+# y SPAuthBackend los migra al preferido en el siguiente login
+PASSWORD_HASHERS = [HASHERS_POR_POLITICA[HASH_POLITICA]] + [
+    ruta for politica, ruta in HASHERS_POR_POLITICA.items() if politica != HASH_POLITICA
+]
+
+
 # ========== CONFIGURACIÓN REGIONAL ==========
 
 # IDIOMA: Español de Guatemala
@@ -252,7 +377,14 @@ LOGOUT_REDIRECT_URL = 'login'
 # ========== CONFIGURACIÓN DE CORREO ELECTRÓNICO ==========
 
 # BACKEND: Usar SMTP real para enviar correos
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Se puede cambiar sin tocar el código con la variable de entorno
+# CLINICA_EMAIL_BACKEND (ej: django.core.mail.backends.filebased.EmailBackend)
+EMAIL_BACKEND = os.environ.get(
+    'CLINICA_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'
+)
+
+# DIRECTORIO PARA EL BACKEND DE ARCHIVOS (pruebas sin red)
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'correos_enviados')
 
 # CONFIGURACIÓN SMTP: Gmail como proveedor
 EMAIL_HOST = 'smtp.gmail.com'           # Servidor SMTP de Gmail
@@ -278,6 +410,153 @@ USOS del sistema de correo:
 - Enviar nuevas contraseñas cuando admin las cambia
 """
 
+# ========== DISPONIBILIDAD DE HORARIOS (clinica_app/disponibilidad.py) ==========
+
+# PASO: Minutos entre los horarios ofrecidos al agendar
+DISPONIBILIDAD_PASO = 30
+
+# LÍMITE: Días máximos por consulta masiva a api_citas_disponibles
+DISPONIBILIDAD_MAX_DIAS = 62
+
+# MINUTOS MÁXIMOS: Tope de 'duracion' y 'paso' que acepta la API (mínimo 5)
+DISPONIBILIDAD_MINUTOS_MAX = 240
+
+# ========== HISTORIAL DE CITAS (clinica_app/historial.py) ==========
+
+# PÁGINA: Citas por página en historial_citas_view
+HISTORIAL_POR_PAGINA = 50
+
+# ========== INSTRUMENTACIÓN POR REQUEST (clinica_app/instrumentacion.py) ==========
+
+# ACTIVA: Server-Timing + log JSON con consultas y tiempos de cada request
+INSTRUMENTACION_ACTIVA = os.environ.get('CLINICA_INSTRUMENTACION', '0') == '1'
+
+# N+1: Repeticiones de la misma forma de SQL en un request para marcarlo
+INSTRUMENTACION_N_MAS_1 = 5
+
+# LOGS: La línea JSON de cada request va a la consola (logger clinica_app.instrumentacion)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'clinica_app.instrumentacion': {
+            'handlers': ['consola'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# ========== MÉTRICAS PROMETHEUS (clinica_app/metricas.py) ==========
+
+# DIR: Carpeta donde cada proceso (workers de gunicorn, procesar_correos) vuelca
+# sus contadores; /metrics suma todos. None = solo el proceso que atiende el scrape
+METRICAS_DIR = os.environ.get('CLINICA_METRICAS_DIR') or None
+
+# VOLCADO: Segundos mínimos entre escrituras del archivo de cada proceso
+METRICAS_VOLCADO = 1.0
+
+# TOKEN: Acceso a /metrics con "Authorization: Bearer <token>". Es la forma de
+# acceso detrás de un proxy (nginx, balanceador)
+METRICAS_TOKEN = os.environ.get('CLINICA_METRICAS_TOKEN', '')
+
+# ACCESO POR IP: IPs que pueden leer /metrics sin token, SOLO si
+# METRICAS_SIN_PROXY = True. Detrás de un proxy TODAS las peticiones llegan con
+# REMOTE_ADDR = 127.0.0.1 (la IP del proxy): confiar en loopback dejaría
+# /metrics público (y cada visita hace un COUNT sobre correos_pendientes)
+METRICAS_IPS = ['127.0.0.1', '::1']
+
+# SIN PROXY: True solo si gunicorn/uvicorn recibe las conexiones directamente
+# (desarrollo o scraper en la misma máquina sin nginx delante)
+METRICAS_SIN_PROXY = os.environ.get('CLINICA_METRICAS_SIN_PROXY', '') == '1'
+
+# ========== DIRECTORIO DE USUARIOS (clinica_app/usuarios.py) ==========
+
+# PÁGINA: Usuarios por página en gestionar_usuarios_view
+USUARIOS_POR_PAGINA = 50
+
+# ÍNDICE DE PACIENTES: Búsqueda en memoria de api_buscar_pacientes
+# ALIAS: Caché donde se guarda la versión del índice (compartida = todos los
+#        workers se enteran al crear/editar/eliminar un usuario)
+PACIENTES_INDICE_ALIAS = 'default'
+
+# TTL: Segundos máximos antes de reconstruir el índice desde la BD
+PACIENTES_INDICE_TTL = 300
+
+# ========== CACHÉ DEL CALENDARIO (clinica_app/cache_calendario.py) ==========
+
+# ALIAS: Caché de CACHES donde se guarda el JSON de cada mes
+# Con varios workers usar una caché compartida (Redis/Memcached) para que
+# la invalidación al agendar/cancelar llegue a todos los procesos
+CALENDARIO_CACHE_ALIAS = 'default'
+
+# TTL: Segundos máximos de un mes en caché (cubre cambios de nombre de usuarios)
+CALENDARIO_CACHE_TTL = 300
+
+# SINCRONIZACIÓN: Segundos entre consultas de cambios de calendar.html (0 = desactivar)
+CALENDARIO_FEED_INTERVALO = 30
+
+# MARGEN: Segundos que se repiten en cada consulta 'since' (updated_at es por segundo)
+CALENDARIO_FEED_MARGEN = 2
+
+# ========== DASHBOARD DE INICIO (clinica_app/dashboard.py) ==========
+
+# ALIAS: Caché donde se guarda el dashboard de cada usuario (compartida con varios workers)
+DASHBOARD_CACHE_ALIAS = 'default'
+
+# TTL: Segundos máximos de vida (agendar/cancelar/cambiar estado invalida antes)
+DASHBOARD_CACHE_TTL = 60
+
+# ========== RESUMEN DE CITAS PARA REPORTES (clinica_app/reportes.py) ==========
+
+# MARGEN: Segundos que cada actualización incremental vuelve a revisar antes
+# de la marca de agua (transacciones que confirman con un updated_at anterior)
+RESUMEN_MARGEN = 5
+
+# ========== ANALÍTICA DE MÉDICOS (clinica_app/analitica.py) ==========
+
+# MAX_DIAS: Rango máximo de /api/analitica/ (requiere numpy; ~3 años de citas
+# caben en unos cientos de MB de arreglos)
+ANALITICA_MAX_DIAS = 1100
+
+# ========== EVENTOS EN TIEMPO REAL (clinica_app/eventos.py) ==========
+
+# BROKER: Dónde se publican los eventos de citas
+# - 'clinica_app.eventos.BrokerMemoria': un solo proceso ASGI
+# - 'clinica_app.eventos.BrokerRedis': varios workers (pip install redis)
+EVENTOS_BROKER = os.environ.get('CLINICA_EVENTOS_BROKER', 'clinica_app.eventos.BrokerMemoria')
+EVENTOS_REDIS_URL = os.environ.get('CLINICA_REDIS_URL', 'redis://localhost:6379/0')
+
+# KEEPALIVE: Segundos entre comentarios vacíos del flujo SSE
+EVENTOS_KEEPALIVE = 15
+
+# DURACIÓN: Segundos máximos de cada conexión SSE (el navegador reconecta)
+EVENTOS_DURACION_MAX = 300
+
+# ========== RESERVAS EN LOTE (clinica_app/reservas.py) ==========
+
+# LÍMITE: Citas máximas por petición a api_agendar_lote
+CITAS_LOTE_MAX = 200
+
+# ========== COLA DE CORREOS (clinica_app/correos.py) ==========
+
+# ENVÍO ASÍNCRONO: Las vistas solo encolan; 'manage.py procesar_correos' envía
+CORREOS_ASINCRONOS = True
+
+# LOTES: Correos enviados por cada conexión SMTP abierta
+CORREOS_LOTE = 50
+
+# REINTENTOS: Intentos máximos y backoff exponencial (segundos)
+CORREOS_MAX_INTENTOS = 5
+CORREOS_BACKOFF_BASE = 30
+CORREOS_BACKOFF_MAX = 3600
+
+# LEASE: Segundos antes de recuperar un lote de un worker caído
+CORREOS_LEASE = 300
+
 # ========== CONFIGURACIÓN DE CRISPY FORMS ==========
 
 # TEMPLATE PACK: Usar Bootstrap 4 para styling de formularios